@@ -10,17 +10,33 @@ Data can be easily output in human readable formats (e.g. csv).
 Usage: Import this module into your python script i.e.
 `import fly2py as f2p`. For uses of classes and function, see the docstrings.
 
-Dependancies: re, scipy.io, mat73, numpy, pandas, matplotlib.pyplot, itertools, networkx v3.3 (optional)
+Dependancies: re, os, sys, time, multiprocessing, scipy.io, scipy.interpolate, mat73, h5py, numpy, pandas, matplotlib.pyplot, matplotlib.animation, itertools, copy, json, hashlib, functools, inspect, collections, networkx v3.3 (optional)
 """
 
 #importing modules
 import re
+import os
+import sys
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
 import scipy.io as spio
+import scipy.interpolate as spinterp
 import mat73
+import h5py
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import itertools
+import copy
+import json
+import hashlib
+import functools
+import inspect
+from collections import OrderedDict
 #networkx can cause some problems, to avoid these networkx is optional for this program to run
 try:
     import networkx as nx
@@ -39,6 +55,46 @@ except AttributeError as e:
 
 
 
+#storage policy applied by `struct2df` when loading data (see `set_storage_policy`)
+_storage_policy = {'precision': 'float64', 'scores': 'float64', 'sex': 'object', 'processed': 'float'}
+
+#features that always stay float64 because float32 cannot resolve single frames after a few hours
+_time_features = ['timestamps', 'dt']
+
+
+def set_storage_policy(precision='float64', scores=None, sex='object', processed='float'):
+    """
+    Function that sets how `struct2df` stores the data it loads. Instances created before the policy is changed are not affected.
+    `precision` is the dtype of perframe features and trx fields, 'float64' (default) or 'float32'. Timestamps and dt are always kept as float64.
+    `scores` is the dtype of JAABA behavior scores, 'float64', 'float32' or 'float16'. It defaults to the same as `precision`.
+    `sex` is 'object' (default) or 'category'. A categorical sex column in the trx dataframes uses one byte per frame instead of a pointer to a string.
+    `processed` is 'float' (default) to store processed scores with the `scores` dtype or 'bool' to store them as thresholded booleans (score >= 0.5, NaN becomes False).
+    float32 halves and float16/bool quarter or eighth the memory of the data, and all methods work the same with any policy.
+    e.g. `set_storage_policy(precision='float32', scores='float16', sex='category', processed='bool')`
+    """
+
+    if precision not in ['float64', 'float32']:
+        raise ValueError('Incorrect precision input. Please use either "float64" or "float32".')
+    if scores == None:
+        scores = precision
+    if scores not in ['float64', 'float32', 'float16']:
+        raise ValueError('Incorrect scores input. Please use "float64", "float32" or "float16".')
+    if sex not in ['object', 'category']:
+        raise ValueError('Incorrect sex input. Please use either "object" or "category".')
+    if processed not in ['float', 'bool']:
+        raise ValueError('Incorrect processed input. Please use either "float" or "bool".')
+
+    _storage_policy.update({'precision': precision, 'scores': scores, 'sex': sex, 'processed': processed})
+
+
+def get_storage_policy():
+    """
+    Function that returns a copy of the current storage policy dictionary (see `set_storage_policy`).
+    """
+
+    return dict(_storage_policy)
+
+
 #helper functions
 def _dict2list_of_dicts(input_dict):
     """
@@ -102,1070 +158,5034 @@ def _listofdicts_clean_scalar_arrays(listofdicts):
     return output_list
 
 
+def _stack_cells(cells, precision=None):
+    """
+    Private function used in the class `struct2df` to stack the per fly arrays of a perframe or score file into one frame x fly dataframe.
+    The data is copied once into a single preallocated array instead of building a column at a time. Flies with fewer frames are padded with NaN.
+    Floating point data is stored with the `precision` dtype if it is given (see `set_storage_policy`).
+    Returns the dataframe, with the fly ids as column names, and a dictionary of the number of frames of each fly.
+    e.g. [np.array([1, 2]), np.array([3])] --> columns 1: [1, 2], 2: [3, NaN] and {1: 2, 2: 1}
+    """
 
+    arrays = [np.atleast_1d(np.asarray(i)) for i in cells]
+    lengths = {idx+1: len(i) for idx, i in enumerate(arrays)}
 
+    #integer data can only be kept as integers if no padding is needed
+    dtype = np.result_type(*arrays)
+    if not np.issubdtype(dtype, np.number):
+        dtype = object
+    elif len(set(lengths.values())) > 1 and not np.issubdtype(dtype, np.floating):
+        dtype = np.float64
 
+    if precision != None and np.issubdtype(dtype, np.floating):
+        dtype = np.dtype(precision)
 
+    if len(set(lengths.values())) > 1:
+        stacked = np.full((max(lengths.values()), len(arrays)), np.nan, dtype=dtype)
+    else:
+        stacked = np.empty((max(lengths.values()), len(arrays)), dtype=dtype)
+    for idx, i in enumerate(arrays):
+        stacked[:len(i), idx] = i
 
+    return pd.DataFrame(stacked, columns=list(lengths.keys()), copy=False), lengths
 
 
-#class for extracting matlab structure type data
-class struct2df():
+def _gaussian_smooth(hist, sigma):
+    """
+    Private function that blurs a 2D histogram with a Gaussian of standard deviation sigma (in bins) by FFT convolution.
+    The histogram is zero padded by 4 sigma so nothing wraps around the edges and the total is kept. The cost depends on the grid size only.
+    """
 
-    def __init__(self, matfile, separate_chambers=None):
-        """
-        This class takes in a .mat structure file from the Flytracker for JAABA output and extracts the data.
-        First the structure is converted to a multidimensional dictionary using the scipy.io module.
-        For mat7.3 files the mat73 module is used to convert the data. Note that this only works on trx files currently.
-        The dictionary is parsed to ether extract specific data or extract all the data depending on the type of file.
-        With trx files, queried data can be extracted or a dataframe for each fly can be exported.
-        With perframe files, the parameter of the file selected is extracted into a dataframe.
-        The optional parameter `separate_chambers` is for flytracker data with multiple arenas. Default is None.
-        To differentiate between the arenas pass a dictionary of chamber number keys and list of ids as values.
-        The key must be a string and the value must be a list of integers representing the fly id.
-        e.g. {'1':[1,2,3,4,5,6,7], 'B':[8,9,10,11,12,13,14]}
-        """
+    pad = int(np.ceil(4*sigma))
+    shape = (hist.shape[0] + 2*pad, hist.shape[1] + 2*pad)
+    padded = np.zeros(shape)
+    padded[pad:pad+hist.shape[0], pad:pad+hist.shape[1]] = hist
 
-        #structure to dictionary
-        try:
-            self.mat_dict = spio.loadmat(matfile, simplify_cells=True)
+    #the Fourier transform of a Gaussian is a Gaussian so the kernel is never built
+    fx = np.fft.fftfreq(shape[0])[:, None]
+    fy = np.fft.rfftfreq(shape[1])[None, :]
+    transfer = np.exp(-2*(np.pi*sigma)**2*(fx**2 + fy**2))
+    smoothed = np.fft.irfft2(np.fft.rfft2(padded)*transfer, s=shape)
 
-        except NotImplementedError:
-            print("\nWARNING: The input file is mat version 7.3 which must be converted to the scipy.loadmat output format.\nCurrently, only trx files can be converted. Other mat7.3 data files are not currently supported by this module.\n")
-            
-            #opening mat file with mat73
-            self.mat_dict = mat73.loadmat(matfile)
+    return np.clip(smoothed[pad:pad+hist.shape[0], pad:pad+hist.shape[1]], 0, None)
 
-            #transposing the dictionary of lists to list of dictionaries
-            temp_ls_of_dicts = _dict2list_of_dicts(self.mat_dict['trx'])
 
-            #cleaning scalar arrays by direct assignment
-            self.mat_dict['trx'] = _listofdicts_clean_scalar_arrays(temp_ls_of_dicts)
+def smooth_occupancy(x, y, sigma, binsize=0.5, bounds=None):
+    """
+    Function that returns a smoothed occupancy map of positions (e.g. x_mm and y_mm of every fly and frame, any shape, NaN ignored) as (density, xedges, yedges).
+    Positions are counted on a grid of binsize (0.5 by default, same units as x and y) with one bincount and blurred with a Gaussian of standard deviation sigma (same units) by FFT convolution,
+    so tens of millions of positions take about as long as the binning. density sums to 1 and is indexed [x bin, y bin] like np.histogram2d.
+    bounds defaults to the range of the data but can be set to (xmin, xmax, ymin, ymax) to compare maps on the same grid.
+    """
 
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
 
+    if bounds == None:
+        bounds = (x.min(), x.max(), y.min(), y.max())
+    xmin, xmax, ymin, ymax = bounds
 
-        #struct2df objects
-        self.trx_ls = []
-        self.chambers = separate_chambers
-        self.param_df = pd.DataFrame()
-        self.scores = pd.DataFrame()
-        self.processed_scores = pd.DataFrame()
-        self.dtype = ''
-        self.param_name = ''
-        self.behavior_name = ''
+    nx_ = max(int(np.ceil((xmax - xmin) / binsize)), 1)
+    ny_ = max(int(np.ceil((ymax - ymin) / binsize)), 1)
+    xedges = xmin + binsize*np.arange(nx_ + 1)
+    yedges = ymin + binsize*np.arange(ny_ + 1)
 
+    #positions outside the bounds are dropped, the maximum goes in the last bin
+    ix = np.floor((x - xmin) / binsize).astype(np.int64)
+    iy = np.floor((y - ymin) / binsize).astype(np.int64)
+    ix[x == xmax] = nx_ - 1
+    iy[y == ymax] = ny_ - 1
+    inside = (ix >= 0) & (ix < nx_) & (iy >= 0) & (iy < ny_)
 
-        #finding the type of file that was input and loading the relevant objects
-        if 'trx' in self.mat_dict.keys():
-            self.dtype = 'trx'
+    hist = np.bincount(ix[inside]*ny_ + iy[inside], minlength=nx_*ny_).reshape(nx_, ny_).astype(float)
+    density = _gaussian_smooth(hist, sigma / binsize)
 
-            #df for each row of struct of trx file
-            for idx in range(len(self.mat_dict['trx'])):
+    total = density.sum()
 
-                seriesls = []
-                for k, v in self.mat_dict['trx'][idx].items():
-                    seriesls.append(pd.Series(v, name=k))
+    return (density / total if total > 0 else density), xedges, yedges
 
-                self.trx_ls.append(pd.concat(seriesls, axis=1))
 
+def resample_uniform(values, timestamps, binsize=1.0, how='mean', start=None):
+    """
+    Function that resamples frame x fly data onto a uniform time grid using the recorded timestamps instead of a fixed framerate, so dropped frames do not shift later bins.
+    `values` is a 2D frame x fly array or dataframe (e.g. `.param_df`). `timestamps` are in seconds and can be one array for all flies or a frame x fly array or dataframe (e.g. the `.param_df` of perframe/timestamps.mat).
+    `binsize` is the spacing of the grid in seconds, the default of 1 gives per second data. The grid starts at the first timestamp unless `start` is given.
+    With `how`='mean' (default) each bin is the mean of the frames whose timestamps fall in it. Frames are assigned to bins with np.searchsorted and averaged for all flies at once with np.bincount.
+    With `how`='interp' the data is linearly interpolated at the start of each bin.
+    Returns a 2D array of bins x flies (a dataframe with the same columns if a dataframe was given). Bins without frames are NaN.
+    """
 
+    columns = values.columns if isinstance(values, pd.DataFrame) else None
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
 
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if timestamps.ndim == 2 and timestamps.shape[1] == 1:
+        timestamps = timestamps[:, 0]
 
-        elif 'allScores' in self.mat_dict.keys():
-            self.dtype = 'scores'
+    #matching the number of frames (perframe features can be one frame shorter than the timestamps)
+    nframes = min(len(values), len(timestamps))
+    values = values[:nframes]
+    timestamps = timestamps[:nframes]
 
-            self.behavior_name = (matfile.split('/')[-1]).replace('.mat', '').replace("scores_", "")
+    #flies almost always share one clock, which allows a much faster path below
+    if timestamps.ndim == 2 and (timestamps == timestamps[:, :1]).all(axis=0).all():
+        timestamps = timestamps[:, 0]
 
-            #making dictionaries for the perframe scores
-            scores_dict = {}
-            postprocessed_dict = {}
+    shared = timestamps.ndim == 1
+    finite_t = np.isfinite(timestamps)
+    if start == None:
+        start = np.min(timestamps[finite_t])
+    nbins = int(np.floor((np.max(timestamps[finite_t]) - start) / binsize + 1e-9)) + 1
+    edges = start + binsize * np.arange(nbins + 1)
 
-            for idx in range(len(self.mat_dict['allScores']['scores'])):
-                scores_dict.update({idx+1 : self.mat_dict['allScores']['scores'][idx]})
-                postprocessed_dict.update({idx+1 : self.mat_dict['allScores']['postprocessed'][idx]})
+    if how == 'mean' and shared and finite_t.all() and (np.diff(timestamps) >= 0).all():
+        #sorted timestamps shared by all flies: each bin is a contiguous block of rows, summed for every fly with one np.add.reduceat
+        bins = np.searchsorted(edges, timestamps + 1e-9 * binsize, side='right') - 1
+        firstrow = np.searchsorted(bins, np.arange(nbins))
+        present = firstrow < len(bins)
+        present[present] = bins[firstrow[present]] == np.arange(nbins)[present]
 
-            #making dataframes for the perframe scores
-            self.scores = pd.DataFrame(scores_dict)
-            self.processed_scores = pd.DataFrame(postprocessed_dict)
+        valid = np.isfinite(values)
+        total = np.add.reduceat(np.where(valid, values, 0), firstrow[present], axis=0)
+        count = np.add.reduceat(valid, firstrow[present], axis=0, dtype=np.int64)
 
+        out = np.full((nbins, values.shape[1]), np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[present] = total / count
 
+    elif how == 'mean':
+        if shared:
+            timestamps = np.broadcast_to(timestamps[:, None], values.shape)
+            finite_t = np.broadcast_to(finite_t[:, None], values.shape)
 
+        #the small tolerance keeps frames that sit exactly on an edge (e.g. frame 30 at 30 fps) in the later bin despite rounding
+        bins = np.searchsorted(edges, np.where(finite_t, timestamps, -np.inf) + 1e-9 * binsize, side='right') - 1
+        keep = finite_t & np.isfinite(values) & (bins >= 0) & (bins < nbins)
 
-        else:
-            self.dtype = 'perframe'
-            self.param_name = (matfile.split('/')[-1]).replace('.mat', '')
+        flat = bins * values.shape[1] + np.arange(values.shape[1])[None, :]
+        total = np.bincount(flat[keep], weights=values[keep], minlength=nbins * values.shape[1])
+        count = np.bincount(flat[keep], minlength=nbins * values.shape[1])
 
-            #making dictionary for the perframe parameter
-            new_perframe = {}
-            for idx in range(len(self.mat_dict['data'])):
-                new_perframe.update({idx+1 : self.mat_dict['data'][idx]})
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = (total / count).reshape(nbins, values.shape[1])
 
-            #making dataframe for the perframe parameter
-            self.param_df = pd.DataFrame(new_perframe)
-    
+    elif how == 'interp':
+        if shared:
+            timestamps = np.broadcast_to(timestamps[:, None], values.shape)
+            finite_t = np.broadcast_to(finite_t[:, None], values.shape)
 
+        out = np.full((nbins, values.shape[1]), np.nan)
+        for col in range(values.shape[1]):
+            keep = finite_t[:, col] & np.isfinite(values[:, col])
+            if keep.sum() > 1:
+                out[:, col] = np.interp(edges[:-1], timestamps[keep, col], values[keep, col], left=np.nan, right=np.nan)
 
+    else:
+        raise ValueError('Incorrect how input. Please use either "mean" or "interp".')
 
-    #methods
-    def extract_trx_param(self, param, savefile=True, name=''):
-        """
-        Method takes in a parameter name as a string (e.g. 'x', 'dt', etc.) or names (e.g. ['x', 'y']) as a list 
-        from the trx file and loads the .param_df with a dataframe of that per frame parameter for each fly.
-        If the savefile argument is True by default. If it is set to False a csv file will not be saved.
-        There is an optional name argument that will add to the begining of the filename and can be used to save file to different path.
-        """
+    if columns is not None:
+        return pd.DataFrame(out, columns=columns)
 
-        if self.dtype == 'trx':
+    return out
 
-            #formatting parameters
-            paramls = []
-            if isinstance(param, str):
-                paramls.append(param)
-            else:
-                paramls = param
 
-            #changing param name
-            self.param_name = '_'.join(paramls)
+def _timestamps_array(timestamps):
+    """
+    Private function that converts the accepted forms of the `timestamps` argument to an array: an array, a dataframe, or a `struct2df` instance of perframe/timestamps.mat.
+    """
 
-            #making extracted param dataframe
-            new_d = {}
+    if isinstance(timestamps, struct2df):
+        return timestamps.param_df.to_numpy()
+    if isinstance(timestamps, pd.DataFrame):
+        return timestamps.to_numpy()
 
-            for p in paramls:
-                for i in self.trx_ls:
-                    l = i[p].to_list()
-                    new_d.update({p + '_' + str(int((i['id'].to_list()[0]))) : l})
+    return np.asarray(timestamps)
 
-            self.param_df = pd.DataFrame(new_d)
 
-            if savefile == True:
-                self.param_df.to_csv('{nme}_'.format(nme=name) + '_'.join(paramls) + '.csv', index=False)
+def _persecond(df, framerate=30, timestamps=None, source=None):
+    """
+    Private function used by all the per second methods to average a frame x fly dataframe per second.
+    Without timestamps every `framerate` frames make one second (the original behavior). With timestamps the data is binned by recorded time with `resample_uniform`.
+    source identifies where the dataframe came from, e.g. the parsed file and table of a `struct2df` (see `struct2df._persecond`).
+    When the process-level memo cache is turned on (see `set_memo_cache`) and a source is given, results are kept keyed by the source, the framerate and the timestamps,
+    so calling a per second method again on the same data is free. Dataframes changed in place by hand are not noticed, clear the cache with `get_memo_cache().clear()` after doing so.
+    """
 
-        else:
-            print("Method does not support this data. Make sure data is from the trx file.")
+    if _memo.maxbytes <= 0 or source == None:
+        return _persecond_table(df, framerate, timestamps)
 
+    if timestamps is None:
+        stamp = None
+    elif isinstance(timestamps, struct2df):
+        stamp = timestamps._source
+    else:
+        stamp = _digest(np.asarray(_timestamps_array(timestamps)))
+    key = ('persecond', source, framerate, stamp)
 
+    cached = _memo.get(key)
+    if cached is not None:
+        return cached.copy()
 
-    def save_all_trx(self, name=''):
-        """
-        Method to save a trx csv for each fly. the optional name argument will add to the begining of the filename and can be used to save file to different path.
-        """
+    result = _persecond_table(df, framerate, timestamps)
+    _memo.put(key, result.copy(), _nbytes(result))
 
-        if self.dtype == 'trx':
+    return result
 
-            for idx, i in enumerate(self.trx_ls):
-                i.to_csv('{nme}_'.format(nme=name) + '_{fly}.csv'.format(fly=str(int(idx+1))), index=False)
 
-        else:
-            print("Method does not support this data. Make sure data is from the trx file.")
+def _persecond_table(df, framerate=30, timestamps=None):
+    """
+    Private function used in `_persecond` that averages a frame x fly dataframe per second without the cache.
+    """
 
+    if timestamps is None:
+        return df.groupby(np.arange(len(df))//framerate).mean()
 
+    return resample_uniform(df, _timestamps_array(timestamps), binsize=1.0, how='mean')
 
-    def save_perframe_or_behavior(self, persecond=False, framerate=30, name=''):
-        """
-        Method saves .param_df, a dataframe of a feature perframe for each fly, to a csv file.
-        There is an optional name argument that will add to the begining of the filename and can be used to save file to different path.
-        """
 
-        if self.dtype == 'perframe':
-            if persecond == True:
-                df_perf = self.param_df.groupby(np.arange(len(self.param_df))//framerate).mean()
-                df_perf.to_csv('{nme}_persecond_'.format(nme=name) + self.param_name + ".csv", index=False)
-            else:
-                self.param_df.to_csv('{nme}_'.format(nme=name) + self.param_name + ".csv", index=False)
+def _row_stats(values, quantiles=(), threshold=None):
+    """
+    Private function that computes summary statistics of every row of a 2D array at once, ignoring NaN.
+    Each row is sorted once and the quantiles, minimum and maximum are read from the sorted rows (linear interpolation, the same as np.nanquantile).
+    Returns a dictionary of 1D arrays: n, mean, sd, min, the quantiles (named e.g. 'q0.5'), max, nan_fraction, and above_fraction if a threshold is given.
+    """
 
-        elif self.dtype == 'scores':
-            if persecond == True:
-                df_scores = self.scores.groupby(np.arange(len(self.scores))//framerate).mean()
-                df_proc = self.processed_scores.groupby(np.arange(len(self.processed_scores))//framerate).mean()
-                df_scores.to_csv('{nme}_persecond_'.format(nme=name) + self.behavior_name + "_scores.csv", index=False)
-                df_proc.to_csv('{nme}_persecond_'.format(nme=name) + self.behavior_name + "_processed_scores.csv", index=False)
-            else:
-                self.scores.to_csv('{nme}_'.format(nme=name) + self.behavior_name + "_scores.csv", index=False)
-                self.processed_scores.to_csv('{nme}_'.format(nme=name) + self.behavior_name + "_processed_scores.csv", index=False)
+    values = np.asarray(values, dtype=np.float64)
 
-        else:
-            print("Method does not support this data. Make sure data is from the perframe directory.")
+    #no frames left (e.g. burnin longer than the recording), every statistic is NaN
+    if values.shape[1] == 0:
+        empty = np.full(values.shape[0], np.nan)
+        stats = {'n': np.zeros(values.shape[0], dtype=np.int64), 'mean': empty, 'sd': empty, 'min': empty}
+        for q in quantiles:
+            stats['q{}'.format(q)] = empty
+        stats['max'] = empty
+        stats['nan_fraction'] = empty
+        if threshold != None:
+            stats['above_fraction'] = empty
+        return stats
 
-    
+    valid = np.isfinite(values)
+    n = valid.sum(axis=1)
 
-    def plot_tracks(self, bysex=False, burnin=0, plottitle='', saveplot=True, filename='', showplot=False):
-        """
-        Method plots tracks of flies using the x,y coordinates (by pixels or mm).
-        The plot will be made using the mm data if both pixel and mm data have been extracted but will plot the pixel data if mm x and/or y data have not been extracted
-        The optional argument bysex is a boolean argument that indicates whether to color the tracks by the sex of the fly
-        burnin is the starting frame for which the plotting starts. it defaults to zero, the first frame.
-        If `struct2df` was instanciated with a `separate_chambers` dictionary, multiple plots will be generated.
-        """
+    #NaN sorts to the end of each row so the first n values of a row are its valid values
+    ordered = np.sort(np.where(valid, values, np.nan), axis=1)
+    rows = np.arange(values.shape[0])
 
-        if 'x_1' in self.param_df.columns and 'y_1' in self.param_df.columns or ('x_mm_1' in self.param_df.columns and 'y_mm_1' in self.param_df.columns):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = np.where(valid, values, 0).sum(axis=1)
+        mean = total / n
+        sd = np.sqrt((np.where(valid, values - mean[:, None], 0) ** 2).sum(axis=1) / (n - 1))
 
-            #getting the parameter to plot
-            if 'x_mm_1' and 'y_mm_1' in self.param_df.columns:
-                measure = 'mm_'
-                units = 'mm'
-            elif 'x_1' and 'y_1' in self.param_df.columns:
-                measure = ''
-                units = 'pixels'
+        def _quantile(q):
+            pos = q * (np.maximum(n, 1) - 1)
+            lo = np.floor(pos).astype(int)
+            hi = np.ceil(pos).astype(int)
+            out = ordered[rows, lo] + (ordered[rows, hi] - ordered[rows, lo]) * (pos - lo)
+            return np.where(n > 0, out, np.nan)
 
+        stats = {'n': n, 'mean': mean, 'sd': np.where(n > 1, sd, np.nan), 'min': _quantile(0.0)}
+        for q in quantiles:
+            stats['q{}'.format(q)] = _quantile(q)
+        stats['max'] = _quantile(1.0)
+        stats['nan_fraction'] = 1 - n / values.shape[1]
 
-            #single chamber data or multi-chamber data in one plot
-            if self.chambers == None:
+        if threshold != None:
+            stats['above_fraction'] = (valid & (np.where(valid, values, -np.inf) > threshold)).sum(axis=1) / n
 
-                #setting up figure
-                fig = plt.figure(figsize=(9,9))
-                ax = fig.add_subplot()
+    return stats
 
-                if bysex == True:
 
-                    #plotting x and y coordinates as a line plot
-                    for idx, i in enumerate(self.trx_ls):
+def _parse_query(expression):
+    """
+    Private function used in `fly_experiment.query` to parse a query string into a list of lists of (name, operator, value) predicates.
+    The outer list is joined with 'or' and each inner list with 'and'. A name on its own means name > 0.
+    e.g. 'chase_score > 0.8 and dcenter < 2 or wing_extension' --> [[('chase_score', '>', 0.8), ('dcenter', '<', 2.0)], [('wing_extension', '>', 0.0)]]
+    """
 
-                        x = self.param_df['x_{unit}{id}'.format(unit=measure, id=str(int(idx+1)))].to_list()[burnin:]
-                        y = self.param_df['y_{unit}{id}'.format(unit=measure, id=str(int(idx+1)))].to_list()[burnin:]
+    pattern = re.compile(r'^\s*([A-Za-z_]\w*)\s*(?:(<=|>=|==|!=|<|>)\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?))?\s*$')
+
+    clauses = []
+    for clause in re.split(r'\s+or\s+', expression.strip()):
+        predicates = []
+        for term in re.split(r'\s+and\s+', clause.strip()):
+            match = pattern.match(term)
+            if match == None:
+                raise ValueError("Could not parse the query term '{}'. Terms must look like 'velmag > 5'.".format(term))
+            if match.group(2) == None:
+                predicates.append((match.group(1), '>', 0.0))
+            else:
+                predicates.append((match.group(1), match.group(2), float(match.group(3))))
+        clauses.append(predicates)
 
-                        if 'm' in i['sex'].to_list():
-                            sex = 'm'
-                            colr = 'blue'
-                        elif 'f' in i['sex'].to_list():
-                            sex = 'f'
-                            colr = 'red'
-                        plt.plot(x, y, label = sex, color=colr, alpha=0.7)
+    return clauses
 
-                    #formating and showing the plot
-                    handles, labels = plt.gca().get_legend_handles_labels()
-                    by_label = dict(zip(labels, handles))
-                    plt.legend(by_label.values(), by_label.keys(), bbox_to_anchor=(1, 0.5), loc="center left")
 
-                else:
+def detect_chambers(x, y, nchambers=None, centers=None, iterations=50):
+    """
+    Function that assigns flies to chambers (arenas) from their positions. x and y are fly x frame arrays (e.g. x_mm and y_mm), NaN allowed.
+    Returns an integer array with the chamber index of each row, numbered in order of the first fly in each chamber, flies without any position get -1.
+    By default the number of chambers is found automatically: flies whose central 90% ranges of x and y overlap are in the same chamber, which works because flies cannot cross between arenas.
+    Set nchambers to cluster the median positions of the flies into that many chambers with k-means instead.
+    centers can be a list of (x, y) arena centers from the calibration (in the same units as x and y), then each fly is assigned to the nearest center and the index follows the order of the list.
+    """
 
-                    #plotting x and y coordinates as a line plot
-                    for idx, i in enumerate(self.trx_ls):
+    index = np.full(x.shape[0], -1, dtype=np.int64)
+    valid = ~np.all(np.isnan(x) | np.isnan(y), axis=1)
+    if not valid.any():
+        return index
+
+    x, y = x[valid], y[valid]
+    medx, medy = np.nanmedian(x, axis=1), np.nanmedian(y, axis=1)
+
+    if centers is not None:
+        centers = np.asarray(centers, dtype=float)
+        index[valid] = np.argmin(np.hypot(medx[:, None] - centers[None, :, 0], medy[:, None] - centers[None, :, 1]), axis=1)
+        return index
+
+    if nchambers is None:
+        #connected components of the flies with overlapping ranges
+        lox, hix = np.nanpercentile(x, [5, 95], axis=1)
+        loy, hiy = np.nanpercentile(y, [5, 95], axis=1)
+        overlap = (lox[:, None] <= hix[None, :]) & (lox[None, :] <= hix[:, None]) & (loy[:, None] <= hiy[None, :]) & (loy[None, :] <= hiy[:, None])
+
+        labels = np.arange(len(medx))
+        while True:
+            new = np.where(overlap, labels[None, :], len(labels)).min(axis=1)
+            if np.array_equal(new, labels):
+                break
+            labels = new
+
+    else:
+        #k-means on the median positions starting from the farthest flies
+        points = np.column_stack([medx, medy])
+        seeds = [0]
+        for _ in range(1, nchambers):
+            dist = np.min(np.hypot(*(points[:, None, :] - points[seeds][None, :, :]).transpose(2, 0, 1)), axis=1)
+            seeds.append(int(np.argmax(dist)))
+        means = points[seeds]
+
+        for _ in range(iterations):
+            labels = np.argmin(np.hypot(*(points[:, None, :] - means[None, :, :]).transpose(2, 0, 1)), axis=1)
+            new = np.array([points[labels == k].mean(axis=0) if (labels == k).any() else means[k] for k in range(nchambers)])
+            if np.allclose(new, means):
+                break
+            means = new
+
+    #renumbering in order of first appearance
+    _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    index[valid] = np.argsort(np.argsort(first))[inverse]
+
+    return index
+
+
+def _chamber_index(chambers, ids):
+    """
+    Private function that converts a `separate_chambers` dictionary of chamber name to fly ids into an integer chamber index per fly id (-1 for flies in no chamber) and the list of chamber names.
+    """
 
-                        x = self.param_df['x_{unit}{id}'.format(unit=measure, id=str(int(idx+1)))].to_list()[burnin:]
-                        y = self.param_df['y_{unit}{id}'.format(unit=measure, id=str(int(idx+1)))].to_list()[burnin:]
+    names = [str(c) for c in chambers.keys()] if chambers != None else []
+    code = {int(f): idx for idx, c in enumerate(chambers.values()) for f in c} if chambers != None else {}
 
-                        plt.plot(x, y, alpha=0.7)
+    return np.array([code.get(int(i), -1) for i in ids], dtype=np.int64), names
 
-                ax.set_aspect('equal', adjustable='box')
-                plt.xlabel('X ({})'.format(units))
-                plt.ylabel('Y ({})'.format(units))
-                plt.title(plottitle)
 
-                if saveplot:
-                    plt.savefig('{name}{unit}x_y_tracks.png'.format(name=filename, unit=measure))
-                
-                if showplot:
-                    plt.show()
-            
-            
-            #separate plots for separate chambers
-            else:
+def _chamber_flies(index, names, ids, chamber):
+    """
+    Private function that returns the list of fly ids in a chamber from an integer chamber index array, with one array comparison instead of string parsing.
+    """
 
-                """ #setting up figure
-                fig = plt.figure(figsize=(9,9))
-                ax = fig.add_subplot() """
+    if str(chamber) not in names:
+        raise ValueError("Chamber {} does not exist. The chambers are {}.".format(chamber, names))
 
-                if bysex == True:
+    return [int(i) for i in np.asarray(ids)[index == names.index(str(chamber))]]
 
-                    #plotting x and y coordinates as a line plot
-                    for cham in list(self.chambers.keys()):
-                        #setting up figure
-                        fig = plt.figure(figsize=(9,9))
-                        ax = fig.add_subplot()
-                        for indv in self.chambers[cham]:
 
-                            x = self.param_df['x_{unit}{id}'.format(unit=measure, id=str(int(indv)))].to_list()[burnin:]
-                            y = self.param_df['y_{unit}{id}'.format(unit=measure, id=str(int(indv)))].to_list()[burnin:]
+def attach_shared(spec):
+    """
+    Function that attaches to the arrays published by an instance of `shared_experiment` and returns them as read-only numpy views.
+    The spec is the `.spec` dictionary of the `shared_experiment` instance which is small and can be passed to other processes.
+    No data is copied, the views point directly at the shared memory blocks or memory-mapped files.
+    The returned dictionary has the same layout as the spec, e.g. views['perframes']['velmag'] is a fly x frame array with the rows ordered as spec['arrays']['perframes']['velmag']['ids'].
+    """
 
-                            if 'm' in self.trx_ls[int(indv-1)]['sex'].to_list():
-                                sex = 'm'
-                                colr = 'blue'
-                            elif 'f' in self.trx_ls[int(indv-1)]['sex'].to_list():
-                                sex = 'f'
-                                colr = 'red'
-                            plt.plot(x, y, label = sex, color=colr, alpha=0.7)
+    views = {}
 
-                        #formating and showing the plot
-                        handles, labels = plt.gca().get_legend_handles_labels()
-                        by_label = dict(zip(labels, handles))
-                        plt.legend(by_label.values(), by_label.keys(), bbox_to_anchor=(1, 0.5), loc="center left")
-                        ax.set_aspect('equal', adjustable='box')
-                        plt.xlabel('X ({})'.format(units))
-                        plt.ylabel('Y ({})'.format(units))
-                        plt.title(plottitle + " Chamber {ch}".format(ch=cham))
+    for group, arrays in spec['arrays'].items():
+        views[group] = {}
 
-                        if saveplot:
-                            plt.savefig('{name}_Chamber_{ch}_{unit}x_y_tracks.png'.format(name=filename, ch=cham, unit=measure))
-                        
-                        if showplot:
-                            plt.show()
+        for name, entry in arrays.items():
 
+            if spec['backend'] == 'shm':
+                #segments are kept in a module level dictionary so the buffers stay alive for the lifetime of the process
+                if entry['name'] not in _attached_segments:
+                    if sys.version_info >= (3, 13):
+                        _attached_segments[entry['name']] = shared_memory.SharedMemory(name=entry['name'], track=False)
+                    else:
+                        _attached_segments[entry['name']] = shared_memory.SharedMemory(name=entry['name'])
 
-                else:
+                arr = np.ndarray(entry['shape'], dtype=entry['dtype'], buffer=_attached_segments[entry['name']].buf)
 
-                    #plotting x and y coordinates as a line plot
-                    for cham in list(self.chambers.keys()):
-                        #setting up figure
-                        fig = plt.figure(figsize=(9,9))
-                        ax = fig.add_subplot()
-                        for indv in self.chambers[cham]:
+            else:
+                arr = np.load(entry['path'], mmap_mode='r')
 
-                            x = self.param_df['x_{unit}{id}'.format(unit=measure, id=str(int(indv)))].to_list()[burnin:]
-                            y = self.param_df['y_{unit}{id}'.format(unit=measure, id=str(int(indv)))].to_list()[burnin:]
+            arr.flags.writeable = False
+            views[group][name] = arr
 
-                            plt.plot(x, y, alpha=0.7)
+    return views
 
-                        ax.set_aspect('equal', adjustable='box')
-                        plt.xlabel('X ({})'.format(units))
-                        plt.ylabel('Y ({})'.format(units))
-                        plt.title(plottitle + " Chamber {ch}".format(ch=cham))
 
-                        if saveplot:
-                            plt.savefig('{name}_Chamber_{ch}_{unit}x_y_tracks.png'.format(name=filename, ch=cham, unit=measure))
-                        
-                        if showplot:
-                            plt.show()
+#shared memory segments attached in this process (see `attach_shared`)
+_attached_segments = {}
 
+#views attached by the worker initializer of `shared_experiment.map`
+_worker_views = {}
 
 
-        else:
-            print("Method does not support this data. Make sure data is from the trx file and x and y corrdinates have been extracted using the .extract_trx_param() method.")
-        
+def _shared_worker_init(spec):
+    """
+    Private function used as the pool initializer in `shared_experiment.map`. Each worker attaches to the shared arrays once.
+    """
 
+    _worker_views['spec'] = spec
+    _worker_views['views'] = attach_shared(spec)
 
-    def plot_density(self, resolution=5, burnin=0, plottype="heatmap", chamber="all", plottitle='', showplot=False, saveplot=True, filename=''):
-        """
-        Method plots the frequency that locations on the arena were occupied by flies using the x_mm and y_mm parameters.
-        A temparary dataframe is made using these parameters and transformed into a 2D histogram. This histogram plots the density either as a heatmap or 3D surface map.
-        The `resolution` defaults to 5 which represents 2D partitions of the arena of size 5mmx5mm. This can be changed to desired resolution.
-        The `burnin` defaults to 0 and can be set to remove the desired number of frames from the beginning of the data. Units are FRAMES!
-        The `plottype` defaults to "heatmap" but can be changed to "3D" for a 3D surface plot. Note that the surface plot is only shown but not automatically saved.
-        The `chamber` defaults to all and will plot all arenas if there are multiple. This can be set to a string which is the name of the chamber you wish to plot.
-        There is no `plottitle` by default but one can be set. The `filename` defaults to "_density_heatmap.png" but additional text can be added to the beginning using the `filename` parameter.
-        The `showplot` and `saveplot` parameters can be set as a bool. Please note that the 3D plot is shown but cannot be saved.
-        """
 
-        if 'x_mm_1' in self.param_df.columns and 'y_mm_1' in self.param_df.columns:
+def _shared_worker_task(task):
+    """
+    Private function used in `shared_experiment.map` to run the user function on the views of one fly or one chamber.
+    A single fly gets 1D row views, a chamber gets 2D views of the rows of its flies.
+    """
 
-            #filter x and y mm data out of self.param_df
-            cols = self.param_df.filter(regex='^(x_mm_|y_mm_)').columns.tolist()
+    func, item, flies = task
+    spec = _worker_views['spec']
+    views = _worker_views['views']
 
-            #selecting chamber
-            if chamber != "all":
-                cols = [col for col in self.param_df.columns if int(col.split('_')[-1]) in self.chambers[chamber]]
+    data = {}
+    for group, arrays in spec['arrays'].items():
+        data[group] = {}
 
-            #filtering the df
-            df = self.param_df[cols]
-            df = df[burnin:]
+        for name, entry in arrays.items():
+            rows = [entry['ids'].index(i) for i in flies if i in entry['ids']]
 
+            if len(rows) == 0:
+                continue
 
-            #number of flies
-            if chamber != "all":
-                num_individuals = len(self.chambers[chamber])
+            if isinstance(item, int):
+                data[group][name] = views[group][name][rows[0]]
+            elif rows == list(range(rows[0], rows[-1] + 1)):
+                #contiguous rows can still be a view
+                data[group][name] = views[group][name][rows[0]:rows[-1] + 1]
             else:
-                num_individuals = len(self.trx_ls)
+                data[group][name] = views[group][name][rows]
 
-            #list for individual dfs
-            individual_dfs = []
+    return func(item, data)
 
 
-            #making dfs for each individual
-            if chamber != "all":
-                for i in self.chambers[chamber]:
-                    #get column name
-                    x_col_name = 'x_mm_' + str(i)
-                    y_col_name = 'y_mm_' + str(i)
-                    
-                    #making df
-                    individual_df = pd.DataFrame({'x': df[x_col_name], 'y': df[y_col_name]})
-                    
-                    #appending to df list
-                    individual_dfs.append(individual_df)
-            else:
-                for i in range(num_individuals):
-                    #get column name
-                    x_col_name = 'x_mm_' + str(i+1)
-                    y_col_name = 'y_mm_' + str(i+1)
-                    
-                    #making df
-                    individual_df = pd.DataFrame({'x': df[x_col_name], 'y': df[y_col_name]})
-                    
-                    #appending to df list
-                    individual_dfs.append(individual_df)
+#number of set bits of every byte value, used to count packed frames when np.bitwise_count is not available (numpy < 2.0)
+_popcount_table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
 
 
-            #combining dataframes
-            all_df = pd.concat(individual_dfs)
-            all_df.dropna(inplace=True)
+def _popcount_rows(bits):
+    """
+    Private function that returns the number of set bits in each row of a 2D uint8 array.
+    """
 
-            #making 2D histogram
-            x_bins = int((all_df['x'].max() - all_df['x'].min()) / resolution)
-            y_bins = int((all_df['y'].max() - all_df['y'].min()) / resolution)
+    if hasattr(np, 'bitwise_count') and bits.shape[1] % 8 == 0:
+        return np.bitwise_count(bits.view(np.uint64)).sum(axis=1, dtype=np.int64)
 
-            num_bins = (x_bins, y_bins)
+    return _popcount_table[bits].sum(axis=1, dtype=np.int64)
 
-            hist, xedges, yedges = np.histogram2d(all_df['x'], all_df['y'], bins=num_bins)
 
-            #normalize histogram
-            hist_norm = hist/(np.sum(hist))
+def _mask_bouts(mask):
+    """
+    Private function that finds the bouts (runs of True) in a 2D boolean fly x frame mask without looping over frames.
+    Returns three integer arrays: the row of each bout, the first frame of the bout, and the frame after the last frame of the bout.
+    e.g. [[0, 1, 1, 0, 1]] --> rows [0, 0], starts [1, 4], stops [3, 5]
+    """
 
-            #making histogram and plotting
-            if plottype == "heatmap":
-                
-                #Plot the heatmap Note: must be transposed because np.histogram2d does not follow normal cartesian convention
-                plt.imshow(hist_norm.T, cmap='plasma', interpolation='nearest', extent=[xedges[0], xedges[-1], yedges[0], yedges[-1]], origin='lower')
-                cbar = plt.colorbar()
-                cbar.set_label('Frequency')
+    mask = np.atleast_2d(np.asarray(mask, dtype=bool))
 
-                #labels
-                plt.xlabel('X (mm)')
-                plt.ylabel('Y (mm)')
-                plt.title(plottitle)
+    #padding with False on both ends so every bout has a rising and a falling edge
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
 
-                if saveplot:
-                    plt.savefig('{}_density_heatmap.png'.format(filename))
+    #np.nonzero returns row-major order so the nth rising edge matches the nth falling edge
+    rows, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
 
-                if showplot:
-                    plt.show()
+    return rows, starts, stops
 
 
+def _gap_fill(values, lengths, maxgap=5, method='linear', circular=False):
+    """
+    Private function that fills the short NaN gaps of a fly x frame array. lengths is the number of frames of each row, frames after it are outside the fly's range and left alone.
+    Gaps of at most maxgap frames with data on both sides are filled by 'linear' or 'spline' (cubic) interpolation, longer gaps and gaps at either end are left as NaN.
+    circular treats the values as angles in radians so interpolation takes the short way around.
+    Returns the filled array and the rows, starts, stops (see `_mask_bouts`) of every gap.
+    """
 
-            elif plottype == "3D":
-                #creating 3D figure
-                fig = plt.figure(figsize=(10, 8))
-                ax = fig.add_subplot(111, projection='3d')
+    inrange = np.arange(values.shape[1])[None, :] < np.asarray(lengths)[:, None]
+    rows, starts, stops = _mask_bouts(np.isnan(values) & inrange)
+    gaplengths = stops - starts
+    fillable = (gaplengths <= maxgap) & (starts > 0) & (stops < np.asarray(lengths)[rows])
+
+    filled = values.copy()
+    if not fillable.any():
+        return filled, rows, starts, stops
+
+    r, s, e = rows[fillable], starts[fillable], stops[fillable]
+    n = e - s
+
+    #every frame to fill with the position of its gap
+    frame_rows = np.repeat(r, n)
+    offsets = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    frames = np.repeat(s, n) + offsets
+
+    if method == 'linear':
+        left = np.repeat(values[r, s - 1], n)
+        right = np.repeat(values[r, e], n)
+        frac = (offsets + 1) / np.repeat(n + 1, n)
+        if circular:
+            filled[frame_rows, frames] = _wrap_angle(left + _wrap_angle(right - left)*frac)
+        else:
+            filled[frame_rows, frames] = left + (right - left)*frac
+
+    elif method == 'spline':
+        for row in np.unique(frame_rows):
+            valid = ~np.isnan(values[row, :lengths[row]])
+            known = np.nonzero(valid)[0]
+            y = np.unwrap(values[row, known]) if circular else values[row, known]
+            target = frames[frame_rows == row]
+            out = spinterp.CubicSpline(known, y)(target)
+            filled[row, target] = _wrap_angle(out) if circular else out
+
+    else:
+        raise ValueError('Incorrect method input. Please use either "linear" or "spline".')
+
+    return filled, rows, starts, stops
+
+
+def _block_moments(block):
+    """
+    Private function that returns the per-row count, mean and sum of squared deviations (M2) of a 2D array, ignoring NaN.
+    These can be combined across chunks with `_merge_moments`.
+    """
+
+    valid = np.isfinite(block)
+    n = valid.sum(axis=1).astype(np.float64)
+    total = np.where(valid, block, 0).sum(axis=1, dtype=np.float64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, total / n, 0.0)
+
+    m2 = (np.where(valid, block - mean[:, None], 0) ** 2).sum(axis=1, dtype=np.float64)
+
+    return n, mean, m2
+
+
+def _merge_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """
+    Private function that merges two sets of counts, means and M2 values using the parallel form of Welford's algorithm (Chan et al.).
+    Works elementwise on arrays so one call merges the moments of every fly.
+    """
+
+    n = n_a + n_b
+    delta = mean_b - mean_a
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, mean_a + delta * n_b / n, 0.0)
+        m2 = np.where(n > 0, m2_a + m2_b + delta ** 2 * n_a * n_b / n, 0.0)
+
+    return n, mean, m2
+
+
+def _mat2npy(matfile, directory=''):
+    """
+    Private function used in the class `chunked_experiment` to convert a perframe or JAABA score .mat file to fly x frame .npy files that can be memory-mapped.
+    Flies with fewer frames are padded with NaN. mat 7.3 files are read one fly at a time with h5py so only the output is ever the size of the whole file.
+    Perframe files make one file named after the feature, score files make two: '{behavior}_score' and '{behavior}_processed'.
+    Returns a dictionary of feature name to .npy path.
+    """
+
+    name = (matfile.split('/')[-1]).replace('.mat', '')
+    h5 = None
+
+    try:
+        mat_dict = spio.loadmat(matfile, simplify_cells=True)
+
+        if 'allScores' in mat_dict.keys():
+            name = name.replace("scores_", "")
+            cells = {name + '_score': mat_dict['allScores']['scores'], name + '_processed': mat_dict['allScores']['postprocessed']}
+        else:
+            cells = {name: mat_dict['data']}
+
+        cells = {k: [np.asarray(i, dtype=np.float64).ravel() for i in v] for k, v in cells.items()}
+        read = lambda cell, idx: cell[idx]
+
+    except NotImplementedError:
+        h5 = h5py.File(matfile, 'r')
+
+        if 'allScores' in h5.keys():
+            name = name.replace("scores_", "")
+            cells = {name + '_score': h5['allScores']['scores'], name + '_processed': h5['allScores']['postprocessed']}
+        else:
+            cells = {name: h5['data']}
+
+        cells = {k: [h5[ref] for ref in v[()].ravel()] for k, v in cells.items()}
+        read = lambda cell, idx: np.asarray(cell[idx], dtype=np.float64).ravel()
+
+    paths = {}
+    for key, cell in cells.items():
+        path = os.path.join(directory, key + '.npy')
+        length = max(int(np.prod(i.shape)) for i in cell)
+
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(len(cell), length))
+        for idx in range(len(cell)):
+            values = read(cell, idx)
+            out[idx, :len(values)] = values
+            out[idx, len(values):] = np.nan
+        out.flush()
+        del out
+
+        paths[key] = path
+
+    if h5 != None:
+        h5.close()
+
+    return paths
+
+
+def save_accumulator(acc, path):
+    """
+    Function that saves a `running_moments`, `quantile_sketch` or `histogram_accumulator` to a json file so it can be combined later without rereading the .mat files.
+    """
+
+    with open(path, 'w') as f:
+        json.dump(acc.to_dict(), f)
+
+
+def load_accumulator(path):
+    """
+    Function that loads an accumulator saved with `save_accumulator`.
+    """
+
+    with open(path) as f:
+        d = json.load(f)
+
+    return {'running_moments': running_moments, 'quantile_sketch': quantile_sketch, 'histogram_accumulator': histogram_accumulator}[d['type']].from_dict(d)
+
+
+def _wrap_angle(a):
+    """
+    Private function that wraps angles in radians to [-pi, pi).
+    """
+
+    return (a + np.pi) % (2*np.pi) - np.pi
+
+
+def load_pairwise(path):
+    """
+    Function that opens a pairwise feature store written by `fly_experiment.pairwise_features` from its '{name}_pairwise.json' index file.
+    Returns a dictionary of chamber name ('all' when no chambers were set) to a dictionary of feature name to a read-only memory-mapped frame x fly x fly array,
+    with the list of fly ids of the last two axes under 'ids'.
+    e.g. `load_pairwise('exp_pairwise.json')['1']['nose2tail'][:, 0, 1]` is the distance from the nose of the first fly of chamber '1' to the tail of its second fly in every frame.
+    """
+
+    with open(path) as f:
+        index = json.load(f)
+
+    directory = os.path.dirname(path)
+    store = {}
+    for chamber, block in index['chambers'].items():
+        store[chamber] = {feature: np.load(os.path.join(directory, fname), mmap_mode='r') for feature, fname in block['files'].items()}
+        store[chamber]['ids'] = block['ids']
+
+    return store
+
+
+
+
+
+
+
+
+
+#manifest of the render cache, None when it is off (see `set_render_cache`)
+_render_manifest = None
+
+#files saved by the plot that is currently being rendered
+_saved_figures = []
+
+#True in the worker processes of `render_batch`, which report the files they saved
+_record_figures = False
+
+#manifest entries a `render_batch` worker leaves for the parent process to write, None when entries are written directly
+_deferred_entries = None
+
+
+def set_render_cache(manifest='render_manifest.json'):
+    """
+    Function turns on the render cache of `plot_tracks`, `plot_density`, `plot_timeseries`, `ethogram` and `network` with a json manifest at the given path, or turns it off with None.
+    When it is on, each saved plot is keyed by a hash of the input data and the plot arguments. Calling the method again with the same key skips rendering if every file it saved still exists.
+    The manifest links every key to the method, its arguments, the hashes of its inputs and the files written so a figure can be traced back to its data.
+    Plots that are shown (showplot=True) or not saved are always rendered.
+    """
+
+    global _render_manifest
+    _render_manifest = manifest
+
+
+def _read_manifest():
+    """
+    Private function that returns the render cache manifest as a dictionary, empty if it does not exist yet.
+    """
+
+    if _render_manifest == None or not os.path.exists(_render_manifest):
+        return {}
+
+    with open(_render_manifest) as f:
+        return json.load(f)
+
+
+def _update_manifest(entries, timeout=60):
+    """
+    Private function that adds a dictionary of key to entry to the render cache manifest, safe to call from many processes at once.
+    The update holds a lock file next to the manifest and the new manifest is written to a temporary file that replaces the old one,
+    so no process reads a half written manifest and no entries are lost. A lock older than timeout seconds is taken to be left by a crashed process and removed.
+    """
+
+    lock = _render_manifest + '.lock'
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > timeout:
+                    os.remove(lock)
+            except OSError:
+                pass
+            time.sleep(0.01)
+
+    try:
+        manifest = _read_manifest()
+        manifest.update(entries)
+        temp = '{m}.{pid}.tmp'.format(m=_render_manifest, pid=os.getpid())
+        with open(temp, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(temp, _render_manifest)
+    finally:
+        os.close(fd)
+        os.remove(lock)
+
+
+def _savefig(path, fig=None):
+    """
+    Private function that saves a figure (the current one by default) like `plt.savefig` and records the file for the render cache.
+    """
+
+    (plt if fig is None else fig).savefig(path)
+    _recordfig(path)
+
+
+def _recordfig(path):
+    """
+    Private function that records a file saved by a plot method (e.g. an animation) for the render cache and `render_batch`.
+    """
+
+    if _render_manifest != None or _record_figures:
+        _saved_figures.append(path)
+
+
+def _figure(showplot=False, **kwargs):
+    """
+    Private function that makes a figure with the object-oriented API. Figures that are only saved are attached to their own Agg canvas and never enter the pyplot state machine,
+    figures to be shown are made with pyplot so `plt.show` can display them. Either way the plot method closes it with `plt.close(fig)`.
+    """
+
+    if showplot:
+        return plt.figure(**kwargs)
+
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+
+    return fig
+
+
+def _digest(obj):
+    """
+    Private function that returns a hex hash of arrays, dataframes, series, `struct2df` and `fly_experiment` instances, scalars and the dictionaries and lists of them used as plot inputs.
+    The data itself is hashed every time so a dataframe or array changed in place gets a new digest. Raises TypeError for other objects which have no stable hash.
+    """
+
+    if isinstance(obj, pd.Series):
+        return _digest([obj.to_numpy(), obj.index.to_numpy(), obj.name])
+    if isinstance(obj, (pd.DataFrame, np.ndarray)):
+        h = hashlib.blake2b(digest_size=16)
+        if isinstance(obj, pd.DataFrame):
+            h.update(repr(list(obj.columns)).encode())
+            for _, col in obj.items():
+                values = col.to_numpy()
+                h.update(np.ascontiguousarray(values).tobytes() if values.dtype != object else repr(values.tolist()).encode())
+        else:
+            h.update(np.ascontiguousarray(obj).tobytes() if obj.dtype != object else repr(obj.tolist()).encode())
+        return h.hexdigest()
+
+    if isinstance(obj, dict):
+        return hashlib.blake2b(repr(sorted((str(k), _digest(v)) for k, v in obj.items())).encode(), digest_size=16).hexdigest()
+    if isinstance(obj, (list, tuple)):
+        return hashlib.blake2b(repr([_digest(v) for v in obj]).encode(), digest_size=16).hexdigest()
+    if isinstance(obj, behavior_masks):
+        return _digest([obj.bits, obj.nframes, obj.ids])
+    if hasattr(obj, '_render_inputs'):
+        return _digest(obj._render_inputs())
+    if _plain(obj):
+        return hashlib.blake2b(repr(obj).encode(), digest_size=16).hexdigest()
+
+    raise TypeError("Cannot hash an object of type {}.".format(type(obj).__name__))
+
+
+def _plain(obj):
+    """
+    Private function that checks if an argument is a scalar, a string or a tuple or list of them, whose repr is a stable cache key.
+    """
+
+    if obj is None or isinstance(obj, (bool, int, float, str, np.integer, np.floating, np.bool_)):
+        return True
+    if isinstance(obj, (list, tuple)):
+        return all(_plain(i) for i in obj)
+
+    return False
+
+
+def _render_cached(method):
+    """
+    Private decorator of the plot methods that skips rendering when the render cache (see `set_render_cache`) has an identical figure on disk and records new figures in the manifest.
+    The instance provides its input data with a `_render_inputs` method. Plain arguments are keyed by their repr and data arguments by a hash of their contents,
+    calls with any other argument are rendered without the cache.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+
+        if _render_manifest == None:
+            return method(self, *args, **kwargs)
+
+        bound = inspect.signature(method).bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = {k: v for k, v in bound.arguments.items() if k != 'self'}
+
+        if not arguments.get('saveplot', True) or arguments.get('showplot', False):
+            return method(self, *args, **kwargs)
+
+        try:
+            inputs = {k: _digest(v) for k, v in self._render_inputs().items()}
+            arguments = {k: repr(v) if _plain(v) else _digest(v) for k, v in arguments.items()}
+        except TypeError:
+            return method(self, *args, **kwargs)
+        key = hashlib.blake2b(json.dumps({'method': method.__qualname__, 'arguments': arguments, 'inputs': inputs}, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+        entry = _read_manifest().get(key)
+        if entry != None and len(entry['files']) > 0 and all(os.path.exists(i) for i in entry['files']):
+            print("Skipping {m}, unchanged figure already saved: {f}".format(m=method.__qualname__, f=', '.join(entry['files'])))
+            return None
+
+        start = len(_saved_figures)
+        result = method(self, *args, **kwargs)
+        files = _saved_figures[start:]
+        del _saved_figures[start:]
+
+        entry = {'method': method.__qualname__, 'arguments': arguments, 'inputs': inputs, 'files': files}
+        if _deferred_entries != None:
+            _deferred_entries.append((key, entry))
+        else:
+            _update_manifest({key: entry})
+
+        return result
+
+    return wrapper
+
+
+
+
+def _render_worker_init(manifest=None):
+    """
+    Private function that sets up a `render_batch` worker: figures are drawn headless with the Agg backend, the saved files are recorded and the memo cache is turned on.
+    manifest is the render cache manifest of the parent process, passed explicitly because spawned workers (macOS and Windows) do not inherit it.
+    The workers only read the manifest, their new entries are returned with the results and written by the parent.
+    """
+
+    global _record_figures, _render_manifest, _deferred_entries
+    plt.switch_backend('Agg')
+    _record_figures = True
+    _render_manifest = manifest
+    _deferred_entries = []
+    if _memo.maxbytes <= 0:
+        set_memo_cache()
+
+
+def _render_job(job):
+    """
+    Private function used in `render_batch` that loads the files of one job, calls the plot method and closes every figure.
+    Returns a dictionary of the method, its arguments, the files saved, the error message if it failed and the new render cache manifest entries.
+    """
+
+    files = [job['files']] if isinstance(job['files'], str) else list(job['files'])
+    kwargs = dict(job.get('kwargs', {}))
+    start = len(_saved_figures)
+    first = len(_deferred_entries)
+
+    try:
+        sdfs = [struct2df(f, separate_chambers=job.get('separate_chambers'), lowmemory=job.get('lowmemory', True)) for f in files]
+        for i in sdfs:
+            if i.dtype == 'trx' and job.get('extract') != None:
+                i.extract_trx_param(job['extract'], savefile=False)
+
+        target = fly_experiment(sdfs) if job.get('experiment', len(sdfs) > 1) else sdfs[0]
+        method = getattr(target, job['method'])
+        #figures are never shown in the workers, methods that only export (e.g. `animate_occupancy`) have no showplot
+        if 'showplot' in inspect.signature(method).parameters:
+            kwargs['showplot'] = False
+        method(**kwargs)
+        error = None
+
+    except Exception as e:
+        error = '{t}: {m}'.format(t=type(e).__name__, m=str(e))
+
+    finally:
+        plt.close('all')
+
+    saved = _saved_figures[start:]
+    del _saved_figures[start:]
+    entries = dict(_deferred_entries[first:])
+    del _deferred_entries[first:]
+
+    return {'method': job['method'], 'kwargs': kwargs, 'files': saved, 'error': error, 'entries': entries}
+
+
+def _render_group(jobs):
+    """
+    Private function used in `render_batch` that renders a list of jobs in one worker, in order.
+    """
+
+    return [_render_job(job) for job in jobs]
+
+
+def render_batch(jobs, processes=None, group=True):
+    """
+    Function renders many plots in parallel with a process pool of headless (Agg) workers so throughput scales with the cores of a batch node.
+    jobs is a list of dictionaries with the keys:
+    'files' (a .mat file or a list of them, a list makes a `fly_experiment` unless 'experiment' is set to False), 'method' (e.g. 'plot_density' or 'ethogram'),
+    and optionally 'kwargs' (the arguments of the method), 'separate_chambers', 'extract' (trx parameters passed to `extract_trx_param`, e.g. ['x_mm', 'y_mm']),
+    'lowmemory' (True by default) and 'each' to split a job into one plot per chamber or fly, e.g. ('chamber', ['A', 'B']) or ('fly', [1, 2, 3]).
+    Split jobs add the value to the end of the filename so the plots do not overwrite each other.
+    The render cache setting (see `set_render_cache`) is passed to the workers on every platform and the manifest is updated once by this process with the entries of all workers.
+    Each worker turns on the memo cache so it parses a file once and reuses it for the following jobs. With group True (default) the jobs that use the same files
+    are sent to the same worker so each experiment is parsed once, set it to False to spread the plots of one experiment over all workers when rendering takes longer than parsing.
+    processes defaults to the number of cores, set it to 1 to render in the current process. showplot is always False.
+    Returns a list with one dictionary per plot, grouped like the jobs sent to the workers: method, kwargs, files (the files saved) and error (None if it worked).
+    e.g. `render_batch([{'files': 'trx.mat', 'method': 'plot_density', 'extract': ['x_mm', 'y_mm'], 'separate_chambers': chambers, 'each': ('chamber', ['A', 'B'])}])`
+    """
+
+    #one job per chamber or fly
+    expanded = []
+    for job in jobs:
+        if job.get('each') == None:
+            expanded.append(job)
+            continue
+
+        param, values = job['each']
+        for v in values:
+            kwargs = dict(job.get('kwargs', {}))
+            kwargs[param] = v
+            kwargs['filename'] = '{f}_{v}'.format(f=kwargs.get('filename', ''), v=v)
+            expanded.append(dict(job, kwargs=kwargs, each=None))
+
+    manifest = _render_manifest
+
+    if processes == 1:
+        global _record_figures, _deferred_entries
+        recording = _record_figures
+        backend = plt.get_backend()
+        maxbytes = _memo.maxbytes
+        _render_worker_init(manifest)
+        try:
+            results = [_render_job(job) for job in expanded]
+        finally:
+            _record_figures = recording
+            _deferred_entries = None
+            plt.switch_backend(backend)
+            set_memo_cache(maxbytes)
+
+    else:
+        #jobs with the same files go to one worker, keeping the order of first appearance
+        groups = {}
+        for job in expanded:
+            key = json.dumps(job['files']) if group else len(groups)
+            groups.setdefault(key, []).append(job)
+
+        with mp.Pool(processes, initializer=_render_worker_init, initargs=(manifest,)) as pool:
+            results = [r for rs in pool.map(_render_group, list(groups.values()), chunksize=1) for r in rs]
+
+    #the new manifest entries of all workers are written once by this process
+    entries = {}
+    for r in results:
+        entries.update(r.pop('entries'))
+    if manifest != None and len(entries) > 0:
+        _update_manifest(entries)
+
+    for r in results:
+        if r['error'] != None:
+            print("WARNING: {m} failed: {e}".format(m=r['method'], e=r['error']))
+
+    return results
+
+
+
+
+#class for the process-level memo cache of parsed files and derived tables
+class memo_cache():
+
+    def __init__(self, maxbytes=2**30):
+        """
+        This class is a least recently used cache with a memory cap. The module keeps one instance for the whole process (see `get_memo_cache`)
+        which holds the parsed contents of .mat files read by `struct2df` (keyed by path, size and modification time) and per second tables (keyed by a hash of the data, framerate and timestamps).
+        maxbytes defaults to 1 GiB, when it is exceeded the least recently used entries are evicted. Set it to 0 to disable caching.
+        The process-level instance starts disabled, turn it on with `set_memo_cache`.
+        `.stats()` returns the hits, misses, evictions, number of entries and bytes held.
+        """
+
+        #memo_cache objects
+        self.maxbytes = maxbytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+
+    def get(self, key):
+        """
+        Method returns the cached value of a key and marks it as recently used, or None if it is not cached.
+        """
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+        self.misses += 1
+
+        return None
+
+
+
+    def put(self, key, value, nbytes):
+        """
+        Method caches a value that takes nbytes of memory and evicts the least recently used entries until the cache fits under `.maxbytes`.
+        Values larger than `.maxbytes` are not cached.
+        """
+
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+
+        if nbytes > self.maxbytes:
+            return
+
+        self._entries[key] = (value, nbytes)
+        self._bytes += nbytes
+
+        while self._bytes > self.maxbytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+
+
+    def clear(self):
+        """
+        Method empties the cache. The statistics are kept.
+        """
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+
+
+    def stats(self):
+        """
+        Method returns a dictionary of the hits, misses, evictions, entries, bytes and maxbytes of the cache.
+        """
+
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self._entries), 'bytes': self._bytes, 'maxbytes': self.maxbytes}
+
+
+
+
+#process-level memo cache shared by every instance, off until `set_memo_cache` is called
+_memo = memo_cache(maxbytes=0)
+
+
+def get_memo_cache():
+    """
+    Function returns the process-level `memo_cache`, e.g. `get_memo_cache().stats()` for the hit and miss counts or `get_memo_cache().clear()` to release the memory.
+    """
+
+    return _memo
+
+
+def set_memo_cache(maxbytes=2**30):
+    """
+    Function turns on the process-level memo cache with a memory cap of maxbytes (1 GiB by default), evicting entries if needed. Set it to 0 to turn the cache off again.
+    The cache is off by default because it keeps a copy of every parsed file and per second table alive after the instances that made them are deleted.
+    Values are copied in and out of the cache so instances never share dataframes.
+    """
+
+    _memo.maxbytes = maxbytes
+    while _memo._bytes > _memo.maxbytes and len(_memo._entries) > 0:
+        _, (_, evicted) = _memo._entries.popitem(last=False)
+        _memo._bytes -= evicted
+        _memo.evictions += 1
+
+
+def _nbytes(obj):
+    """
+    Private function that estimates the memory held by arrays, dataframes and the dictionaries and lists of them made when parsing .mat files.
+    """
+
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(obj.memory_usage(index=True, deep=False).sum()) if isinstance(obj, pd.DataFrame) else int(obj.memory_usage(index=True, deep=False))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes + (sum(_nbytes(i) for i in obj.ravel()) if obj.dtype == object else 0)
+    if isinstance(obj, dict):
+        return sum(_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(v) for v in obj)
+
+    return sys.getsizeof(obj)
+
+
+
+
+#class for extracting matlab structure type data
+class struct2df():
+
+    def __init__(self, matfile, separate_chambers=None, lowmemory=False):
+        """
+        This class takes in a .mat structure file from the Flytracker for JAABA output and extracts the data.
+        First the structure is converted to a multidimensional dictionary using the scipy.io module.
+        For mat7.3 files the mat73 module is used to convert the data. Note that this only works on trx files currently.
+        The dictionary is parsed to ether extract specific data or extract all the data depending on the type of file.
+        With trx files, queried data can be extracted or a dataframe for each fly can be exported.
+        With perframe files, the parameter of the file selected is extracted into a dataframe.
+        The optional parameter `separate_chambers` is for flytracker data with multiple arenas. Default is None.
+        To differentiate between the arenas pass a dictionary of chamber number keys and list of ids as values.
+        The key must be a string and the value must be a list of integers representing the fly id.
+        e.g. {'1':[1,2,3,4,5,6,7], 'B':[8,9,10,11,12,13,14]}
+        The chambers can also be found automatically with the `detect_chambers` method. Either way they are stored as `.chamber_index`, the integer chamber of each fly in `.chamber_names`.
+        `.column_ids` and `.column_params` are lookup tables of the fly id and parameter of every column of `.param_df` (or `.scores` for behavior files),
+        all selection by fly, chamber or parameter goes through them. The 'x_mm_3' style column names of extracted trx parameters are kept as a view for csv files.
+        The optional parameter `lowmemory` defaults to False. Set it to True to release the parsed .mat dictionary (`.mat_dict`) once the dataframes are built.
+        All methods work from the dataframes so this roughly halves the memory held by each instance, but `.mat_dict` is None afterwards.
+        When the process-level memo cache is turned on with `set_memo_cache`, parsed files are kept so making another instance for an unchanged file does not read it again.
+        Each instance gets its own copy of the dataframes.
+        """
+
+        #reusing an earlier parse of the same unchanged file
+        stat = os.stat(matfile)
+        key = ('parse', os.path.abspath(matfile), stat.st_size, stat.st_mtime_ns, lowmemory, tuple(sorted(_storage_policy.items())))
+        cached = _memo.get(key) if _memo.maxbytes > 0 else None
+
+        self._source = key
+
+        if cached is not None:
+            for k, v in copy.deepcopy(cached).items():
+                setattr(self, k, v)
+            self.chambers = separate_chambers
+            self.chamber_index, self.chamber_names = _chamber_index(self.chambers, self._fly_ids())
+            return
+
+        #structure to dictionary
+        try:
+            self.mat_dict = spio.loadmat(matfile, simplify_cells=True)
+
+        except NotImplementedError:
+            print("\nWARNING: The input file is mat version 7.3 which must be converted to the scipy.loadmat output format.\nCurrently, only trx files can be converted. Other mat7.3 data files are not currently supported by this module.\n")
+            
+            #opening mat file with mat73
+            self.mat_dict = mat73.loadmat(matfile)
+
+            #transposing the dictionary of lists to list of dictionaries
+            temp_ls_of_dicts = _dict2list_of_dicts(self.mat_dict['trx'])
+
+            #cleaning scalar arrays by direct assignment
+            self.mat_dict['trx'] = _listofdicts_clean_scalar_arrays(temp_ls_of_dicts)
+
+
+
+        #struct2df objects
+        self.trx_ls = []
+        self.chambers = separate_chambers
+        self.chamber_index = np.array([], dtype=np.int64)
+        self.chamber_names = []
+        self.param_df = pd.DataFrame()
+        self.scores = pd.DataFrame()
+        self.processed_scores = pd.DataFrame()
+        self.dtype = ''
+        self.param_name = ''
+        self.behavior_name = ''
+        self.lengths = {}
+        self.column_ids = np.array([], dtype=np.int64)
+        self.column_params = np.array([], dtype=object)
+
+
+        #finding the type of file that was input and loading the relevant objects
+        if 'trx' in self.mat_dict.keys():
+            self.dtype = 'trx'
+
+            #df for each row of struct of trx file
+            for idx in range(len(self.mat_dict['trx'])):
+
+                seriesls = []
+                for k, v in self.mat_dict['trx'][idx].items():
+                    series = pd.Series(v, name=k)
+
+                    #applying the storage policy
+                    if k == 'sex' and _storage_policy['sex'] == 'category':
+                        series = series.astype('category')
+                    elif k not in _time_features and pd.api.types.is_float_dtype(series.dtype):
+                        series = series.astype(_storage_policy['precision'], copy=False)
+
+                    seriesls.append(series)
+
+                self.trx_ls.append(pd.concat(seriesls, axis=1))
+
+                #releasing each fly as soon as its dataframe is built keeps the peak memory down
+                if lowmemory:
+                    self.mat_dict['trx'][idx] = None
+
+
+
+
+        elif 'allScores' in self.mat_dict.keys():
+            self.dtype = 'scores'
+
+            self.behavior_name = (matfile.split('/')[-1]).replace('.mat', '').replace("scores_", "")
+
+            #making dataframes for the perframe scores
+            self.scores, self.lengths = _stack_cells(self.mat_dict['allScores']['scores'], _storage_policy['scores'])
+
+            if _storage_policy['processed'] == 'bool':
+                self.processed_scores = _stack_cells(self.mat_dict['allScores']['postprocessed'])[0] >= 0.5
+            else:
+                self.processed_scores = _stack_cells(self.mat_dict['allScores']['postprocessed'], _storage_policy['scores'])[0]
+
+            self.column_ids = np.arange(1, self.scores.shape[1]+1, dtype=np.int64)
+            self.column_params = np.full(self.scores.shape[1], self.behavior_name, dtype=object)
+
+
+
+
+        else:
+            self.dtype = 'perframe'
+            self.param_name = (matfile.split('/')[-1]).replace('.mat', '')
+
+            #making dataframe for the perframe parameter
+            if self.param_name in _time_features:
+                self.param_df, self.lengths = _stack_cells(self.mat_dict['data'])
+            else:
+                self.param_df, self.lengths = _stack_cells(self.mat_dict['data'], _storage_policy['precision'])
+
+            self.column_ids = np.arange(1, self.param_df.shape[1]+1, dtype=np.int64)
+            self.column_params = np.full(self.param_df.shape[1], self.param_name, dtype=object)
+
+
+        #chamber index of every fly in the file, trx or not
+        self.chamber_index, self.chamber_names = _chamber_index(self.chambers, self._fly_ids())
+
+        #the dataframes are the only copy of the data from here on
+        if lowmemory:
+            self.mat_dict = None
+
+        if _memo.maxbytes > 0:
+            parsed = copy.deepcopy({k: getattr(self, k) for k in ['mat_dict', 'trx_ls', 'param_df', 'scores', 'processed_scores', 'dtype', 'param_name', 'behavior_name', 'lengths', 'column_ids', 'column_params']})
+            _memo.put(key, parsed, _nbytes(parsed))
+
+
+
+
+    #methods
+    def _render_inputs(self):
+        """
+        Private method that returns the data the plots of this instance are made from, hashed by the render cache (see `set_render_cache`).
+        """
+
+        return {'trx': self.trx_ls, 'param_df': self.param_df, 'scores': self.scores, 'processed_scores': self.processed_scores, 'chambers': self.chambers, 'param_name': self.param_name}
+
+
+
+    def _persecond(self, table, framerate=30, timestamps=None):
+        """
+        Private method that averages one of the dataframes ('param_df', 'scores' or 'processed_scores') per second with `_persecond`,
+        using the parsed file and the table as the memo cache source so the data is never hashed.
+        """
+
+        return _persecond(getattr(self, table), framerate, timestamps, source=(self._source, table, self.param_name))
+
+
+
+    def _fly_ids(self):
+        """
+        Private method that returns the list of fly ids in the file, in the order of `.chamber_index`.
+        Trx files number the flies from 1 and perframe and score files list them in `.column_ids`.
+        """
+
+        if self.dtype == 'trx':
+            return list(range(1, len(self.trx_ls)+1))
+
+        return [int(i) for i in self.column_ids]
+
+
+
+    def _columns(self, param=None, flies=None):
+        """
+        Private method that returns the positions of the columns of `.param_df` (or `.scores`) of a parameter and/or a list of fly ids from the lookup tables,
+        ordered like flies. Flies without a column are left out.
+        """
+
+        keep = np.ones(len(self.column_ids), dtype=bool) if param == None else self.column_params == param
+        positions = np.nonzero(keep)[0]
+
+        if flies is None:
+            return positions
+
+        lookup = {int(i): pos for i, pos in zip(self.column_ids[positions], positions)}
+
+        return np.array([lookup[int(i)] for i in flies if int(i) in lookup], dtype=np.int64)
+
+
+
+    def _raw_series(self, key):
+        """
+        Private method that returns the list of per fly arrays of the perframe data ('data') or the behavior scores ('scores' or 'postprocessed') without the NaN padding.
+        The arrays are views of the dataframe columns so no data is copied, and this works when `.mat_dict` has been released.
+        """
+
+        df = {'data': self.param_df, 'scores': self.scores, 'postprocessed': self.processed_scores}[key]
+
+        return [df[col].to_numpy()[:self.lengths.get(col, len(df))] for col in df.columns]
+
+
+
+    def detect_chambers(self, nchambers=None, centers=None, names=None):
+        """
+        Method finds the chamber of every fly from its positions (x_mm and y_mm) so `separate_chambers` does not have to be written by hand. See the `detect_chambers` function for the options.
+        names is an optional list of chamber names, by default the chambers are named '1', '2', etc.
+        Sets `.chamber_index`, `.chamber_names` and the `.chambers` dictionary, and returns the dictionary.
+        """
+
+        if self.dtype != 'trx':
+            print("Method does not support this data. Make sure data is from the trx file.")
+            return None
+
+        lengths = [len(i) for i in self.trx_ls]
+        x = np.full((len(self.trx_ls), max(lengths)), np.nan)
+        y = np.full((len(self.trx_ls), max(lengths)), np.nan)
+        for row, trx in enumerate(self.trx_ls):
+            x[row, :lengths[row]] = trx['x_mm'].to_numpy()
+            y[row, :lengths[row]] = trx['y_mm'].to_numpy()
+
+        self.chamber_index = detect_chambers(x, y, nchambers, centers)
+        nchambers = int(self.chamber_index.max()) + 1
+        self.chamber_names = [str(i) for i in names] if names != None else [str(i+1) for i in range(nchambers)]
+        self.chambers = {c: _chamber_flies(self.chamber_index, self.chamber_names, self._fly_ids(), c) for c in self.chamber_names}
+
+        return self.chambers
+
+
+
+    def ragged(self, key='data', firstframes=None):
+        """
+        Method returns the data as a `ragged_array` aligned by absolute frame number instead of the NaN-padded dataframe.
+        For trx files key is the name of a trx field (e.g. 'x_mm') and each fly starts at its firstframe.
+        For behavior scores key is 'scores' (default 'data' also means 'scores') or 'postprocessed' and each fly starts at its tStart, arrays covering the whole movie are cut to tStart to tEnd.
+        For perframe files key is 'data' and the flies start at firstframes, a list of the firstframe of each fly or a trx `struct2df` instance, or 1 if it is not given.
+        """
+
+        if self.dtype == 'trx':
+            cells = [trx[key].to_numpy()[:int(trx['nframes'].iloc[0])] if 'nframes' in trx.columns else trx[key].dropna().to_numpy() for trx in self.trx_ls]
+            starts = [int(trx['firstframe'].iloc[0]) if 'firstframe' in trx.columns else 1 for trx in self.trx_ls]
+            return ragged_array.from_cells(cells, starts, range(1, len(cells)+1))
+
+        if self.dtype == 'scores':
+            cells = self._raw_series('scores' if key == 'data' else key)
+            starts = [1]*len(cells)
+            if self.mat_dict != None and 'tStart' in self.mat_dict['allScores'].keys():
+                starts = [int(i) for i in np.atleast_1d(self.mat_dict['allScores']['tStart'])]
+                ends = [int(i) for i in np.atleast_1d(self.mat_dict['allScores']['tEnd'])]
+                cells = [c[t0-1:t1] if len(c) >= t1 else c for c, t0, t1 in zip(cells, starts, ends)]
+            return ragged_array.from_cells(cells, starts, range(1, len(cells)+1))
+
+        cells = self._raw_series('data')
+        if isinstance(firstframes, struct2df):
+            firstframes = [int(trx['firstframe'].iloc[0]) for trx in firstframes.trx_ls]
+        starts = [int(i) for i in firstframes] if firstframes != None else [1]*len(cells)
+
+        return ragged_array.from_cells(cells, starts, self._fly_ids())
+
+
+
+    def extract_trx_param(self, param, savefile=True, name=''):
+        """
+        Method takes in a parameter name as a string (e.g. 'x', 'dt', etc.) or names (e.g. ['x', 'y']) as a list 
+        from the trx file and loads the .param_df with a dataframe of that per frame parameter for each fly.
+        If the savefile argument is True by default. If it is set to False a csv file will not be saved.
+        There is an optional name argument that will add to the begining of the filename and can be used to save file to different path.
+        """
+
+        if self.dtype == 'trx':
+
+            #formatting parameters
+            paramls = []
+            if isinstance(param, str):
+                paramls.append(param)
+            else:
+                paramls = param
+
+            #changing param name
+            self.param_name = '_'.join(paramls)
+
+            #making extracted param dataframe and its fly id and parameter lookup tables
+            new_d = {}
+            ids = []
+            params = []
+
+            for p in paramls:
+                for idx, i in enumerate(self.trx_ls):
+                    l = i[p].to_numpy()
+                    new_d.update({p + '_' + str(int((i['id'].to_list()[0]))) : l})
+                    ids.append(idx+1)
+                    params.append(p)
+
+            self.param_df = pd.DataFrame(new_d)
+            self.column_ids = np.array(ids, dtype=np.int64)
+            self.column_params = np.array(params, dtype=object)
+
+            if savefile == True:
+                self.param_df.to_csv('{nme}_'.format(nme=name) + '_'.join(paramls) + '.csv', index=False)
+
+        else:
+            print("Method does not support this data. Make sure data is from the trx file.")
+
+
+
+    def save_all_trx(self, name=''):
+        """
+        Method to save a trx csv for each fly. the optional name argument will add to the begining of the filename and can be used to save file to different path.
+        """
+
+        if self.dtype == 'trx':
+
+            for idx, i in enumerate(self.trx_ls):
+                i.to_csv('{nme}_'.format(nme=name) + '_{fly}.csv'.format(fly=str(int(idx+1))), index=False)
+
+        else:
+            print("Method does not support this data. Make sure data is from the trx file.")
+
+
+
+    def save_perframe_or_behavior(self, persecond=False, framerate=30, name='', timestamps=None):
+        """
+        Method saves .param_df, a dataframe of a feature perframe for each fly, to a csv file.
+        There is an optional name argument that will add to the begining of the filename and can be used to save file to different path.
+        With persecond=True the optional timestamps argument (an array, dataframe, or `struct2df` instance of perframe/timestamps.mat) bins by recorded time instead of assuming a constant framerate.
+        """
+
+        if self.dtype == 'perframe':
+            if persecond == True:
+                df_perf = self._persecond('param_df', framerate, timestamps)
+                df_perf.to_csv('{nme}_persecond_'.format(nme=name) + self.param_name + ".csv", index=False)
+            else:
+                self.param_df.to_csv('{nme}_'.format(nme=name) + self.param_name + ".csv", index=False)
+
+        elif self.dtype == 'scores':
+            if persecond == True:
+                df_scores = self._persecond('scores', framerate, timestamps)
+                df_proc = self._persecond('processed_scores', framerate, timestamps)
+                df_scores.to_csv('{nme}_persecond_'.format(nme=name) + self.behavior_name + "_scores.csv", index=False)
+                df_proc.to_csv('{nme}_persecond_'.format(nme=name) + self.behavior_name + "_processed_scores.csv", index=False)
+            else:
+                self.scores.to_csv('{nme}_'.format(nme=name) + self.behavior_name + "_scores.csv", index=False)
+                self.processed_scores.to_csv('{nme}_'.format(nme=name) + self.behavior_name + "_processed_scores.csv", index=False)
+
+        else:
+            print("Method does not support this data. Make sure data is from the perframe directory.")
+
+    
+
+    @_render_cached
+    def plot_tracks(self, bysex=False, burnin=0, plottitle='', saveplot=True, filename='', showplot=False):
+        """
+        Method plots tracks of flies using the x,y coordinates (by pixels or mm).
+        The plot will be made using the mm data if both pixel and mm data have been extracted but will plot the pixel data if mm x and/or y data have not been extracted
+        The optional argument bysex is a boolean argument that indicates whether to color the tracks by the sex of the fly
+        burnin is the starting frame for which the plotting starts. it defaults to zero, the first frame.
+        If `struct2df` was instanciated with a `separate_chambers` dictionary, multiple plots will be generated.
+        """
+
+        if ('x' in self.column_params and 'y' in self.column_params) or ('x_mm' in self.column_params and 'y_mm' in self.column_params):
+
+            #getting the parameter to plot
+            if 'x_mm' in self.column_params and 'y_mm' in self.column_params:
+                measure = 'mm_'
+                units = 'mm'
+                xparam, yparam = 'x_mm', 'y_mm'
+            else:
+                measure = ''
+                units = 'pixels'
+                xparam, yparam = 'x', 'y'
+
+
+            #single chamber data or multi-chamber data in one plot
+            if self.chambers == None:
+
+                #setting up figure
+                fig = _figure(showplot, figsize=(9,9))
+                ax = fig.add_subplot()
+
+                if bysex == True:
+
+                    #plotting x and y coordinates as a line plot
+                    for idx, i in enumerate(self.trx_ls):
+
+                        x = self.param_df.iloc[burnin:, self._columns(xparam, [idx+1])[0]].to_list()
+                        y = self.param_df.iloc[burnin:, self._columns(yparam, [idx+1])[0]].to_list()
+
+                        if 'm' in i['sex'].to_list():
+                            sex = 'm'
+                            colr = 'blue'
+                        elif 'f' in i['sex'].to_list():
+                            sex = 'f'
+                            colr = 'red'
+                        ax.plot(x, y, label = sex, color=colr, alpha=0.7)
+
+                    #formating and showing the plot
+                    handles, labels = ax.get_legend_handles_labels()
+                    by_label = dict(zip(labels, handles))
+                    ax.legend(by_label.values(), by_label.keys(), bbox_to_anchor=(1, 0.5), loc="center left")
+
+                else:
+
+                    #plotting x and y coordinates as a line plot
+                    for idx, i in enumerate(self.trx_ls):
+
+                        x = self.param_df.iloc[burnin:, self._columns(xparam, [idx+1])[0]].to_list()
+                        y = self.param_df.iloc[burnin:, self._columns(yparam, [idx+1])[0]].to_list()
+
+                        ax.plot(x, y, alpha=0.7)
+
+                ax.set_aspect('equal', adjustable='box')
+                ax.set_xlabel('X ({})'.format(units))
+                ax.set_ylabel('Y ({})'.format(units))
+                ax.set_title(plottitle)
+
+                if saveplot:
+                    _savefig('{name}{unit}x_y_tracks.png'.format(name=filename, unit=measure), fig)
+                
+                if showplot:
+                    plt.show()
+
+                plt.close(fig)
+            
+            
+            #separate plots for separate chambers
+            else:
+
+                if bysex == True:
+
+                    #plotting x and y coordinates as a line plot
+                    for cham in list(self.chambers.keys()):
+                        #setting up figure
+                        fig = _figure(showplot, figsize=(9,9))
+                        ax = fig.add_subplot()
+                        for indv in self.chambers[cham]:
+
+                            x = self.param_df.iloc[burnin:, self._columns(xparam, [indv])[0]].to_list()
+                            y = self.param_df.iloc[burnin:, self._columns(yparam, [indv])[0]].to_list()
+
+                            if 'm' in self.trx_ls[int(indv-1)]['sex'].to_list():
+                                sex = 'm'
+                                colr = 'blue'
+                            elif 'f' in self.trx_ls[int(indv-1)]['sex'].to_list():
+                                sex = 'f'
+                                colr = 'red'
+                            ax.plot(x, y, label = sex, color=colr, alpha=0.7)
+
+                        #formating and showing the plot
+                        handles, labels = ax.get_legend_handles_labels()
+                        by_label = dict(zip(labels, handles))
+                        ax.legend(by_label.values(), by_label.keys(), bbox_to_anchor=(1, 0.5), loc="center left")
+                        ax.set_aspect('equal', adjustable='box')
+                        ax.set_xlabel('X ({})'.format(units))
+                        ax.set_ylabel('Y ({})'.format(units))
+                        ax.set_title(plottitle + " Chamber {ch}".format(ch=cham))
+
+                        if saveplot:
+                            _savefig('{name}_Chamber_{ch}_{unit}x_y_tracks.png'.format(name=filename, ch=cham, unit=measure), fig)
+                        
+                        if showplot:
+                            plt.show()
+
+                        plt.close(fig)
+
+
+                else:
+
+                    #plotting x and y coordinates as a line plot
+                    for cham in list(self.chambers.keys()):
+                        #setting up figure
+                        fig = _figure(showplot, figsize=(9,9))
+                        ax = fig.add_subplot()
+                        for indv in self.chambers[cham]:
+
+                            x = self.param_df.iloc[burnin:, self._columns(xparam, [indv])[0]].to_list()
+                            y = self.param_df.iloc[burnin:, self._columns(yparam, [indv])[0]].to_list()
+
+                            ax.plot(x, y, alpha=0.7)
+
+                        ax.set_aspect('equal', adjustable='box')
+                        ax.set_xlabel('X ({})'.format(units))
+                        ax.set_ylabel('Y ({})'.format(units))
+                        ax.set_title(plottitle + " Chamber {ch}".format(ch=cham))
+
+                        if saveplot:
+                            _savefig('{name}_Chamber_{ch}_{unit}x_y_tracks.png'.format(name=filename, ch=cham, unit=measure), fig)
+                        
+                        if showplot:
+                            plt.show()
+
+                        plt.close(fig)
+
+
+
+        else:
+            print("Method does not support this data. Make sure data is from the trx file and x and y corrdinates have been extracted using the .extract_trx_param() method.")
+        
+
+
+    @_render_cached
+    def plot_density(self, resolution=5, burnin=0, plottype="heatmap", chamber="all", plottitle='', showplot=False, saveplot=True, filename='', smooth=None, finebin=0.5):
+        """
+        Method plots the frequency that locations on the arena were occupied by flies using the x_mm and y_mm parameters.
+        A temparary dataframe is made using these parameters and transformed into a 2D histogram. This histogram plots the density either as a heatmap or 3D surface map.
+        The `resolution` defaults to 5 which represents 2D partitions of the arena of size 5mmx5mm. This can be changed to desired resolution.
+        The `burnin` defaults to 0 and can be set to remove the desired number of frames from the beginning of the data. Units are FRAMES!
+        The `plottype` defaults to "heatmap" but can be changed to "3D" for a 3D surface plot. Note that the surface plot is only shown but not automatically saved.
+        The `chamber` defaults to all and will plot all arenas if there are multiple. This can be set to a string which is the name of the chamber you wish to plot.
+        There is no `plottitle` by default but one can be set. The `filename` defaults to "_density_heatmap.png" but additional text can be added to the beginning using the `filename` parameter.
+        The `showplot` and `saveplot` parameters can be set as a bool. Please note that the 3D plot is shown but cannot be saved.
+        The `smooth` parameter defaults to None for the raw histogram. Set it to a distance in mm to plot a smoothed occupancy instead: positions are binned on a fine grid
+        of `finebin` mm (0.5 by default, `resolution` is not used) and blurred with a Gaussian of standard deviation `smooth` mm by FFT convolution, see `smooth_occupancy`.
+        """
+
+        if 'x_mm' in self.column_params and 'y_mm' in self.column_params:
+
+            #selecting flies, all of them or those of one chamber
+            if chamber != "all":
+                flyls = _chamber_flies(self.chamber_index, self.chamber_names, self._fly_ids(), chamber)
+            else:
+                flyls = self._fly_ids()
+
+            #x and y mm positions of the selected flies from the lookup tables, the same fly in the same position of both
+            x = self.param_df.iloc[burnin:, self._columns('x_mm', flyls)].to_numpy().ravel(order='F')
+            y = self.param_df.iloc[burnin:, self._columns('y_mm', flyls)].to_numpy().ravel(order='F')
+
+
+            #smoothed occupancy from one fine histogram of every position
+            if smooth != None:
+                hist_norm, xedges, yedges = smooth_occupancy(x, y, smooth, finebin)
+
+            else:
+                #every position of every fly
+                all_df = pd.DataFrame({'x': x, 'y': y})
+                all_df.dropna(inplace=True)
+
+                #making 2D histogram
+                x_bins = int((all_df['x'].max() - all_df['x'].min()) / resolution)
+                y_bins = int((all_df['y'].max() - all_df['y'].min()) / resolution)
+
+                num_bins = (x_bins, y_bins)
+
+                hist, xedges, yedges = np.histogram2d(all_df['x'], all_df['y'], bins=num_bins)
+
+                #normalize histogram
+                hist_norm = hist/(np.sum(hist))
+
+            #making histogram and plotting
+            if plottype == "heatmap":
+                
+                #Plot the heatmap on its own figure Note: must be transposed because np.histogram2d does not follow normal cartesian convention
+                fig = _figure(showplot)
+                ax = fig.add_subplot()
+                image = ax.imshow(hist_norm.T, cmap='plasma', interpolation='nearest', extent=[xedges[0], xedges[-1], yedges[0], yedges[-1]], origin='lower')
+                cbar = fig.colorbar(image, ax=ax)
+                cbar.set_label('Frequency')
+
+                #labels
+                ax.set_xlabel('X (mm)')
+                ax.set_ylabel('Y (mm)')
+                ax.set_title(plottitle)
+
+                if saveplot:
+                    _savefig('{}_density_heatmap.png'.format(filename), fig)
+
+                if showplot:
+                    plt.show()
+
+                plt.close(fig)
+
+
+
+            elif plottype == "3D":
+                #creating 3D figure
+                fig = _figure(True, figsize=(10, 8))
+                ax = fig.add_subplot(111, projection='3d')
+
+                # Create the X, Y meshgrid with reversed x-axis limits
+                x_, y_ = np.meshgrid(xedges[:-1], yedges[:-1])
+
+                # Plot the 3D surface  Note: must be transposed because np.histogram2d does not follow normal cartesian convention
+                ax.plot_surface(x_, y_, hist_norm.T, cmap='plasma')
+
+                # Set the axis labels
+                ax.set_xlabel('X (mm)')
+                ax.set_ylabel('Y (mm)')
+                ax.set_zlabel('Frequency')
+                ax.set_title(plottitle)
+
+                #Show plot
+                plt.show()
+                plt.close(fig)
+                
+
+            else:
+                print('Incorrect plottype input. Please use either "heatmap" or "3D".')
+
+        else:
+            print("Method does not support this data. Make sure data is from the trx file and x and y corrdinates have been extracted using the .extract_trx_param() method.")
+        
+
+
+
+
+    def _plot_smallmultiples(self, fly, persecond, framerate, scorethreshold, burnin, plottitle, saveplot, filename, showplot, timestamps, ncols):
+        """
+        Private method used by `plot_timeseries` to draw one panel per fly from a single fly x bin array.
+        """
+
+        if self.dtype == 'perframe':
+            things = {'perframe': 'param_df'}
+            ylabel = self.param_name
+        elif self.dtype == 'scores':
+            things = {'scores': 'scores', 'postprocessed': 'processed_scores'}
+            ylabel = self.behavior_name
+        else:
+            print("Method does not support this data. Make sure data is from a perframe or behavior scores file.")
+            return None
+
+        for thing2plot, table in things.items():
+            df = getattr(self, table)
+
+            #selecting flies by column position so the per second table of the whole dataframe is reused from the cache
+            if isinstance(fly, str) and fly == 'all':
+                cols = self._columns()
+            elif isinstance(fly, list):
+                cols = self._columns(flies=fly)
+            elif isinstance(fly, int):
+                cols = self._columns(flies=[fly])
+            else:
+                cols = self._columns(flies=_chamber_flies(self.chamber_index, self.chamber_names, self._fly_ids(), fly))
+
+            if len(cols) == 0:
+                print('Incorrect fly input. Please use "all", a fly id, a list of fly ids or the name of a chamber with flies in this data.')
+                return None
+
+            #one binned fly x bin array for every panel
+            if persecond == True:
+                values = self._persecond(table, framerate, timestamps).iloc[:, cols].to_numpy(dtype=float).T
+                bi = int(burnin / framerate)
+                unit = "Seconds"
+            else:
+                values = df.iloc[:, cols].to_numpy(dtype=float).T
+                bi = burnin
+                unit = "Frames"
+
+            n = len(cols)
+            ncol = ncols if ncols != None else int(np.ceil(np.sqrt(n)))
+            nrow = int(np.ceil(n / ncol))
+            x = np.arange(bi, values.shape[1])
+
+            fig = _figure(showplot, figsize=(2.4*ncol + 1, 1.3*nrow + 1))
+            axes = fig.subplots(nrow, ncol, sharex=True, sharey=True, squeeze=False, gridspec_kw={'hspace': 0.08, 'wspace': 0.05})
+
+            for idx, ax in enumerate(axes.ravel()):
+                if idx >= n:
+                    ax.set_axis_off()
+                    continue
+
+                y = values[idx, bi:]
+                ax.plot(x, y, linewidth=0.6)
+                if thing2plot == 'postprocessed':
+                    ax.fill_between(x, y, alpha=0.5)
+                ax.text(0.01, 0.95, str(self.column_ids[cols[idx]]), transform=ax.transAxes, va='top', fontsize=8)
+
+            if thing2plot == 'postprocessed':
+                axes[0, 0].set_ylim(bottom=scorethreshold if scorethreshold != None else None, top=1)
+            axes[0, 0].set_xlim(left=bi, right=max(values.shape[1], bi+1))
+
+            #ticks only on the outer panels, fixed margins instead of tight_layout which is slow with many panels
+            for ax in axes[:-1].ravel():
+                ax.tick_params(bottom=False)
+            for ax in axes[:, 1:].ravel():
+                ax.tick_params(left=False)
+            fig.subplots_adjust(left=0.8/fig.get_figwidth(), right=0.99, bottom=0.6/fig.get_figheight(), top=1 - 0.4/fig.get_figheight())
+
+            fig.supxlabel(unit)
+            fig.supylabel(ylabel if thing2plot == 'perframe' else '{b} {t}'.format(b=ylabel, t=thing2plot))
+            fig.suptitle(plottitle)
+
+            if saveplot:
+                _savefig('{name}{default}_{thing}_smallmultiples.png'.format(name=filename, default=self.param_name, thing=thing2plot), fig)
+
+            if showplot:
+                plt.show()
+
+            plt.close(fig)
+
+
+
+    @_render_cached
+    def plot_timeseries(self, fly='all', persecond=True, framerate=30, scorethreshold=None, burnin=0, plottitle='', saveplot=True, filename='', showplot=False, timestamps=None, smallmultiples=False, ncols=None):
+        """
+        Plots a line graph of a perframe feature or behavior score. Can plot lines for all flies or select flies.
+        If the type of data is JAABA behavior data, the method outputs a scores and processed scores plots.
+        persecond argment defaults to true to plot data averaged per second. Set to False to plot per frame.
+        framerate defaults to 30 fps. Check the framerate of your experiement and change accordingly.
+        The fly argument defaults to all, but this can be changed to a fly id as an integer, a list of fly ids as integers, or the name of a fly chamber as a string.
+        plottitle and filename are optional arguments. filename adds to the beginning of the filename, there is a default name for the file.
+        Optional arguments to save the plot and show the plot.
+        scorethreshold defaults to None, but change to a float to set a lower limit to the processed behavior score
+        burnin is the starting frame at which the plotting should start. If the plotting is set to seconds the method converts the frame to seconds.
+        timestamps is optional and can be an array, dataframe, or `struct2df` instance of perframe/timestamps.mat. If given, per second data is binned by recorded time instead of the framerate.
+        smallmultiples defaults to False. Set it to True to draw every selected fly in its own panel of one gridded figure with shared axes instead of overlaying them,
+        saved as '{filename}{param}_{thing}_smallmultiples.png' ('perframe', 'scores' or 'postprocessed'). ncols sets the number of columns of the grid, by default it is about square.
+        """
+
+        if smallmultiples:
+            self._plot_smallmultiples(fly, persecond, framerate, scorethreshold, burnin, plottitle, saveplot, filename, showplot, timestamps, ncols)
+            return None
+
+
+        #formatting fly parameter
+        flyls = []
+        if isinstance(fly, list):
+            flyls = fly
+        else:
+            if isinstance(fly, int):
+                flyls.append(fly)
+            elif fly != "all":
+                flyls = _chamber_flies(self.chamber_index, self.chamber_names, self._fly_ids(), fly)
+            else:
+                flyls = None
+            
+
+
+        
+        #setting burnin
+        if persecond == True:
+            bi = int(burnin / framerate)
+        else:
+            bi = burnin
+
+        
+        #getting unit
+        if persecond == True:
+            unit = "Seconds"
+        else:
+            unit = "Frames"
+
+
+        if self.dtype == 'perframe':
+            rawdata = self._raw_series('data')
+            if persecond == True:
+                rawdata = [i.to_numpy() for _, i in self._persecond('param_df', framerate, timestamps).items()]
+            fig = _figure(showplot, figsize=(15,5))
+            ax = fig.add_subplot()
+
+            if fly == 'all':
+                #plotting x and y coordinates as a line plot
+                for idx, i in enumerate(rawdata):
+                    ls = i
+                    ax.plot(ls, label=idx+1)
+
+                #formating and showing the plot
+                handles, labels = ax.get_legend_handles_labels()
+                by_label = dict(zip(labels, handles))
+                ax.legend(by_label.values(), by_label.keys(), loc='center left', bbox_to_anchor=(1, 0.5))
+
+            elif len(flyls) == 1:
+                for i in flyls:
+                    ls = rawdata[int(i)-1]
+                    ax.plot(ls)
+
+            else:
+                for i in flyls:
+                    ls = rawdata[int(i)-1]
+                    ax.plot(ls, label=i)
+
+                #formating and showing the plot
+                handles, labels = ax.get_legend_handles_labels()
+                by_label = dict(zip(labels, handles))
+                ax.legend(by_label.values(), by_label.keys(), loc='center left', bbox_to_anchor=(1, 0.5))
+
+            ax.set_xlim(left=bi, right=len(ls))
+            ax.set_xlabel(unit)
+            ax.set_ylabel(self.param_name)
+            ax.set_title(plottitle)
+
+            if saveplot:
+                _savefig('{name}{default}_perframe_plot.png'.format(name=filename, default=self.param_name), fig)
+            
+            if showplot:
+                plt.show()
+
+            plt.close(fig)
+
+        
+
+
+
+        elif self.dtype == 'scores':
+            for thing2plot in ['scores', 'postprocessed']:
+                rawdata = self._raw_series(thing2plot)
+                if persecond == True:
+                    rawdata = [i.to_numpy() for _, i in self._persecond({'scores': 'scores', 'postprocessed': 'processed_scores'}[thing2plot], framerate, timestamps).items()]
+                fig = _figure(showplot, figsize=(15,5))
+                ax = fig.add_subplot()
+
+                if fly == 'all':
+                    #plotting x and y coordinates as a line plot
+                    for idx, i in enumerate(rawdata):
+                        ls = i
+                        ax.plot(ls, label=idx+1, alpha=0.5)
+                        if thing2plot == 'postprocessed':
+                            ax.fill_between([j for j in range(len(ls))], ls, alpha=0.5)
+                            if scorethreshold != None:
+                                ax.set_ylim(bottom=scorethreshold, top=1)
+                            else:
+                                ax.set_ylim(top=1)
+
+                    #formating and showing the plot
+                    handles, labels = ax.get_legend_handles_labels()
+                    by_label = dict(zip(labels, handles))
+                    leg = ax.legend(by_label.values(), by_label.keys(), loc='center left', bbox_to_anchor=(1, 0.5))
+                    for obj in leg.get_lines():
+                        obj.set_linewidth(5)
+
+                elif len(flyls) == 1:
+                    for i in flyls:
+                        ls = rawdata[int(i)-1]
+                        ax.plot(ls)
+
+                        if thing2plot == 'postprocessed':
+                            ax.fill_between([i for i in range(len(ls))], ls)
+                            if scorethreshold != None:
+                                ax.set_ylim(bottom=scorethreshold, top=1)
+                            else:
+                                ax.set_ylim(top=1)
+                                
+                        
+
+                else:
+                    for i in flyls:
+                        ls = rawdata[int(i)-1]
+                        ax.plot(ls, label=i, alpha=0.5)
+                        if thing2plot == 'postprocessed':
+                            ax.fill_between([i for i in range(len(ls))], ls, alpha=0.5)
+                            if scorethreshold != None:
+                                ax.set_ylim(bottom=scorethreshold, top=1)
+                            else:
+                                ax.set_ylim(top=1)
+
+                    #formating and showing the plot
+                    handles, labels = ax.get_legend_handles_labels()
+                    by_label = dict(zip(labels, handles))
+                    leg = ax.legend(by_label.values(), by_label.keys(), loc='center left', bbox_to_anchor=(1, 0.5))
+                    for obj in leg.get_lines():
+                        obj.set_linewidth(5)
+
+                #scores or postprocessed
+                if thing2plot == 'scores':
+                    ylabelname = ' score'
+                else:
+                    ylabelname = ' processed score'
+
+                ax.set_xlim(left=bi, right=len(ls))
+                ax.set_xlabel(unit)
+                ax.set_ylabel(self.behavior_name + ylabelname)
+                ax.set_title(plottitle)
+
+                if saveplot:
+                    _savefig('{name}{default}_{flies}_{thing}_plot.png'.format(name=filename, default=self.param_name, flies=str(fly), thing=thing2plot), fig)
+                
+                if showplot:
+                    plt.show()
+
+                plt.close(fig)
+
+
+
+
+
+#class for organizing a fly experiment using struct2df instances
+class fly_experiment():
+
+    def __init__(self, structdfls, packbehaviors=False, behavior_threshold=0.5):
+        """
+        Note that this class cannot be imported without also importing struct2df.
+        This class takes in a list of instances of struct2df from the same fly experiment.
+        The instantiation of the class needs the trx.mat file and any other .mat file you want to include.
+        This class will load data into multiple lists and dictionaries which can be referenced and are referenced by methods.
+        The ethogram method needs processed behavior score mat files.
+        The network method needs the dcenter parameter and an optional behavior processed score file.
+        The optional parameter `packbehaviors` defaults to False. Set it to True to store each processed behavior score in `.jaaba_processed` as a bit-packed
+        `behavior_masks` (score >= `behavior_threshold`, NaN frames are False) which uses 64 times less memory than float64. Methods that need the scores unpack them when called.
+        """
+
+        #objects that can be referenced
+        self.trx_ls = []
+        self.trxs = {}
+        self.chambers = None
+        self.chamber_index = np.array([], dtype=np.int64)
+        self.chamber_names = []
+        self.perframes = {} #also includes any extracted parameters from trx
+        self.jaaba_scores = {}
+        self.jaaba_processed = {}
+        self.sex = {}
+        self._mask_cache = {}
+        self._kinematics_cache = {}
+        self._clean_cache = {}
+        self._raw_gaps = {}
+        self.long_gaps = pd.DataFrame()
+        self.qc_events = pd.DataFrame()
+        self._occupancy_cache = {}
+        self._column_index = {}
+
+        #loading data into objects
+        for i in structdfls:
+
+            if i.dtype == 'trx':
+                self.trx_ls = i.trx_ls
+                self.chambers = i.chambers
+                self.chamber_index = i.chamber_index
+                self.chamber_names = i.chamber_names
+
+                for idx, j in enumerate(i.trx_ls):
+                    self.trxs.update({idx+1: j})
+                    self.sex.update({idx+1: j['sex'].to_list()[0]})
+
+                if i.param_df.empty:
+                    continue
+                else:
+                    self.perframes.update({'trx_' + i.param_name: i.param_df})
+                    self._column_index[('perframes', 'trx_' + i.param_name)] = (i.column_params, i.column_ids)
+                
+
+            elif i.dtype == 'perframe':
+                self.perframes.update({i.param_name: i.param_df})
+                self._column_index[('perframes', i.param_name)] = (i.column_params, i.column_ids)
+
+
+            else:
+                self.jaaba_scores.update({i.behavior_name: i.scores})
+                if packbehaviors:
+                    self.jaaba_processed.update({i.behavior_name: behavior_masks.from_frame(i.processed_scores, behavior_threshold, i.column_ids)})
+                else:
+                    self.jaaba_processed.update({i.behavior_name: i.processed_scores})
+                self._column_index[('jaaba_scores', i.behavior_name)] = (i.column_params, i.column_ids)
+                self._column_index[('jaaba_processed', i.behavior_name)] = (i.column_params, i.column_ids)
+
+        #another object that can be referenced (list of fly ids)
+        self.flies = list(self.trxs.keys())
+
+    
+
+    #methods
+    def _render_inputs(self):
+        """
+        Private method that returns the data the plots of this instance are made from, hashed by the render cache (see `set_render_cache`).
+        """
+
+        return {'trx': self.trx_ls, 'perframes': self.perframes, 'jaaba_scores': self.jaaba_scores, 'jaaba_processed': self.jaaba_processed, 'sex': self.sex, 'chambers': self.chambers}
+
+
+
+    def _frame_columns(self, group, name):
+        """
+        Private method that returns the parameter and fly id lookup arrays of the columns of `getattr(self, group)[name]`,
+        from the struct2df instance it was loaded from, or the integer fly id columns of features added later (e.g. by `kinematics`).
+        """
+
+        if (group, name) in self._column_index:
+            return self._column_index[(group, name)]
+
+        frame = getattr(self, group)[name]
+        ids = np.array(frame.ids if isinstance(frame, behavior_masks) else [int(c) for c in frame.columns], dtype=np.int64)
+
+        return np.full(len(ids), name, dtype=object), ids
+
+
+
+    def _fly_arrays(self, group, names=None, aligned=True):
+        """
+        Private method that returns the data of one group ('perframes', 'jaaba_scores' or 'jaaba_processed') as fly x frame arrays.
+        Returns a dictionary of name to (array, list of fly ids of the rows). Extracted trx parameters are split into one array per parameter,
+        e.g. 'trx_x_mm_y_mm' gives 'trx_x_mm' and 'trx_y_mm'. Non-numeric features such as sex are left out.
+        names is an optional list of the names to convert, the others are skipped.
+        With aligned True (default) perframe features are shifted to each fly's trx firstframe so the columns are absolute frames like `._trx_array`,
+        JAABA scores already cover the whole movie and are not shifted. Set aligned to False to keep every fly at column 0 as in the perframe files.
+        """
+
+        #columns each fly is shifted by, from the trx firstframe
+        shifts = dict(zip(self.flies, self._firstframes() - 1)) if aligned and group == 'perframes' and len(self.flies) > 0 else {}
+
+        arrays = {}
+        for name, df in getattr(self, group).items():
+
+            params, colids = self._frame_columns(group, name)
+
+            #splitting extracted trx parameters into one frame per parameter with the parameter lookup array
+            if group == 'perframes' and name.startswith('trx_'):
+                frames = {}
+                for p in dict.fromkeys(params):
+                    positions = np.nonzero(params == p)[0]
+                    frames['trx_' + p] = (df.iloc[:, positions], colids[positions])
+            else:
+                frames = {name: (df, colids)}
+
+            for key, (frame, colids) in frames.items():
+                if names != None and key not in names:
+                    continue
+
+                #packed behaviors are unpacked to 0/1
+                if isinstance(frame, behavior_masks):
+                    arrays[key] = (frame.unpack().astype(np.float32), list(frame.ids))
+                    continue
+
+                values = frame.to_numpy().T
+
+                if values.dtype == bool:
+                    values = values.astype(np.float32)
+                if not np.issubdtype(values.dtype, np.number):
+                    continue
+
+                ids = [int(i) for i in colids]
+                shift = np.array([shifts.get(i, 0) for i in ids], dtype=np.int64)
+                if shift.any():
+                    shifted = np.full((values.shape[0], values.shape[1] + int(shift.max())), np.nan, dtype=np.result_type(values.dtype, np.float16))
+                    for row in range(values.shape[0]):
+                        shifted[row, shift[row]:shift[row] + values.shape[1]] = values[row]
+                    values = shifted
+
+                arrays[key] = (values, ids)
+
+        return arrays
+
+
+
+    def _processed_frame(self, behavior):
+        """
+        Private method that returns the processed scores of a behavior as a frame x fly dataframe, unpacking it if it is stored as a `behavior_masks`.
+        """
+
+        processed = self.jaaba_processed[behavior]
+
+        if isinstance(processed, behavior_masks):
+            return processed.to_frame()
+
+        return processed
+
+
+
+    def _chamber_flies(self, chamber):
+        """
+        Private method that returns the list of fly ids in a chamber using `.chamber_index`.
+        """
+
+        return _chamber_flies(self.chamber_index, self.chamber_names, self.flies, chamber)
+
+
+
+    def _chamber_of(self):
+        """
+        Private method that returns a dictionary of fly id to chamber name, flies in no chamber are left out.
+        """
+
+        return {fly_id: self.chamber_names[c] for fly_id, c in zip(self.flies, self.chamber_index) if c >= 0}
+
+
+
+    def detect_chambers(self, nchambers=None, centers=None, names=None):
+        """
+        Method finds the chamber of every fly from its trx positions (x_mm and y_mm) so `separate_chambers` does not have to be written by hand. See the `detect_chambers` function for the options.
+        names is an optional list of chamber names, by default the chambers are named '1', '2', etc.
+        Sets `.chamber_index` (the integer chamber of each fly in `.flies`, -1 for none), `.chamber_names` and the `.chambers` dictionary which all chamber-aware methods then use, and returns the dictionary.
+        """
+
+        if len(self.trxs) == 0:
+            print("Method does not support this data. Make sure the trx file is loaded.")
+            return None
+
+        self.chamber_index = detect_chambers(self._trx_array('x_mm'), self._trx_array('y_mm'), nchambers, centers)
+        nchambers = int(self.chamber_index.max()) + 1
+        self.chamber_names = [str(i) for i in names] if names != None else [str(i+1) for i in range(nchambers)]
+        self.chambers = {c: self._chamber_flies(c) for c in self.chamber_names}
+        self._occupancy_cache = {}
+
+        return self.chambers
+
+
+
+    def behavior_mask(self, behavior, threshold=0.5):
+        """
+        Method returns the processed scores of a behavior as a bit-packed `behavior_masks` (score >= threshold).
+        If the behaviors were packed when the class was instantiated the stored mask is returned and threshold is ignored.
+        e.g. `(ex.behavior_mask('chase') & ex.behavior_mask('wing_extension')).count()` is the number of frames of chasing while extending a wing for each fly.
+        """
+
+        processed = self.jaaba_processed[behavior]
+
+        if isinstance(processed, behavior_masks):
+            return processed
+
+        return behavior_masks.from_frame(processed, threshold)
+
+
+
+    def time_budget(self, behaviors='all', threshold=0.5, savefile=False, name=''):
+        """
+        Method returns a fly x behavior dataframe of the fraction of frames each fly spends doing each behavior (processed score >= threshold), from popcounts of the packed masks.
+        behaviors defaults to all loaded behaviors but can be the name of one or a few (str or list) behaviors.
+        If the savefile argument is True a csv file will be saved. There is an optional name argument that will add to the begining of the filename.
+        """
+
+        if behaviors == 'all':
+            behaviors = list(self.jaaba_processed.keys())
+        elif isinstance(behaviors, str):
+            behaviors = [behaviors]
+
+        budgets = {}
+        for b in behaviors:
+            mask = self.behavior_mask(b, threshold)
+            budgets[b] = pd.Series(mask.budget(), index=mask.ids)
+
+        df = pd.DataFrame(budgets)
+        df.index.name = 'fly'
+
+        if savefile == True:
+            df.to_csv('{nme}_time_budget.csv'.format(nme=name))
+
+        return df
+
+
+
+    def _timestamps(self, timestamps, ids):
+        """
+        Private method that resolves the timestamps argument of the per second methods to a frame x fly array matching the list of fly ids `ids` of the columns, or None for a constant framerate.
+        'auto' uses the loaded timestamps perframe feature, or the timestamps field of the trx file if there is one.
+        """
+
+        if timestamps is None:
+            return None
+
+        if isinstance(timestamps, str) and timestamps == 'auto':
+            if 'timestamps' in self.perframes.keys():
+                timestamps = self.perframes['timestamps']
+            elif len(self.trx_ls) > 0 and 'timestamps' in self.trx_ls[0].columns:
+                timestamps = self.trx_ls[0]['timestamps']
+            else:
+                print("WARNING: No timestamps are loaded. Using the framerate instead.")
+                return None
+
+        timestamps = _timestamps_array(timestamps)
+
+        #one timestamp column per fly, matched to the fly id of each column
+        if timestamps.ndim == 2 and timestamps.shape[1] > 1:
+            timestamps = timestamps[:, [int(i)-1 for i in ids]]
+
+        return timestamps
+
+
+
+    def stack_timeseries(self, params="all", behavior_scores="all", behavior_processed="all", persecond=False, framerate=30, savefile=False, name='', timestamps=None, columns='string'):
+        """
+        The default behavior of this method is to put every perframe feature including behavior scores into one dataframe that is returned.
+        The params, behavior_scores, and behavior_processed arguments can be set to the name of one or a few (str or list) features instead of all features.
+        These can also be set to None if no parameters from that category are desired.
+        If the savefile argument is False by default. If it is set to True a csv file will be saved.
+        There is an optional name argument that will add to the begining of the filename and can be used to save file to different path.
+        With persecond=True, timestamps can be set to 'auto' to bin by the recorded time of the loaded timestamps perframe feature (or the trx timestamps) instead of the framerate.
+        An array, dataframe, or `struct2df` instance of perframe/timestamps.mat can also be passed.
+        columns defaults to 'string' for the 'velmag_3' / 'x_mm_3' style column names. Set it to 'multiindex' to get (feature, fly) columns instead, see `.table`,
+        then e.g. stackdf['velmag'] is a frame x fly dataframe and stackdf.xs(3, level='fly', axis=1) has every feature of fly 3. Features are NaN-padded to the longest one.
+        """
+
+        #getting lists of features to extract
+        paramls = []
+        scoresls = []
+        processedls = []
+
+        if not isinstance(params, list) and params != 'all' and params != None:
+            paramls.append(params)
+        elif params == 'all':
+            paramls = list(self.perframes.keys())
+        elif params == None:
+            paramls.append("")
+        else:
+            paramls = params
+
+        
+        if not isinstance(behavior_scores, list) and behavior_scores != 'all' and behavior_scores != None:
+            scoresls.append(behavior_scores)
+        elif behavior_scores == 'all':
+            scoresls = list(self.jaaba_scores.keys())
+        elif behavior_scores == None:
+            scoresls.append("")
+        else:
+            scoresls = behavior_scores
+
+
+        if not isinstance(behavior_processed, list) and behavior_processed != 'all' and behavior_processed != None:
+            processedls.append(behavior_processed)
+        elif behavior_processed == 'all':
+            processedls = list(self.jaaba_processed.keys())
+        elif behavior_processed == None:
+            processedls.append("")
+        else:
+            processedls = behavior_processed
+
+        
+        #stacking data
+        if columns == 'multiindex':
+            stackdf = self.table(params, behavior_scores, behavior_processed).to_frame()
+            ids = [i for _, i in stackdf.columns]
+
+        elif columns == 'string':
+            frames = []
+            ids = []
+
+            if params != None:
+                for i in paramls:
+                    df = self.perframes[i]
+
+                    if 'trx' not in i:
+                        df = df.add_prefix(i + '_')
+
+                    frames.append(df)
+                    ids += list(self._frame_columns('perframes', i)[1])
+
+            if behavior_scores != None:
+                for i in scoresls:
+                    frames.append(self.jaaba_scores[i].add_prefix(i + '_score_'))
+                    ids += list(self._frame_columns('jaaba_scores', i)[1])
+
+            if behavior_processed != None:
+                for i in processedls:
+                    frames.append(self._processed_frame(i).add_prefix(i + '_processed_'))
+                    ids += list(self._frame_columns('jaaba_processed', i)[1])
+
+            #one inner join keeps the frames common to all features like the pairwise merges did
+            stackdf = pd.concat(frames, axis=1, join='inner') if len(frames) > 0 else pd.DataFrame()
+
+        else:
+            print('Incorrect columns input. Please use either "string" or "multiindex".')
+            return None
+
+        #per frame or per second
+        if persecond == True:
+            stackdf = _persecond(stackdf, framerate, self._timestamps(timestamps, ids))
+
+        #saving df
+        if savefile == True:
+            superlist = paramls + scoresls + processedls
+            stackdf.to_csv('{nme}_'.format(nme=name) + '_'.join(superlist) + '.csv', index=False)
+        
+        return stackdf
+
+        
+
+    @_render_cached
+    def ethogram(self, burnin=0, scorethreshold=None, fly="all", framerate=30, plottitle="", showplot=False, saveplot=True, filename="", timestamps=None):
+        """
+        Method to plot a pseudo-ethogram of all loaded behaviors for all flies, subset of flies, or single fly.
+        The burnin can be set to the SECOND to start the plot at. Note that this is different from the struct2df method which takes the frame to start at.
+        The average behavior score threshold can also be set, but defaults to zero.
+        The flies defaults to a plot of all flies but can be set to a subset of flies which is input as a list of fly ids as integers or a single fly id as an integer.
+        'm' or 'f' can also be passed to select just male or female flies.
+        You may also pass in the name of a chamber as a string if you wish to plot all flies in one chmaber and if the trx `struct2df` instance contains a separate_chambers dictionary.
+        timestamps defaults to None (constant framerate). Set it to 'auto' or pass timestamps to bin each second by recorded time, see `.stack_timeseries`.
+        """
+
+        #selecting flies
+        flyls = []
+
+        if fly == 'all':
+            for idx in range(len(self.trx_ls)):
+                flyls.append(idx+1)
+            opacity = 0.5
+
+        elif isinstance(fly, list):
+            flyls = fly
+            opacity = 0.5
+
+        elif fly == 'm':
+            for i in self.sex.keys():
+                if self.sex[i] == 'm':
+                    flyls.append(i)
+            flyls.sort()
+            opacity = 0.5
+
+        elif fly == 'f':
+            for i in self.sex.keys():
+                if self.sex[i] == 'f':
+                    flyls.append(i)
+            flyls.sort()
+            opacity = 0.5
+
+        elif isinstance(fly, str):
+            flyls = self._chamber_flies(fly)
+            opacity = 0.5
+
+        else:
+            flyls.append(fly)
+            opacity = 1
+
+
+        #getting behaviors
+        behaviors = list(self.jaaba_processed.keys())
+
+        #ethogram can only plot with more than one behavior, thus this if, else condition
+        if len(behaviors) > 1:
+
+
+            #plotting
+            fig = _figure(showplot, figsize=(20,7))
+            ax = fig.subplots(len(behaviors), 1, sharex='col')
+
+            for i in range(len(behaviors)):
+
+                #averaging dataframe per second
+                framesdf = self._processed_frame(behaviors[i])
+                persec = _persecond(framesdf, framerate, self._timestamps(timestamps, self._frame_columns('jaaba_processed', behaviors[i])[1]))
+
+                for id in flyls:
+
+                    ax[i].plot(persec[id].to_list(), label=id, alpha=opacity)
+                    ax[i].fill_between([i for i in range(len(persec[id].to_list()))], persec[id].to_list(), alpha=opacity)
+                    ax[i].set_ylabel(behaviors[i])
+
+                    if scorethreshold != None:
+                        ax[i].set_ylim(bottom=scorethreshold, top=1)
+                    else:
+                        ax[i].set_ylim(top=1)
+
+            ax[-1].set_xlim(left=burnin, right=len(persec[id].to_list()))
+            ax[-1].set_xlabel("seconds")
+            fig.suptitle(plottitle)
+
+            #formating and showing the plot
+            if len(flyls) != 1:
+                handles, labels = ax[-1].get_legend_handles_labels()
+                by_label = dict(zip(labels, handles))
+                leg = ax[-1].legend(by_label.values(), by_label.keys(), loc='lower center', bbox_to_anchor=(0.5, -0.32), ncol=len(flyls))
+                for obj in leg.get_lines():
+                    obj.set_linewidth(5)
+
+            if showplot:
+                plt.show()
+
+            if saveplot:
+                _savefig('{name}_ethogram_{flies}.png'.format(name=filename, flies=str(fly)), fig)
+
+            plt.close(fig)
+
+
+        else:
+            print("\nWARNING: Only one behavior is present in this instance of `fly_experiment`. `.ethogram` cannot plot with only one behavior.\nPlease use the `.plot_timeseries` method on the `struct2df` instance instead.\n")
+
+
+
+
+
+    @_render_cached
+    def network(self, dist_threshold=float('inf'), behavior=None, behavior_threshold=0.5, burnin=0, framerate=30, chamber="all", plottitle="", showplot=False, saveplot=True, filename="", timestamps=None):
+            """
+            can now pass the chamber name as a string to `chamber`
+            timestamps can be set to 'auto' or passed to bin each second by recorded time, see `.stack_timeseries`
+            """
+
+            #function for sorted() function key
+            def sort_key(lsitem):
+
+                number = re.findall(r'\d+', lsitem)[0]
+
+                return int(number)
+
+
+            #warning message
+            if dist_threshold == float('inf') and behavior == None:
+                print("WARNING: it is not recommended to create a proximity network without a distance threshold set.")
+
+            #getting pairs
+            colnames = list(self.perframes['dcenter'].columns)
+
+            #condition for removing unwanted chambers
+            if chamber == "all":
+                colnames = ['dcenter_' + str(i) for i in colnames]
+            else:
+                colnames = ['dcenter_' + str(i) for i in self._chamber_flies(chamber)]
+
+
+
+            pairs = list(itertools.combinations(colnames, 2))
+            connections = {}
+            for i in pairs:
+                connections.update({i:0})
+
+            
+            #stacking timeseries of dcenter and behavior
+            #making stack per second, dcenter alone is averaged before renaming so repeated calls reuse the cached table
+            if behavior == None:
+                stack = self.perframes['dcenter']
+                stack = _persecond(stack, framerate, self._timestamps(timestamps, self._frame_columns('perframes', 'dcenter')[1])).add_prefix('dcenter_')
+
+            else:
+                stack = self.stack_timeseries(params='dcenter', behavior_scores=[], behavior_processed=behavior)
+                ids = list(self._frame_columns('perframes', 'dcenter')[1]) + list(self._frame_columns('jaaba_processed', behavior)[1])
+                stack = _persecond(stack, framerate, self._timestamps(timestamps, ids))
+
+            stack = stack[burnin:]
+
+
+            #interactions list
+            interactions_raw = []
+
+
+            #single chamber or chamber selection
+            if chamber == "all":
+                #looping through flies
+                for i in self.flies:
+
+                    #empty df
+                    df = pd.DataFrame()
+
+                    #filtering for behavior unless no behavior parameter is given
+                    if behavior != None:
+                        column_name = "{b}_processed_{f}".format(b=behavior,f=str(i))
+                        df = pd.concat([df, stack.loc[stack[column_name] >= behavior_threshold]])
+                    else:
+                        df = pd.concat([df, stack])
+
+                    #new interaction column
+                    df['interactions'] = df.apply(lambda row: [col for col in df.columns if col.startswith('dcenter_') and row[col] == row['dcenter_{f}'.format(f=str(i))] and row[col] <= dist_threshold], axis=1)
+
+                    #adding interactions to list
+                    interactions_raw += df['interactions'].to_list()
+
+            else:
+                #looping through flies
+                for i in self._chamber_flies(chamber):
+
+                    #empty df
+                    df = pd.DataFrame()
+
+                    #filtering for behavior unless no behavior parameter is given
+                    if behavior != None:
+                        column_name = "{b}_processed_{f}".format(b=behavior,f=str(i))
+                        df = pd.concat([df, stack.loc[stack[column_name] >= behavior_threshold]])
+                    else:
+                        df = pd.concat([df, stack])
+
+                    #generating new interaction column
+                    df['interactions'] = df.apply(lambda row: [col for col in df.columns if col.startswith('dcenter_') and row[col] == row['dcenter_{f}'.format(f=str(i))] and row[col] <= dist_threshold], axis=1)
+
+                    #adding interactions to list
+                    interactions_raw += df['interactions'].to_list()
+
+
+
+
+
+
+            #cleaning interactions list
+            interactions = [tuple(sorted(item, key=sort_key)) for item in interactions_raw if len(item) == 2]
+
+            #getting weights based on frequency of interactions (pairwise)
+            for i in interactions:
+                connections[i] += 1
+
+
+
+            #making network df
+            nw_df = pd.DataFrame.from_dict(connections, orient='index', columns=['weight'])
+            nw_df = nw_df.reset_index().rename(columns={'index': 'tuples'})
+
+            
+
+            #nw_df = nw_df.drop(nw_df[nw_df['weight'] == 0].index)
+
+            nw_df[['node1', 'node2']] = nw_df['tuples'].apply(lambda x: pd.Series([x[0], x[1]]))
+            nw_df = nw_df.drop('tuples', axis=1)
+            nw_df = nw_df.replace(to_replace='dcenter_', value='', regex=True)
+            nw_df = nw_df.loc[:,['node1','node2','weight']]
+            
+
+
+            #formatting plot
+            plt.figure(figsize=(8,8))
+            ax = plt.gca()
+            ax.set_title(plottitle)
+
+
+            ###making network
+            # create an empty undirected graph
+            G = nx.Graph()
+
+            #node colors
+            colors = {}
+            for k in self.sex.keys():
+                if self.sex[k] == 'm':
+                    colors.update({k:'blue'})
+                else:
+                    colors.update({k:'red'})
+
+            # add nodes with their respective colors, ordering nodes by fly id
+            nodes = list(set(nw_df['node1']).union(set(nw_df['node2'])))
+            nodes = [int(i) for i in nodes]
+            nodes.sort()
+            nodes = [str(i) for i in nodes]
+
+            for node in nodes:
+                col = colors.get(node, 'gray') # use the color from the dictionary, or default to gray
+                G.add_node(node, color=col)
+            
+
+            # add edges with their respective weights
+            for index, row in nw_df.iterrows():
+                G.add_edge(row['node1'], row['node2'], weight=row['weight'])
+
+            # draw the graph
+            pos = nx.circular_layout(G)
+            weights = [G[u][v]['weight'] for u, v in G.edges()]
+
+            try:
+                nx.draw(G, pos, width=[(w/nw_df['weight'].max())*15 for w in weights], edge_color='gray', node_color=[colors[int(node)] for node in G.nodes()])
+                nx.draw_networkx_labels(G, pos, font_size=12, font_color='white')
+
+                if saveplot:
+                    _savefig('{name}_{d}mm_behavior_{b}_network.png'.format(name=filename, d=str(dist_threshold), b=behavior))
+
+                if showplot:
+                    plt.show()
+
+                plt.close()
+
+            except ZeroDivisionError:
+                plt.close()
+                print("Thresholds set are too strict. No interactions found with these thresholds. Could not generate network.")
+
+
+
+    def summarize(self, params="all", behaviors="all", quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), thresholds=None, groupby=None, burnin=0, savefile=False, name=''):
+        """
+        Method returns one tidy dataframe of summary statistics for every perframe feature and behavior, with one row per fly (or group) and feature.
+        The columns are n (valid frames), mean, sd, min, the `quantiles`, max, nan_fraction, and above_fraction (the fraction of valid frames above the threshold of that feature).
+        params and behaviors can be set to the name of one or a few (str or list) features or behaviors instead of all of them, or None.
+        Behaviors give two features: '{behavior}_score' and '{behavior}_processed'. The default threshold is 0 for scores and 0.5 for processed scores,
+        `thresholds` can be a dictionary of feature name to threshold to set others, e.g. {'velmag': 5}.
+        groupby defaults to None (one row per fly) but can be set to 'chamber' or 'sex' to pool the frames of all flies in each group.
+        burnin is the number of frames to skip at the beginning.
+        Each feature is processed as a single fly x frame array so every statistic of every fly comes from one vectorized pass.
+        If the savefile argument is True a csv file will be saved. There is an optional name argument that will add to the begining of the filename.
+        """
+
+        #copied so the defaults below are not written into the caller's dictionary
+        thresholds = dict(thresholds) if thresholds != None else {}
+
+        #collecting fly x frame arrays of the requested features
+        arrays = {}
+
+        if params != None:
+            perframes = self._fly_arrays('perframes')
+            if params == 'all':
+                params = list(perframes.keys())
+            elif isinstance(params, str):
+                params = [params]
+            arrays.update({k: perframes[k] for k in params if k in perframes})
+
+        if behaviors != None:
+            if behaviors == 'all':
+                behaviors = list(self.jaaba_processed.keys())
+            elif isinstance(behaviors, str):
+                behaviors = [behaviors]
+            scores = self._fly_arrays('jaaba_scores')
+            processed = self._fly_arrays('jaaba_processed')
+            for b in behaviors:
+                if b in scores:
+                    arrays[b + '_score'] = scores[b]
+                    thresholds.setdefault(b + '_score', 0)
+                if b in processed:
+                    arrays[b + '_processed'] = processed[b]
+                    thresholds.setdefault(b + '_processed', 0.5)
+
+        #group of each fly
+        if groupby == 'chamber':
+            if len(self.chamber_names) == 0:
+                print("Method does not support this grouping. Make sure the trx `struct2df` instance was given a separate_chambers dictionary or call `detect_chambers`.")
+                return None
+            group_of = self._chamber_of()
+        elif groupby == 'sex':
+            group_of = dict(self.sex)
+        elif groupby != None:
+            print('Incorrect groupby input. Please use None, "chamber" or "sex".')
+            return None
+
+        tables = []
+        for feature, (values, ids) in arrays.items():
+            values = values[:, burnin:]
+
+            if groupby == None:
+                labels = ids
+                frames = np.full(len(ids), values.shape[1])
+            else:
+                #pooling the frames of each group into one row
+                groups = {}
+                for row, fly_id in enumerate(ids):
+                    if fly_id in group_of:
+                        groups.setdefault(group_of[fly_id], []).append(row)
+                labels = list(groups.keys())
+                frames = np.array([len(i) * values.shape[1] for i in groups.values()])
+                pooled = np.full((len(labels), values.shape[1] * max([len(i) for i in groups.values()] + [0])), np.nan)
+                for g, rows in enumerate(groups.values()):
+                    pooled[g, :len(rows) * values.shape[1]] = values[rows].ravel()
+                values = pooled
+
+            stats = _row_stats(values, quantiles, thresholds.get(feature))
+            #of the frames of each fly or group (not the padding of pooled groups), NaN when there are none
+            stats['nan_fraction'] = np.where(frames > 0, 1 - stats['n'] / np.maximum(frames, 1), np.nan)
+            if 'above_fraction' not in stats:
+                stats['above_fraction'] = np.full(len(labels), np.nan)
+
+            table = pd.DataFrame(stats)
+            table.insert(0, 'feature', feature)
+            table.insert(0, 'fly' if groupby == None else groupby, labels)
+            tables.append(table)
+
+        df = pd.concat(tables, ignore_index=True)
+
+        #adding the group of each fly to the per fly table
+        if groupby == None:
+            if len(self.sex) > 0:
+                df.insert(1, 'sex', df['fly'].map(self.sex))
+            if len(self.chamber_names) > 0:
+                df.insert(1, 'chamber', df['fly'].map(self._chamber_of()))
+
+        if savefile == True:
+            df.to_csv('{nme}_summary.csv'.format(nme=name), index=False)
+
+        return df
+
+
+
+    def distribution(self, feature, fly='all', burnin=0, relative_accuracy=0.01):
+        """
+        Method returns a `running_moments` and a `quantile_sketch` of a perframe feature or behavior ('{behavior}_score' or '{behavior}_processed') pooled over flies.
+        fly defaults to all flies but can be a fly id, a list of fly ids, 'm' or 'f', or the name of a chamber. burnin is the number of frames to skip at the beginning.
+        The accumulators can be saved with `save_accumulator` and merged with those of other experiments or of a `chunked_experiment`.
+        """
+
+        arrays = self._fly_arrays('perframes')
+        arrays.update({k + '_score': v for k, v in self._fly_arrays('jaaba_scores').items()})
+        arrays.update({k + '_processed': v for k, v in self._fly_arrays('jaaba_processed').items()})
+
+        if feature not in arrays:
+            print("Feature {} is not loaded in this instance of `fly_experiment`.".format(feature))
+            return None
+
+        values, ids = arrays[feature]
+
+        #selecting flies
+        if fly == 'all':
+            flyls = ids
+        elif isinstance(fly, list):
+            flyls = fly
+        elif fly in ['m', 'f']:
+            flyls = [i for i in self.sex.keys() if self.sex[i] == fly]
+        elif isinstance(fly, str):
+            flyls = self._chamber_flies(fly)
+        else:
+            flyls = [fly]
+
+        rows = [idx for idx, i in enumerate(ids) if i in flyls]
+        values = values[rows, burnin:]
+
+        moments = running_moments().update(values)
+        sketch = quantile_sketch(relative_accuracy).update(values)
+
+        return moments, sketch
+
+
+
+    def _feature_array(self, feature, aligned=True):
+        """
+        Private method that returns one perframe feature or behavior as a fly x frame array and the list of fly ids of its rows, or None if it is not loaded.
+        Behaviors can be named '{behavior}_score', '{behavior}_processed', or just '{behavior}' for the processed scores. aligned is passed to `._fly_arrays`.
+        """
+
+        if feature.endswith('_score') and feature[:-len('_score')] in self.jaaba_scores.keys():
+            return self._fly_arrays('jaaba_scores', [feature[:-len('_score')]])[feature[:-len('_score')]]
+
+        if feature.endswith('_processed') and feature[:-len('_processed')] in self.jaaba_processed.keys():
+            return self._fly_arrays('jaaba_processed', [feature[:-len('_processed')]])[feature[:-len('_processed')]]
+
+        if feature in self.jaaba_processed.keys():
+            return self._fly_arrays('jaaba_processed', [feature])[feature]
+
+        return self._fly_arrays('perframes', [feature], aligned).get(feature)
+
+
+
+    def _predicate_mask(self, predicate):
+        """
+        Private method that returns the boolean fly x frame mask of one (name, operator, value) predicate with the rows ordered as `.flies`.
+        Frames past the end of a feature and flies without the feature are False. Masks are cached in `._mask_cache` so predicates reused across queries are computed once.
+        """
+
+        if predicate in self._mask_cache:
+            return self._mask_cache[predicate]
+
+        feature, op, value = predicate
+        arr = self._feature_array(feature)
+
+        if arr == None:
+            raise ValueError("Feature {} is not loaded in this instance of `fly_experiment`.".format(feature))
+
+        values, ids = arr
+        ops = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal, '==': np.equal, '!=': np.not_equal}
+
+        #NaN compares False for every operator except != so it is excluded explicitly
+        with np.errstate(invalid='ignore'):
+            fly_mask = ops[op](values, value) & ~np.isnan(values)
+
+        flies = self.flies if len(self.flies) > 0 else ids
+        mask = np.zeros((len(flies), values.shape[1]), dtype=bool)
+        rows = {fly_id: idx for idx, fly_id in enumerate(ids)}
+        for idx, fly_id in enumerate(flies):
+            if fly_id in rows:
+                mask[idx] = fly_mask[rows[fly_id]]
+
+        self._mask_cache[predicate] = mask
+
+        return mask
+
+
+
+    def clear_query_cache(self):
+        """
+        Method empties the cache of predicate masks used by `.query`. Call this if the loaded data is changed.
+        """
+
+        self._mask_cache = {}
+
+
+
+    def query(self, expression, output='bouts', fly='all', burnin=0, minlength=1, savefile=False, name=''):
+        """
+        Method finds the frames where a combination of conditions on perframe features and behaviors is true, for all flies at once.
+        The expression is a string of comparisons joined with 'and' / 'or' ('and' binds first), e.g. 'chase_score > 0.8 and dcenter < 2 and velmag > 5'.
+        Behaviors can be used as '{behavior}_score', '{behavior}_processed', or '{behavior}' (processed). A name on its own means name > 0, e.g. 'chase and wing_extension'.
+        Each comparison is evaluated as a vectorized fly x frame mask and cached, so repeated queries that share comparisons are fast. Use `.clear_query_cache` if the data changes.
+        The output defaults to 'bouts', a dataframe of fly, start, stop (the frame after the bout ends) and length.
+        Set output to 'frames' for a dictionary of fly id to an array of matching frame indices, 'counts' for a dataframe of the number of matching frames and bouts per fly, or 'mask' for the boolean fly x frame array.
+        fly defaults to all flies but can be a fly id, a list of fly ids, 'm' or 'f', or the name of a chamber. burnin is the number of frames to ignore at the beginning.
+        minlength is the minimum bout length in frames for 'bouts' and 'counts'.
+        If the savefile argument is True a csv file is saved for 'bouts' and 'counts'. There is an optional name argument that will add to the begining of the filename.
+        """
+
+        #combining the predicate masks
+        mask = None
+        for clause in _parse_query(expression):
+            clause_mask = None
+            for predicate in clause:
+                pm = self._predicate_mask(predicate)
+                if clause_mask is None:
+                    clause_mask = pm.copy()
+                else:
+                    length = min(clause_mask.shape[1], pm.shape[1])
+                    clause_mask = clause_mask[:, :length] & pm[:, :length]
+
+            if mask is None:
+                mask = clause_mask
+            else:
+                length = max(mask.shape[1], clause_mask.shape[1])
+                combined = np.zeros((mask.shape[0], length), dtype=bool)
+                combined[:, :mask.shape[1]] = mask
+                combined[:, :clause_mask.shape[1]] |= clause_mask
+                mask = combined
+
+        mask[:, :burnin] = False
+
+        #selecting flies
+        flies = self.flies if len(self.flies) > 0 else list(range(1, mask.shape[0]+1))
+        if fly == 'all':
+            flyls = flies
+        elif isinstance(fly, list):
+            flyls = fly
+        elif fly in ['m', 'f']:
+            flyls = [i for i in self.sex.keys() if self.sex[i] == fly]
+        elif isinstance(fly, str):
+            flyls = self._chamber_flies(fly)
+        else:
+            flyls = [fly]
+
+        rows = [idx for idx, i in enumerate(flies) if i in flyls]
+        mask = mask[rows]
+        ids = np.asarray(flies)[rows]
+
+        if output == 'mask':
+            return mask
+
+        if output == 'frames':
+            return {int(ids[idx]): np.flatnonzero(mask[idx]) for idx in range(len(ids))}
+
+        r, b, e = _mask_bouts(mask)
+        bouts = pd.DataFrame({'fly': ids[r], 'start': b, 'stop': e, 'length': e - b})
+        bouts = bouts[bouts['length'] >= minlength].reset_index(drop=True)
+
+        if output == 'bouts':
+            df = bouts
+
+        elif output == 'counts':
+            df = pd.DataFrame({'fly': ids, 'frames': mask.sum(axis=1)})
+            df['bouts'] = df['fly'].map(bouts['fly'].value_counts()).fillna(0).astype(int)
+
+        else:
+            print('Incorrect output input. Please use "bouts", "frames", "counts" or "mask".')
+            return None
+
+        if savefile == True:
+            df.to_csv('{nme}_query_{out}.csv'.format(nme=name, out=output), index=False)
+
+        return df
+
+
+
+    def behavior_matrices(self, behaviors='all', threshold=0.5, groupby=None, burnin=0, skipnone=False, normalize=False, savefile=False, name=''):
+        """
+        Method returns behavior x behavior co-occurrence and first-order transition matrices for every fly, or pooled by group, from the processed behavior scores.
+        Returns a dictionary with two dataframes, 'cooccurrence' and 'transitions'. Each has a (fly or group, behavior) row index and one column per behavior.
+        Co-occurrence counts the frames where both behaviors are on (processed score >= threshold), the diagonal is the number of frames of each behavior.
+        It is computed from popcounts of the bit-packed masks so it is fast for all flies at once.
+        For transitions every frame gets one state: the behavior that is on, the one with the highest JAABA score if several are on (or the first in `behaviors` if scores are not loaded),
+        or 'none'. A transition is counted each time the state of a fly changes. Set skipnone=True to ignore 'none' frames, so a behavior followed by a pause and then another behavior counts as a direct transition.
+        groupby defaults to None (one matrix per fly) but can be set to 'chamber', 'sex' or 'all' to add up the matrices of the flies in each group.
+        Set normalize=True to divide co-occurrence by the number of frames and each row of the transitions by its total (transition probabilities).
+        burnin is the number of frames to skip at the beginning.
+        If the savefile argument is True two csv files will be saved. There is an optional name argument that will add to the begining of the filename.
+        """
+
+        if behaviors == 'all':
+            behaviors = list(self.jaaba_processed.keys())
+        elif isinstance(behaviors, str):
+            behaviors = [behaviors]
+
+        #packed masks of every behavior with the same flies in the same order (`.flies`) and number of frames, flies missing from a file have no frames of its behavior
+        masks = [self.behavior_mask(b, threshold) for b in behaviors]
+        ids = list(self.flies) if len(self.flies) > 0 else list(masks[0].ids)
+        nframes = min([m.nframes for m in masks])
+        if burnin > 0 or any([m.nframes != nframes or list(m.ids) != ids for m in masks]):
+            aligned = []
+            for m in masks:
+                rows = {fly_id: idx for idx, fly_id in enumerate(m.ids)}
+                bits = m.unpack()[:, :nframes]
+                mask = np.zeros((len(ids), nframes), dtype=bool)
+                for idx, fly_id in enumerate(ids):
+                    if fly_id in rows:
+                        mask[idx] = bits[rows[fly_id]]
+                mask[:, :burnin] = False
+                aligned.append(behavior_masks.from_mask(mask, ids))
+            masks = aligned
+
+        #co-occurrence from popcounts, one fly x behavior x behavior array
+        nb = len(behaviors)
+        cooc = np.zeros((len(ids), nb, nb), dtype=np.int64)
+        for a in range(nb):
+            for b in range(a, nb):
+                cooc[:, a, b] = masks[a].cooccurrence(masks[b])
+                cooc[:, b, a] = cooc[:, a, b]
+
+        #state of every frame: 0 is none and behavior k is k+1
+        on = np.stack([m.unpack()[:, burnin:nframes] for m in masks])
+        priority = np.zeros(on.shape, dtype=np.float32)
+        for k, b in enumerate(behaviors):
+            if b in self.jaaba_scores.keys():
+                scores, score_ids = self._fly_arrays('jaaba_scores', [b])[b]
+                scores = scores[:, burnin:nframes]
+                rows = {fly_id: idx for idx, fly_id in enumerate(score_ids)}
+                for idx, fly_id in enumerate(ids):
+                    if fly_id in rows:
+                        priority[k, idx, :scores.shape[1]] = np.nan_to_num(scores[rows[fly_id]], nan=0.0) - np.nanmin(scores) + 1
+            else:
+                priority[k] = nb - k
+        states = np.where(on.any(axis=0), np.argmax(np.where(on, priority, -np.inf), axis=0) + 1, 0)
+
+        #transitions of every fly counted with one bincount
+        nstates = nb + 1
+        if skipnone:
+            rows, cols = np.nonzero(states > 0)
+            seq = states[rows, cols]
+            change = (rows[1:] == rows[:-1]) & (seq[1:] != seq[:-1])
+            flat = rows[1:][change] * nstates * nstates + seq[:-1][change] * nstates + seq[1:][change]
+        else:
+            change = states[:, 1:] != states[:, :-1]
+            rows = np.nonzero(change)[0]
+            flat = rows * nstates * nstates + states[:, :-1][change] * nstates + states[:, 1:][change]
+        trans = np.bincount(flat, minlength=len(ids) * nstates * nstates).reshape(len(ids), nstates, nstates)
+        labels = ['none'] + behaviors
+        if skipnone:
+            trans = trans[:, 1:, 1:]
+            labels = behaviors
+
+        #grouping flies
+        if groupby == None:
+            groups = {i: [idx] for idx, i in enumerate(ids)}
+        elif groupby == 'all':
+            groups = {'all': list(range(len(ids)))}
+        elif groupby == 'sex':
+            groups = {}
+            for idx, i in enumerate(ids):
+                groups.setdefault(self.sex.get(i), []).append(idx)
+        elif groupby == 'chamber' and len(self.chamber_names) > 0:
+            rows = np.array([self.flies.index(i) if i in self.flies else -1 for i in ids])
+            index = np.where(rows >= 0, self.chamber_index[rows], -1)
+            groups = {c: list(np.nonzero(index == code)[0]) for code, c in enumerate(self.chamber_names)}
+        else:
+            print('Incorrect groupby input. Please use None, "all", "sex" or "chamber" (with a separate_chambers dictionary).')
+            return None
+
+        cooc = np.stack([cooc[rows].sum(axis=0) for rows in groups.values()]).astype(np.float64)
+        trans = np.stack([trans[rows].sum(axis=0) for rows in groups.values()]).astype(np.float64)
+
+        if normalize:
+            frames = np.array([len(rows) * (nframes - burnin) for rows in groups.values()], dtype=np.float64)
+            cooc = cooc / frames[:, None, None]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                trans = trans / trans.sum(axis=2, keepdims=True)
+
+        level = 'fly' if groupby == None else groupby
+        cooc_df = pd.DataFrame(cooc.reshape(-1, nb), columns=behaviors,
+                               index=pd.MultiIndex.from_product([list(groups.keys()), behaviors], names=[level, 'behavior']))
+        trans_df = pd.DataFrame(trans.reshape(-1, len(labels)), columns=labels,
+                                index=pd.MultiIndex.from_product([list(groups.keys()), labels], names=[level, 'from']))
+
+        if savefile == True:
+            cooc_df.to_csv('{nme}_cooccurrence.csv'.format(nme=name))
+            trans_df.to_csv('{nme}_transitions.csv'.format(nme=name))
+
+        return {'cooccurrence': cooc_df, 'transitions': trans_df}
+
+
+
+    def directed_network(self, behaviors='all', partner='closestfly_center', threshold=0.5, dist_threshold=float('inf'), distance='dcenter', unit='frames', burnin=0, chamber="all", plot=True, plottitle="", showplot=False, saveplot=True, filename=""):
+        """
+        Method builds a directed interaction network for each behavior from the identity of the closest fly, attributing each behavior frame or bout from the fly doing it (actor) to its partner (target).
+        Returns a dictionary of behavior name to an actor x target dataframe of weights with fly ids as the index and columns.
+        partner is the perframe feature with the id of the partner fly, 'closestfly_center' by default ('closestfly_nose2ell', 'closestfly_ell2nose', etc. also work). It must be loaded.
+        threshold is the processed score threshold of the behaviors. dist_threshold optionally limits interactions to frames where the `distance` perframe feature ('dcenter' by default) is below it.
+        unit defaults to 'frames' to count frames, set it to 'bouts' to count each bout once, attributed to the partner it was closest to for most of the bout.
+        burnin is the number of frames to skip at the beginning. chamber can be set to the name of a chamber to only include its flies.
+        If plot is True a network is drawn for each behavior with arrows from actor to target, edge widths scaled by weight and nodes colored by sex.
+        The plots are saved as '{filename}_{behavior}_directed_network.png' when saveplot is True.
+        """
+
+        if partner not in self.perframes.keys():
+            print("Method does not support this data. Make sure the {} perframe feature is loaded.".format(partner))
+            return None
+
+        if behaviors == 'all':
+            behaviors = list(self.jaaba_processed.keys())
+        elif isinstance(behaviors, str):
+            behaviors = [behaviors]
+
+        targets, ids = self._feature_array(partner)
+        #an all NaN partner feature (e.g. one fly per chamber) has no partner ids
+        nflies = max(ids + [int(np.nanmax(targets))]) if np.isfinite(targets).any() else max(ids)
+        flyls = ids if chamber == "all" else self._chamber_flies(chamber)
+
+        #frames where the pair is close enough
+        close = None
+        if dist_threshold != float('inf'):
+            dist, dist_ids = self._feature_array(distance)
+            close = np.zeros(targets.shape, dtype=bool)
+            for row, fly_id in enumerate(ids):
+                if fly_id in dist_ids:
+                    d = dist[dist_ids.index(fly_id)]
+                    with np.errstate(invalid='ignore'):
+                        close[row, :len(d)] = d[:targets.shape[1]] <= dist_threshold
+
+        networks = {}
+        for b in behaviors:
+            mask = self.behavior_mask(b, threshold)
+            on = np.zeros(targets.shape, dtype=bool)
+            for row, fly_id in enumerate(ids):
+                if fly_id in mask.ids and fly_id in flyls:
+                    m = mask.fly(fly_id)[:targets.shape[1]]
+                    on[row, :len(m)] = m
+            on[:, :burnin] = False
+            if close is not None:
+                on &= close
+            with np.errstate(invalid='ignore'):
+                on &= np.isfinite(targets) & np.isin(np.nan_to_num(targets, nan=0).astype(int), flyls)
+
+            actor_rows, frames = np.nonzero(on)
+            actors = np.asarray(ids)[actor_rows] - 1
+            target = targets[actor_rows, frames].astype(int) - 1
+
+            if unit == 'bouts':
+                #every frame gets the number of its bout, then the most frequent target of each bout is chosen
+                r, starts, stops = _mask_bouts(on)
+                bout_of = np.zeros(on.shape, dtype=np.int64)
+                np.add.at(bout_of, (r, starts), 1)
+                bout_id = (np.cumsum(bout_of.ravel()).reshape(on.shape) - 1)[actor_rows, frames]
+                votes = np.bincount(bout_id * nflies + target, minlength=len(r) * nflies).reshape(len(r), nflies)
+                actors = np.asarray(ids)[r] - 1
+                target = np.argmax(votes, axis=1)
+
+            elif unit != 'frames':
+                print('Incorrect unit input. Please use either "frames" or "bouts".')
+                return None
+
+            weights = np.bincount(actors * nflies + target, minlength=nflies * nflies).reshape(nflies, nflies)
+            df = pd.DataFrame(weights, index=range(1, nflies + 1), columns=range(1, nflies + 1))
+            df = df.loc[flyls, flyls]
+            df.index.name = 'actor'
+            df.columns.name = 'target'
+            networks[b] = df
+
+            if plot:
+                plt.figure(figsize=(8,8))
+                ax = plt.gca()
+                ax.set_title(plottitle + " " + b)
+
+                G = nx.DiGraph()
+                for node in flyls:
+                    G.add_node(node, color='blue' if self.sex.get(node) == 'm' else 'red')
+
+                edges = df.stack()
+                edges = edges[edges > 0]
+                for (u, v), w in edges.items():
+                    G.add_edge(u, v, weight=w)
+
+                pos = nx.circular_layout(G)
+                if len(edges) > 0:
+                    widths = [(G[u][v]['weight']/edges.max())*10 for u, v in G.edges()]
+                else:
+                    widths = []
+                nx.draw(G, pos, width=widths, edge_color='gray', arrows=True, arrowsize=15, connectionstyle='arc3,rad=0.1',
+                        node_color=[G.nodes[n]['color'] for n in G.nodes()])
+                nx.draw_networkx_labels(G, pos, font_size=12, font_color='white')
+
+                if saveplot:
+                    plt.savefig('{name}_{b}_directed_network.png'.format(name=filename, b=b))
+
+                if showplot:
+                    plt.show()
+
+                plt.close()
+
+        return networks
+
+
+
+    def _firstframes(self):
+        """
+        Private method that returns the trx firstframe of every fly in `.flies` (1 if the trx file has none) as an array.
+        """
+
+        return np.array([int(self.trxs[fly_id]['firstframe'].iloc[0]) if 'firstframe' in self.trxs[fly_id].columns else 1 for fly_id in self.flies], dtype=np.int64)
+
+
+
+    def _trx_array(self, param, aligned=True):
+        """
+        Private method that returns one trx parameter (e.g. 'x_mm') as a NaN-padded fly x frame array with the rows ordered as `.flies`.
+        With aligned True (default) the columns are absolute frames (column 0 is frame 1) and each fly starts at its firstframe, so a column is the same moment for every fly.
+        Set aligned to False to start every fly at column 0 like the perframe files, for calculations within one fly.
+        """
+
+        lengths = np.array([len(self.trxs[fly_id]) for fly_id in self.flies], dtype=np.int64)
+        starts = self._firstframes() - 1 if aligned else np.zeros(len(self.flies), dtype=np.int64)
+        values = np.full((len(self.flies), int((starts + lengths).max())), np.nan)
+
+        for row, fly_id in enumerate(self.flies):
+            values[row, starts[row]:starts[row] + lengths[row]] = self.trxs[fly_id][param].to_numpy()
+
+        return values
+
+
+
+    def pairwise_features(self, features='all', chunksize=2**22, precision='float32', directory='', name=''):
+        """
+        Method computes geometric features between every pair of flies in every frame from the trx position and orientation ('x_mm', 'y_mm', 'theta' and 'a_mm').
+        The features are 'nose2tail' (distance in mm from the nose of fly i to the tail of fly j), 'bearing' (angle in radians of fly j's center relative to the heading of fly i)
+        and 'relative_heading' (heading of fly j minus heading of fly i in radians). Angles are wrapped to [-pi, pi). The nose and tail are the ends of the major axis (2*a_mm from the center).
+        features defaults to 'all' but can be set to a list of the features above.
+        The frames of each chamber are processed in chunks of at most chunksize frame x fly x fly elements (2**22 by default, 32 MB per float64 temporary) so memory use does not grow with the number of flies.
+        Flies are only paired within their chamber (see `detect_chambers`), flies in no chamber are left out. Each feature of each chamber is written to
+        '{name}_pairwise_{chamber}_{feature}.npy' in directory as a frame x fly x fly array of precision ('float32' by default, 'float16' halves the size again), so a range of frames
+        is one contiguous read. The chamber is 'all' when no chambers are set and the diagonal (a fly with itself) is NaN.
+        A '{name}_pairwise.json' index with the fly ids and files of every chamber is written next to them which can be opened with `load_pairwise`.
+        Returns the dictionary from `load_pairwise`.
+        """
+
+        if len(self.trxs) == 0:
+            print("Method does not support this data. Make sure the trx file is loaded.")
+            return None
+
+        allfeatures = ['nose2tail', 'bearing', 'relative_heading']
+        if features == 'all':
+            features = allfeatures
+        elif isinstance(features, str):
+            features = [features]
+
+        for feature in features:
+            if feature not in allfeatures:
+                print('Incorrect features input. Please use "all" or a list of "nose2tail", "bearing" and/or "relative_heading".')
+                return None
+
+        x = self._trx_array('x_mm')
+        y = self._trx_array('y_mm')
+        theta = self._trx_array('theta')
+        a = self._trx_array('a_mm')
+        nframes = x.shape[1]
+
+        #rows of the flies of each chamber
+        if len(self.chamber_index) == len(self.flies) and len(self.chamber_names) > 0:
+            blocks = {c: np.nonzero(self.chamber_index == idx)[0] for idx, c in enumerate(self.chamber_names)}
+        else:
+            blocks = {'all': np.arange(len(self.flies))}
+
+        index = {}
+        for chamber, rows in blocks.items():
+            nflies = len(rows)
+
+            #one memory-mapped frame x fly x fly output per feature
+            paths = {feature: os.path.join(directory, '{nme}_pairwise_{c}_{f}.npy'.format(nme=name, c=chamber, f=feature)) for feature in features}
+            stores = {feature: np.lib.format.open_memmap(paths[feature], mode='w+', dtype=precision, shape=(nframes, nflies, nflies)) for feature in features}
+            diagonal = np.eye(nflies, dtype=bool)[None, :, :]
+
+            #frames per chunk so each frame x fly x fly temporary stays under chunksize elements
+            step = max(1, chunksize // max(nflies, 1)**2)
+            for start in range(0, nframes, step):
+                stop = min(start + step, nframes)
+                cx, cy, ct, ca = x[rows, start:stop].T, y[rows, start:stop].T, theta[rows, start:stop].T, a[rows, start:stop].T
+                cos, sin = np.cos(ct), np.sin(ct)
+
+                for feature in features:
+                    if feature == 'nose2tail':
+                        #nose of fly i (rows) to tail of fly j (columns)
+                        nx_, ny_ = cx + 2*ca*cos, cy + 2*ca*sin
+                        tx_, ty_ = cx - 2*ca*cos, cy - 2*ca*sin
+                        out = np.hypot(tx_[:, None, :] - nx_[:, :, None], ty_[:, None, :] - ny_[:, :, None])
+                    elif feature == 'bearing':
+                        out = _wrap_angle(np.arctan2(cy[:, None, :] - cy[:, :, None], cx[:, None, :] - cx[:, :, None]) - ct[:, :, None])
+                    else:
+                        out = _wrap_angle(ct[:, None, :] - ct[:, :, None])
+
+                    stores[feature][start:stop] = np.where(diagonal, np.nan, out)
+
+            for feature in features:
+                stores[feature].flush()
+            del stores
+
+            #the index stores the file names relative to itself so the store can be moved
+            index[chamber] = {'ids': [int(self.flies[i]) for i in rows], 'files': {feature: os.path.basename(paths[feature]) for feature in features}, 'shape': [nframes, nflies, nflies]}
+
+        path = os.path.join(directory, '{nme}_pairwise.json'.format(nme=name))
+        with open(path, 'w') as f:
+            json.dump({'chambers': index, 'dtype': precision}, f)
+
+        return load_pairwise(path)
+
+
+
+    def kinematics(self, features='all', window=30, framerate=30, register=True, velmag=True):
+        """
+        Method derives kinematic features of every fly from the trx data with finite differences so they do not have to be loaded from perframe .mat files.
+        The features are 'speed' (mm/s of the center), 'acceleration' (mm/s^2), 'angular_velocity' (rad/s of theta, wrapped), 'distance_traveled' (cumulative mm)
+        and 'tortuosity' (path length divided by the straight line distance over the last window frames, 30 by default, 1 is a straight path).
+        features defaults to 'all' but can be set to a list of the features above.
+        Frame intervals are taken from the trx 'dt' field, or 1/framerate if it is missing.
+        NaN gaps stay NaN: differences touching a missing frame are NaN, the distance traveled does not grow during a gap and the tortuosity is NaN for windows containing a gap or ending where they started.
+        Like JAABA's velmag, speed and angular velocity are one frame shorter than the trx data and acceleration is two frames shorter (padded with NaN).
+        Returns a dictionary of feature name to a frame x fly dataframe. Results are cached so calling this again is free.
+        If register is True (default) the features are added to `.perframes` so every method can use them by name, and if velmag is True (default)
+        speed is also registered as 'velmag' when velmag.mat was not loaded, so the large velmag.mat file can be skipped.
+        """
+
+        if len(self.trxs) == 0:
+            print("Method does not support this data. Make sure the trx file is loaded.")
+            return None
+
+        allfeatures = ['speed', 'acceleration', 'angular_velocity', 'distance_traveled', 'tortuosity']
+        if features == 'all':
+            features = allfeatures
+        elif isinstance(features, str):
+            features = [features]
+
+        for feature in features:
+            if feature not in allfeatures:
+                print('Incorrect features input. Please use "all" or a list of "speed", "acceleration", "angular_velocity", "distance_traveled" and/or "tortuosity".')
+                return None
+
+        results = {}
+        for feature in features:
+            #the framerate sets the frame intervals when the trx file has no dt
+            key = (feature, window if feature == 'tortuosity' else None, framerate)
+            if key not in self._kinematics_cache:
+                self._kinematics_cache[key] = self._kinematic_feature(feature, window, framerate)
+            results[feature] = self._kinematics_cache[key]
+
+        if register:
+            self.perframes.update(results)
+            if velmag and 'speed' in results and 'velmag' not in self.perframes.keys():
+                self.perframes['velmag'] = results['speed']
+            self.clear_query_cache()
+
+        return results
+
+
+
+    def _kinematic_feature(self, feature, window, framerate):
+        """
+        Private method that computes one feature of `.kinematics` for all flies at once and returns it as a frame x fly dataframe.
+        Every fly starts at row 0 like the perframe files, since the differences are taken within each fly.
+        """
+
+        x = self._trx_array('x_mm', aligned=False)
+        y = self._trx_array('y_mm', aligned=False)
+        nframes = x.shape[1]
+
+        if all('dt' in self.trxs[fly_id].columns for fly_id in self.flies):
+            dt = self._trx_array('dt', aligned=False)[:, :nframes-1]
+        else:
+            dt = np.full((len(self.flies), nframes-1), 1/framerate)
+
+        step = np.hypot(np.diff(x, axis=1), np.diff(y, axis=1))
+
+        if feature == 'speed':
+            values = step / dt
+
+        elif feature == 'acceleration':
+            speed = step / dt
+            values = np.full(speed.shape, np.nan)
+            values[:, :-1] = np.diff(speed, axis=1) / dt[:, 1:]
+
+        elif feature == 'angular_velocity':
+            values = _wrap_angle(np.diff(self._trx_array('theta', aligned=False), axis=1)) / dt
+
+        elif feature == 'distance_traveled':
+            #gaps add nothing but the frames where the position is unknown stay NaN
+            values = np.zeros(x.shape)
+            values[:, 1:] = np.cumsum(np.nan_to_num(step), axis=1)
+            values[np.isnan(x)] = np.nan
+
+        else:
+            #rolling path length and gap counts from cumulative sums
+            path = np.zeros((x.shape[0], nframes))
+            path[:, 1:] = np.cumsum(np.nan_to_num(step), axis=1)
+            gaps = np.zeros((x.shape[0], nframes))
+            gaps[:, 1:] = np.cumsum(np.isnan(step), axis=1)
+
+            values = np.full(x.shape, np.nan)
+            if nframes > window:
+                length = path[:, window:] - path[:, :-window]
+                net = np.hypot(x[:, window:] - x[:, :-window], y[:, window:] - y[:, :-window])
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    values[:, window:] = np.where(((gaps[:, window:] - gaps[:, :-window]) == 0) & (net > 0), length / net, np.nan)
+
+        return pd.DataFrame(values.T.astype(_storage_policy['precision'], copy=False), columns=self.flies)
+
+
+
+    def clean_gaps(self, features=('x_mm', 'y_mm', 'theta'), maxgap=5, method='linear', apply=True, savefile=False, name=''):
+        """
+        Method finds the NaN gaps of trx fields and/or perframe features inside each fly's range of frames and fills the short ones by interpolation for all flies at once.
+        features is a list of trx field names (e.g. 'x_mm', 'theta') and/or loaded perframe feature names (e.g. 'velmag'), ('x_mm', 'y_mm', 'theta') by default.
+        A fly's range is its 'nframes' from the trx file for trx fields and up to its last value for perframe features, NaN padding after it is not counted as a gap.
+        Gaps of at most maxgap frames (5 by default) with data on both sides are filled with method 'linear' (default) or 'spline' (cubic), angles ('theta') are interpolated the short way around.
+        Longer gaps and gaps at the start or end are left as NaN and listed in the `.long_gaps` dataframe (fly, feature, start, stop, length) so analyses can exclude them.
+        If apply is True (default) the cleaned data replaces the data in this instance, in both `.trxs` and `.trx_ls` (the struct2df objects are not changed), so downstream methods use it, and the kinematics, occupancy and query caches are cleared.
+        The cleaning is cached until it is applied so calling this again with the same arguments does no work.
+        The gaps are found once per feature in the data as loaded and the statistics always describe that raw data, also after the cleaning has been applied.
+        Returns a dataframe of gap statistics per fly and feature: frames, missing, gaps, filled_gaps, filled_frames, long_gaps, long_gap_frames, longest_gap.
+        If savefile is True the statistics are saved as '{name}_gap_report.csv'.
+        """
+
+        if isinstance(features, str):
+            features = [features]
+
+        rows = []
+        long_gaps = []
+        for feature in features:
+            key = (feature, maxgap, method)
+
+            if feature not in self._raw_gaps or key not in self._clean_cache:
+                if feature in self.perframes.keys():
+                    values, ids = self._feature_array(feature, aligned=False)
+                elif len(self.trxs) > 0 and feature in self.trxs[self.flies[0]].columns:
+                    values, ids = self._trx_array(feature, aligned=False), list(self.flies)
+                else:
+                    print("Method does not support this data. Make sure {} is a trx field or a loaded perframe feature.".format(feature))
+                    return None
+
+                if feature not in self._raw_gaps:
+                    #range of each fly, from the trx file for trx fields or up to its last value for perframe features (which can be shorter, e.g. velmag)
+                    lastvalue = values.shape[1] - np.argmax(~np.isnan(values[:, ::-1]), axis=1)
+                    if feature in self.perframes.keys() or 'nframes' not in self.trxs[self.flies[0]].columns:
+                        lengths = [int(l) for l in lastvalue]
+                    else:
+                        lengths = [int(min(self.trxs[i]['nframes'].iloc[0], values.shape[1])) for i in ids]
+
+                    #gaps of the raw data, kept apart from the cleaned data for the statistics
+                    filled, r, s, e = _gap_fill(values, lengths, maxgap, method, circular=(feature == 'theta'))
+                    self._raw_gaps[feature] = (ids, lengths, r, s, e)
+                else:
+                    filled = _gap_fill(values, self._raw_gaps[feature][1], maxgap, method, circular=(feature == 'theta'))[0]
+
+                self._clean_cache[key] = filled
+
+            filled = self._clean_cache[key]
+            ids, lengths, r, s, e = self._raw_gaps[feature]
+            gaplengths = e - s
+            islong = (gaplengths > maxgap) | (s == 0) | (e >= np.asarray(lengths)[r])
+
+            for row, fly_id in enumerate(ids):
+                g = gaplengths[r == row]
+                l = islong[r == row]
+                rows.append({'fly': fly_id, 'feature': feature, 'frames': lengths[row], 'missing': int(g.sum()), 'gaps': len(g),
+                             'filled_gaps': int((~l).sum()), 'filled_frames': int(g[~l].sum()), 'long_gaps': int(l.sum()),
+                             'long_gap_frames': int(g[l].sum()), 'longest_gap': int(g.max()) if len(g) > 0 else 0})
+
+            long_gaps.append(pd.DataFrame({'fly': np.asarray(ids)[r[islong]], 'feature': feature, 'start': s[islong], 'stop': e[islong], 'length': gaplengths[islong]}))
+
+            if apply:
+                if feature in self.perframes.keys():
+                    df = self.perframes[feature]
+                    self.perframes[feature] = pd.DataFrame(filled.T[:len(df)].astype(df.dtypes.iloc[0], copy=False), index=df.index, columns=df.columns)
+                else:
+                    #.trx_ls is shared with the struct2df instance so a new list is made, with the same fly in the same position as in .flies
+                    self.trx_ls = list(self.trx_ls)
+                    for row, fly_id in enumerate(ids):
+                        trx = self.trxs[fly_id]
+                        self.trxs[fly_id] = trx.assign(**{feature: pd.Series(filled[row, :len(trx)], index=trx.index).astype(trx[feature].dtype)})
+                        self.trx_ls[self.flies.index(fly_id)] = self.trxs[fly_id]
+
+        self.long_gaps = pd.concat(long_gaps, ignore_index=True)
+
+        #cleaned data in the cache is now the data of this instance
+        if apply:
+            self._clean_cache = {}
+            self._kinematics_cache = {}
+            self._occupancy_cache = {}
+            self.clear_query_cache()
+
+        report = pd.DataFrame(rows)
+
+        if savefile:
+            report.to_csv('{nme}_gap_report.csv'.format(nme=name), index=False)
+
+        return report
+
+
+
+    def track_qc(self, max_speed=100, swap_distance=2, swap_ratio=0.5, wall_distance=1, still_speed=1, wall_seconds=60, framerate=30, chunksize=2**22, savefile=False, name=''):
+        """
+        Method checks the trx tracks for tracking errors before analysis and returns a dataframe with one row of counts per fly.
+        Jumps are frames where the center moves faster than max_speed (mm/s, 100 by default), which flies cannot do.
+        Identity swaps are frames where a fly is within swap_distance mm (2 by default) of its nearest neighbor and exchanging the two flies' next positions would make the summed displacement
+        of the pair less than swap_ratio (0.5 by default) times the tracked one. The nearest neighbor is searched among the flies of the same chamber when chambers are set (see `detect_chambers`).
+        Neighbors are found for all flies at once in chunks of at most chunksize fly x fly x frame elements (2**22 by default) so memory use does not grow with the number of flies.
+        Wall stuck bouts are runs of at least wall_seconds (60 by default) where a fly is within wall_distance mm (1 by default) of the arena wall and slower than still_speed mm/s (1 by default).
+        The distance to the wall is the 'dist_to_wall' perframe feature if it is loaded, otherwise each chamber (see `detect_chambers`) is taken to be the circle enclosing the positions of its flies,
+        or the whole arena when no chambers are set.
+        Frame intervals are taken from the trx 'dt' field, or 1/framerate if it is missing.
+        Every event is listed in the `.qc_events` dataframe (fly, event, start, stop, partner) and the report has the columns
+        fly, frames, jumps, swaps, wall_stuck_bouts, wall_stuck_frames, max_speed and flagged (True if any error was found).
+        If savefile is True the report and events are saved as '{name}_qc_report.csv' and '{name}_qc_events.csv'.
+        """
+
+        if len(self.trxs) == 0:
+            print("Method does not support this data. Make sure the trx file is loaded.")
+            return None
+
+        x = self._trx_array('x_mm')
+        y = self._trx_array('y_mm')
+        nflies, nframes = x.shape
+
+        if all('dt' in self.trxs[fly_id].columns for fly_id in self.flies):
+            dt = self._trx_array('dt')[:, :nframes-1]
+        else:
+            dt = np.full((nflies, nframes-1), 1/framerate)
+
+        dx, dy = np.diff(x, axis=1), np.diff(y, axis=1)
+        speed = np.hypot(dx, dy) / dt
+
+        events = []
+
+        #jumps
+        with np.errstate(invalid='ignore'):
+            jumps = speed > max_speed
+        r, f = np.nonzero(jumps)
+        events.append(pd.DataFrame({'fly': np.asarray(self.flies)[r], 'event': 'jump', 'start': f + 1, 'stop': f + 2, 'partner': np.nan}))
+
+        #identity swaps, checked between each fly and its nearest neighbor
+        swaps = np.zeros((nflies, nframes-1), dtype=bool)
+        partners = np.zeros((nflies, nframes-1), dtype=np.int64)
+        flyrows = np.arange(nflies)[:, None]
+
+        #flies in different chambers can not swap
+        apart = np.eye(nflies, dtype=bool)
+        if len(self.chamber_index) == nflies:
+            apart |= self.chamber_index[:, None] != self.chamber_index[None, :]
+
+        step = max(1, chunksize // nflies**2)
+        for start in range(0, nframes-1, step):
+            stop = min(start + step, nframes-1)
+            cx, cy = x[:, start:stop], y[:, start:stop]
+            nx_, ny_ = x[:, start+1:stop+1], y[:, start+1:stop+1]
+
+            dist = np.hypot(cx[None, :, :] - cx[:, None, :], cy[None, :, :] - cy[:, None, :])
+            dist[apart] = np.inf
+            nearest = np.argmin(np.nan_to_num(dist, nan=np.inf), axis=1)
+            frames = np.arange(stop - start)[None, :]
+            close = dist[flyrows, nearest, frames] < swap_distance
+
+            kept = np.hypot(nx_ - cx, ny_ - cy) + np.hypot(nx_[nearest, frames] - cx[nearest, frames], ny_[nearest, frames] - cy[nearest, frames])
+            swapped = np.hypot(nx_[nearest, frames] - cx, ny_[nearest, frames] - cy) + np.hypot(nx_ - cx[nearest, frames], ny_ - cy[nearest, frames])
+
+            with np.errstate(invalid='ignore'):
+                swaps[:, start:stop] = close & (swapped < swap_ratio*kept)
+            partners[:, start:stop] = nearest
+
+        r, f = np.nonzero(swaps)
+        events.append(pd.DataFrame({'fly': np.asarray(self.flies)[r], 'event': 'swap', 'start': f, 'stop': f + 2, 'partner': np.asarray(self.flies)[partners[r, f]]}))
+
+        #flies stuck at the wall
+        if 'dist_to_wall' in self.perframes.keys():
+            values, ids = self._feature_array('dist_to_wall')
+            wall = np.full((nflies, nframes), np.nan)
+            for row, fly_id in enumerate(self.flies):
+                if fly_id in ids:
+                    d = values[ids.index(fly_id)][:nframes]
+                    wall[row, :len(d)] = d
+        else:
+            #one circle per chamber from the positions of its flies, flies without a chamber share one
+            labels = self.chamber_index if len(self.chamber_index) == nflies else np.zeros(nflies, dtype=np.int64)
+            wall = np.full((nflies, nframes), np.nan)
+            for c in np.unique(labels):
+                rows = labels == c
+                if np.isnan(x[rows]).all():
+                    continue
+                cx, cy = (np.nanmax(x[rows]) + np.nanmin(x[rows]))/2, (np.nanmax(y[rows]) + np.nanmin(y[rows]))/2
+                r_ = np.hypot(x[rows] - cx, y[rows] - cy)
+                wall[rows] = np.nanmax(r_) - r_
+
+        with np.errstate(invalid='ignore'):
+            stuck = (wall[:, 1:] < wall_distance) & (speed < still_speed)
+        r, starts, stops = _mask_bouts(stuck)
+        long = (stops - starts) >= wall_seconds*framerate
+        events.append(pd.DataFrame({'fly': np.asarray(self.flies)[r[long]], 'event': 'wall_stuck', 'start': starts[long] + 1, 'stop': stops[long] + 1, 'partner': np.nan}))
+
+        self.qc_events = pd.concat(events, ignore_index=True)
+
+        stuckframes = np.zeros(nflies, dtype=np.int64)
+        np.add.at(stuckframes, r[long], (stops - starts)[long])
+
+        report = pd.DataFrame({'fly': self.flies,
+                               'frames': (~np.isnan(x)).sum(axis=1),
+                               'jumps': jumps.sum(axis=1),
+                               'swaps': swaps.sum(axis=1),
+                               'wall_stuck_bouts': np.bincount(r[long], minlength=nflies),
+                               'wall_stuck_frames': stuckframes,
+                               'max_speed': np.nanmax(np.where(np.isnan(speed), -np.inf, speed), axis=1)})
+        report['flagged'] = (report[['jumps', 'swaps', 'wall_stuck_bouts']] > 0).any(axis=1)
+
+        if savefile:
+            report.to_csv('{nme}_qc_report.csv'.format(nme=name), index=False)
+            self.qc_events.to_csv('{nme}_qc_events.csv'.format(nme=name), index=False)
+
+        return report
+
+
+
+    def table(self, params="all", behavior_scores="all", behavior_processed="all"):
+        """
+        Method returns the loaded data as a `fly_table`, a feature x fly x frame array with id lookup tables, so selecting a feature, a fly or a chamber is an array index.
+        params, behavior_scores and behavior_processed select the features like in `.stack_timeseries` (a name, a list, 'all' or None).
+        The features are named like in `.query`: perframe names, 'trx_x_mm' style names for extracted trx parameters, '{behavior}_score' and '{behavior}_processed'.
+        """
+
+        def _names(arg, keys):
+            if arg == None:
+                return []
+            if arg == 'all':
+                return list(keys)
+            return [arg] if isinstance(arg, str) else list(arg)
+
+        arrays = {}
+        for group, arg, suffix in [('perframes', params, ''), ('jaaba_scores', behavior_scores, '_score'), ('jaaba_processed', behavior_processed, '_processed')]:
+            keys = []
+            for n in _names(arg, getattr(self, group).keys()):
+                #extracted trx parameters loaded together (e.g. 'trx_x_mm_y_mm') are split into one feature per parameter
+                if group == 'perframes' and n.startswith('trx_') and n in self.perframes.keys():
+                    keys += ['trx_' + p for p in dict.fromkeys(self._frame_columns(group, n)[0]) if 'trx_' + p not in keys]
+                else:
+                    keys.append(n)
+
+            group_arrays = self._fly_arrays(group, keys)
+            for key in keys:
+                if key in group_arrays:
+                    arrays[key + suffix] = group_arrays[key]
+
+        flies = self.flies if len(self.flies) > 0 else sorted({i for _, ids in arrays.values() for i in ids})
+        nframes = max([v.shape[1] for v, _ in arrays.values()], default=0)
+        #integer and bool features (e.g. closestfly_center) are promoted to the smallest float that holds them so they can be NaN padded
+        dtype = np.result_type(*[v.dtype for v, _ in arrays.values()], np.float16) if len(arrays) > 0 else np.float64
+
+        values = np.full((len(arrays), len(flies), nframes), np.nan, dtype=dtype)
+        row = {fly_id: idx for idx, fly_id in enumerate(flies)}
+        for f, (v, ids) in enumerate(arrays.values()):
+            rows = [row[i] for i in ids]
+            values[f, rows, :v.shape[1]] = v
+
+        sex = [self.sex.get(i) for i in flies]
+        index = self.chamber_index if len(self.chamber_index) == len(flies) else np.full(len(flies), -1, dtype=np.int64)
+
+        return fly_table(values, list(arrays.keys()), flies, index, self.chamber_names, sex)
+
+
+
+    def ragged(self, feature):
+        """
+        Method returns a trx field (e.g. 'x_mm') or a loaded feature (named like in `.query`) as a `ragged_array` where each fly starts at its firstframe from the trx file,
+        so flies tracked over different periods are aligned by absolute frame number. e.g. `ex.ragged('velmag').dense(1000, 2000)` is a fly x frame window of absolute frames 1000 to 1999.
+        """
+
+        firstframes = {fly_id: int(trx['firstframe'].iloc[0]) if 'firstframe' in trx.columns else 1 for fly_id, trx in self.trxs.items()}
+
+        if len(self.trxs) > 0 and feature in self.trxs[self.flies[0]].columns:
+            cells = [self.trxs[fly_id][feature].to_numpy()[:int(self.trxs[fly_id]['nframes'].iloc[0])] if 'nframes' in self.trxs[fly_id].columns else self.trxs[fly_id][feature].to_numpy() for fly_id in self.flies]
+            return ragged_array.from_cells(cells, [firstframes[i] for i in self.flies], self.flies)
+
+        arr = self._feature_array(feature, aligned=False)
+        if arr == None:
+            raise ValueError("Feature {} is not loaded in this instance of `fly_experiment`.".format(feature))
+
+        #the padding after the last value of each fly is dropped
+        values, ids = arr
+        lastvalue = values.shape[1] - np.argmax(~np.isnan(values[:, ::-1]), axis=1)
+        lastvalue[np.all(np.isnan(values), axis=1)] = 0
+
+        return ragged_array.from_cells([values[row, :lastvalue[row]] for row in range(len(ids))], [firstframes.get(i, 1) for i in ids], ids)
+
+
+
+    def _aligned_feature(self, feature):
+        """
+        Private method that returns a loaded feature as a fly x frame array with the rows ordered as `.flies` (NaN for flies without it).
+        """
+
+        arr = self._feature_array(feature)
+        if arr == None:
+            raise ValueError("Feature {} is not loaded in this instance of `fly_experiment`.".format(feature))
+
+        values, ids = arr
+        flies = self.flies if len(self.flies) > 0 else ids
+        out = np.full((len(flies), values.shape[1]), np.nan)
+        rows = {fly_id: idx for idx, fly_id in enumerate(ids)}
+        for idx, fly_id in enumerate(flies):
+            if fly_id in rows:
+                out[idx] = values[rows[fly_id]]
+
+        return out, list(flies)
+
+
+
+    def polar_occupancy(self, radial='arena_r', angle='arena_angle', rbins=10, anglebins=36, rmax=None, groupby='fly', burnin=0, plot=False, plottitle='', showplot=False, saveplot=True, filename=''):
+        """
+        Method returns polar occupancy histograms from the perframe features `radial` ('arena_r' by default, 'dist_to_wall' also works) and `angle` ('arena_angle' by default, radians).
+        Each histogram is a `histogram_accumulator` with the radial bins on the first axis and the angle bins on the second, so histograms of different experiments
+        and cohorts can be merged as long as the edges are the same. rbins equal bins go from 0 to rmax (the largest radial value by default, set it to fix the edges across experiments)
+        and anglebins equal bins go from -pi to pi. angle can be None to only bin the radial feature (one angle bin).
+        groupby defaults to 'fly' for a dictionary of fly id to histogram, 'sex', 'chamber' or 'all' give a dictionary of group name to histogram.
+        The histograms of every fly are counted at once with one bincount and groups are the sum of their flies. burnin is the number of frames to skip at the beginning.
+        If plot is True a polar heatmap of the normalized occupancy is drawn for each group and saved as '{filename}_{group}_polar_occupancy.png' when saveplot is True.
+        """
+
+        r, flies = self._aligned_feature(radial)
+        if angle != None:
+            a, _ = self._aligned_feature(angle)
+            nframes = min(r.shape[1], a.shape[1])
+            r, a = r[:, burnin:nframes], a[:, burnin:nframes]
+        else:
+            anglebins = 1
+            r = r[:, burnin:]
+            a = np.zeros(r.shape)
+
+        if rmax == None:
+            rmax = float(np.nanmax(r))
+        redges = np.linspace(0, rmax, rbins + 1)
+        aedges = np.linspace(-np.pi, np.pi, anglebins + 1)
+
+        #bin of every frame of every fly, one bincount with an offset per fly
+        ir = np.clip(np.searchsorted(redges, r, side='right') - 1, 0, rbins - 1)
+        ia = np.clip(np.searchsorted(aedges, _wrap_angle(a), side='right') - 1, 0, anglebins - 1)
+        rows = np.broadcast_to(np.arange(len(flies))[:, None], r.shape)
+        with np.errstate(invalid='ignore'):
+            keep = ~(np.isnan(r) | np.isnan(a)) & (r >= 0) & (r <= rmax)
+        counts = np.bincount((rows[keep]*rbins + ir[keep])*anglebins + ia[keep], minlength=len(flies)*rbins*anglebins).reshape(len(flies), rbins, anglebins)
+
+        #grouping flies
+        if groupby == 'fly':
+            groups = {fly_id: [idx] for idx, fly_id in enumerate(flies)}
+        elif groupby == 'all':
+            groups = {'all': list(range(len(flies)))}
+        elif groupby == 'sex':
+            groups = {}
+            for idx, fly_id in enumerate(flies):
+                groups.setdefault(self.sex.get(fly_id), []).append(idx)
+        elif groupby == 'chamber' and len(self.chamber_names) > 0:
+            groups = {c: [self.flies.index(i) for i in self._chamber_flies(c)] for c in self.chamber_names}
+        else:
+            print('Incorrect groupby input. Please use "fly", "all", "sex" or "chamber" (with chambers set).')
+            return None
+
+        histograms = {}
+        for g, idx in groups.items():
+            acc = histogram_accumulator(redges, aedges)
+            acc.counts = counts[idx].sum(axis=0).astype(np.float64)
+            histograms[g] = acc
+
+        if plot:
+            for g, acc in histograms.items():
+                fig = plt.figure(figsize=(7,6))
+                ax = fig.add_subplot(projection='polar')
+                mesh = ax.pcolormesh(aedges, redges, acc.normalized(), cmap='plasma', shading='flat')
+                cbar = fig.colorbar(mesh, ax=ax)
+                cbar.set_label('Frequency')
+                ax.set_title(plottitle + " {}".format(g))
+
+                if saveplot:
+                    _savefig('{name}_{g}_polar_occupancy.png'.format(name=filename, g=g))
+
+                if showplot:
+                    plt.show()
+
+                plt.close(fig)
+
+        return histograms
+
+
+
+    def radial_profile(self, radial='arena_r', rbins=20, rmax=None, groupby='fly', burnin=0, savefile=False, name=''):
+        """
+        Method returns the radial occupancy profile of each fly or group as a tidy dataframe with the columns group, r_low, r_high, fraction (of the frames in the bin)
+        and density (fraction per mm^2 of the ring, which corrects for outer rings being larger, only for 'arena_r'). A fly that follows the wall has its fraction at the largest radii,
+        with 'dist_to_wall' as `radial` it is at the smallest distances. The profile comes from `.polar_occupancy` with one angle bin, see it for rmax, groupby and burnin.
+        If savefile is True the dataframe is saved as '{name}_{radial}_radial_profile.csv'.
+        """
+
+        histograms = self.polar_occupancy(radial, None, rbins, 1, rmax, groupby, burnin)
+        if histograms == None:
+            return None
+
+        rows = []
+        for g, acc in histograms.items():
+            fraction = acc.normalized()[:, 0]
+            low, high = acc.xedges[:-1], acc.xedges[1:]
+            density = fraction / (np.pi*(high**2 - low**2)) if radial == 'arena_r' else np.full(len(fraction), np.nan)
+            rows.append(pd.DataFrame({'group': g, 'r_low': low, 'r_high': high, 'fraction': fraction, 'density': density}))
+
+        df = pd.concat(rows, ignore_index=True)
+
+        if savefile:
+            df.to_csv('{nme}_{r}_radial_profile.csv'.format(nme=name, r=radial), index=False)
+
+        return df
+
+
+
+    def occupancy_tensor(self, window=1800, resolution=5, bounds=None, fly='all', burnin=0, smooth=None, normalize=True):
+        """
+        Method returns the occupancy of consecutive time windows as a window x x bin x y bin array, with the x and y bin edges and the first frame of each window.
+        All positions (trx x_mm and y_mm) of all flies are binned in one pass with one bincount over (window, x bin, y bin), so no per window loop over the data is needed.
+        window is the number of frames per window (1800, one minute at 30 fps, by default) and resolution the bin size in mm (5 by default, like `struct2df.plot_density`).
+        bounds can be set to (xmin, xmax, ymin, ymax) to fix the grid, by default it is the range of the positions. fly defaults to all but can be a fly id, a list of fly ids, 'm', 'f' or a chamber name.
+        burnin is the number of frames to skip at the beginning. smooth can be set to a distance in mm to blur each window with a Gaussian (see `smooth_occupancy`).
+        normalize defaults to True so each window sums to 1, set it to False for frame counts.
+        Results are cached so plotting or exporting the same tensor again does no work, the cached arrays are returned read-only.
+        """
+
+        if len(self.trxs) == 0:
+            print("Method does not support this data. Make sure the trx file is loaded.")
+            return None
+
+        #selecting flies
+        if fly == 'all':
+            flyls = self.flies
+        elif isinstance(fly, list):
+            flyls = fly
+        elif fly in ['m', 'f']:
+            flyls = [i for i in self.flies if self.sex.get(i) == fly]
+        elif isinstance(fly, str):
+            flyls = self._chamber_flies(fly)
+        else:
+            flyls = [fly]
+        rows = [self.flies.index(i) for i in flyls]
+
+        #keyed on the flies themselves so a chamber name still resolves to its current flies after `detect_chambers`
+        key = (window, resolution, tuple(bounds) if bounds != None else None, tuple(int(i) for i in flyls), burnin, smooth, normalize)
+        if key in self._occupancy_cache:
+            return self._occupancy_cache[key]
+
+        x = self._trx_array('x_mm')[rows, burnin:]
+        y = self._trx_array('y_mm')[rows, burnin:]
+
+        if bounds == None:
+            bounds = (np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y))
+        x_bins = max(int((bounds[1] - bounds[0]) / resolution), 1)
+        y_bins = max(int((bounds[3] - bounds[2]) / resolution), 1)
+        xedges = np.linspace(bounds[0], bounds[1], x_bins + 1)
+        yedges = np.linspace(bounds[2], bounds[3], y_bins + 1)
+        nwindows = int(np.ceil(x.shape[1] / window))
+
+        #window, x bin and y bin of every position then one bincount over all three
+        t = np.broadcast_to(np.arange(x.shape[1])[None, :] // window, x.shape)
+        ix = np.clip(np.searchsorted(xedges, x, side='right') - 1, 0, x_bins - 1)
+        iy = np.clip(np.searchsorted(yedges, y, side='right') - 1, 0, y_bins - 1)
+        with np.errstate(invalid='ignore'):
+            keep = ~(np.isnan(x) | np.isnan(y)) & (x >= bounds[0]) & (x <= bounds[1]) & (y >= bounds[2]) & (y <= bounds[3])
+        tensor = np.bincount((t[keep]*x_bins + ix[keep])*y_bins + iy[keep], minlength=nwindows*x_bins*y_bins).reshape(nwindows, x_bins, y_bins).astype(np.float64)
+
+        if smooth != None:
+            tensor = np.stack([_gaussian_smooth(w, smooth / resolution) for w in tensor])
+
+        if normalize:
+            totals = tensor.sum(axis=(1, 2), keepdims=True)
+            tensor = np.divide(tensor, totals, out=np.zeros_like(tensor), where=totals > 0)
+
+        starts = burnin + window*np.arange(nwindows)
+        for a in (tensor, xedges, yedges, starts):
+            a.flags.writeable = False
+        self._occupancy_cache[key] = (tensor, xedges, yedges, starts)
+
+        return self._occupancy_cache[key]
+
+
+
+    @_render_cached
+    def animate_occupancy(self, window=1800, resolution=5, bounds=None, fly='all', burnin=0, smooth=None, framerate=30, export='gif', fps=5, plottitle='', filename=''):
+        """
+        Method exports the windows of `.occupancy_tensor` (see it for window, resolution, bounds, fly, burnin and smooth) as an animation or a series of images.
+        export defaults to 'gif' ('{filename}_occupancy.gif' with Pillow), 'mp4' needs ffmpeg and 'frames' saves one '{filename}_occupancy_0000.png' per window.
+        The figure is drawn once and only the image data and title are updated for each window (blitting), with one color scale for all windows. fps is the number of windows per second of animation.
+        framerate is used to label each window with its start time in seconds. Returns the list of files saved.
+        The exported files are recorded by the render cache (see `set_render_cache`) and `render_batch` like the saved figures of the plot methods.
+        """
+
+        result = self.occupancy_tensor(window, resolution, bounds, fly, burnin, smooth)
+        if result == None:
+            return None
+        tensor, xedges, yedges, starts = result
+
+        fig, ax = plt.subplots(figsize=(7,6))
+        image = ax.imshow(tensor[0].T, cmap='plasma', interpolation='nearest', extent=[xedges[0], xedges[-1], yedges[0], yedges[-1]], origin='lower', vmin=0, vmax=max(tensor.max(), 1e-12))
+        cbar = fig.colorbar(image, ax=ax)
+        cbar.set_label('Frequency')
+        ax.set_xlabel('X (mm)')
+        ax.set_ylabel('Y (mm)')
+        label = ax.text(0.02, 0.97, '', transform=ax.transAxes, va='top', color='white')
+        ax.set_title(plottitle)
+
+        def _update(idx):
+            image.set_data(tensor[idx].T)
+            label.set_text('{:.0f} s'.format(starts[idx] / framerate))
+            return image, label
+
+        files = []
+        if export == 'frames':
+            for idx in range(len(tensor)):
+                _update(idx)
+                path = '{name}_occupancy_{i:04d}.png'.format(name=filename, i=idx)
+                _savefig(path, fig)
+                files.append(path)
+
+        elif export in ['gif', 'mp4']:
+            anim = animation.FuncAnimation(fig, _update, frames=len(tensor), blit=True)
+            path = '{name}_occupancy.{ext}'.format(name=filename, ext=export)
+            anim.save(path, writer=animation.PillowWriter(fps=fps) if export == 'gif' else animation.FFMpegWriter(fps=fps))
+            _recordfig(path)
+            files.append(path)
+
+        else:
+            print('Incorrect export input. Please use "gif", "mp4" or "frames".')
+
+        plt.close(fig)
+
+        return files
+
+
+
+
+
+
+
+#class for holding the data of a fly experiment in one array with id lookup tables
+class fly_table():
+
+    def __init__(self, values, features, ids, chamber_index=None, chamber_names=None, sex=None):
+        """
+        This class holds fly data as a feature x fly x frame array `.values` with lookup tables from feature name and fly id to their position,
+        so selecting a feature, a fly, a chamber or a sex is an array index instead of building and parsing column names. Use `fly_experiment.table` to make one.
+        `.feature(name)` is a fly x frame view, `.fly(id)` is a feature x frame view, `.select` takes any combination of features and flies (a list, 'm', 'f' or a chamber name),
+        `.to_frame()` gives a dataframe with (feature, fly) MultiIndex columns and `.to_wide()` the old 'velmag_3' style string columns.
+        """
+
+        #fly_table objects
+        self.values = values
+        self.features = list(features)
+        self.ids = np.asarray(ids)
+        self.chamber_index = np.asarray(chamber_index) if chamber_index is not None else np.full(len(self.ids), -1, dtype=np.int64)
+        self.chamber_names = list(chamber_names) if chamber_names != None else []
+        self.sex = np.asarray(sex, dtype=object) if sex != None else np.full(len(self.ids), None, dtype=object)
+        self._feature_idx = {f: idx for idx, f in enumerate(self.features)}
+        self._fly_idx = {int(i): idx for idx, i in enumerate(self.ids)}
+
+
+
+    def feature(self, name):
+        """
+        Method returns one feature as a fly x frame view with the rows ordered as `.ids`.
+        """
+
+        return self.values[self._feature_idx[name]]
+
+
+
+    def fly(self, fly_id):
+        """
+        Method returns every feature of one fly as a feature x frame view with the rows ordered as `.features`.
+        """
+
+        return self.values[:, self._fly_idx[int(fly_id)]]
+
+
+
+    def _fly_rows(self, flies):
+        """
+        Private method that converts 'all', a fly id, a list of fly ids, 'm', 'f' or a chamber name into an array of rows.
+        """
+
+        if isinstance(flies, str) and flies == 'all':
+            return np.arange(len(self.ids))
+        if isinstance(flies, str) and flies in ['m', 'f']:
+            return np.nonzero(self.sex == flies)[0]
+        if isinstance(flies, str):
+            if flies not in self.chamber_names:
+                raise ValueError("Chamber {} does not exist. The chambers are {}.".format(flies, self.chamber_names))
+            return np.nonzero(self.chamber_index == self.chamber_names.index(flies))[0]
+        if np.isscalar(flies):
+            flies = [flies]
+
+        return np.array([self._fly_idx[int(i)] for i in flies], dtype=np.int64)
+
+
+
+    def select(self, features='all', flies='all'):
+        """
+        Method returns a new `fly_table` with a subset of the features (a name or list) and flies (a fly id, a list of fly ids, 'm', 'f' or a chamber name).
+        """
+
+        if features == 'all':
+            frows = np.arange(len(self.features))
+        else:
+            features = [features] if isinstance(features, str) else features
+            frows = np.array([self._feature_idx[f] for f in features], dtype=np.int64)
+        rows = self._fly_rows(flies)
+
+        return fly_table(self.values[np.ix_(frows, rows)], [self.features[i] for i in frows], self.ids[rows], self.chamber_index[rows], self.chamber_names, list(self.sex[rows]))
+
+
+
+    def to_frame(self):
+        """
+        Method returns a frame x (feature, fly) dataframe, e.g. df['velmag'] is a frame x fly dataframe and df[('velmag', 3)] is one fly.
+        """
+
+        columns = pd.MultiIndex.from_product([self.features, [int(i) for i in self.ids]], names=['feature', 'fly'])
+
+        return pd.DataFrame(self.values.reshape(len(self.features)*len(self.ids), -1).T, columns=columns)
+
+
+
+    def to_wide(self):
+        """
+        Method returns the compatibility view with one string column per feature and fly like `fly_experiment.stack_timeseries`,
+        e.g. 'velmag_3', 'chase_score_3' and 'x_mm_3' for the extracted trx parameter 'trx_x_mm'.
+        """
+
+        df = self.to_frame()
+        df.columns = ['{f}_{i}'.format(f=f[4:] if f.startswith('trx_') else f, i=i) for f, i in df.columns]
+
+        return df
+
+
+
+
+
+
+
+#class for ragged per fly data aligned by absolute frame number
+class ragged_array():
+
+    def __init__(self, values, offsets, starts, ids):
+        """
+        This class stores per fly data of different lengths without NaN padding: one concatenated `.values` buffer, `.offsets` where fly i is values[offsets[i]:offsets[i+1]],
+        the absolute frame number of the first value of each fly `.starts` (JAABA's firstframe or tStart, 1-based) and the fly `.ids`.
+        Flies tracked for a short time only take up their own frames and frames are aligned by absolute frame number instead of by position in the array.
+        Use `ragged_array.from_cells`, `struct2df.ragged` or `fly_experiment.ragged` to make one, and `.dense` to get a rectangular window.
+        """
+
+        #ragged_array objects
+        self.values = np.asarray(values)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ids = [int(i) for i in ids]
+        self._fly_idx = {i: idx for idx, i in enumerate(self.ids)}
+
+
+
+    @classmethod
+    def from_cells(cls, cells, starts, ids=None, dtype=None):
+        """
+        Class method that builds a `ragged_array` from a list of per fly arrays and the absolute frame of the first value of each. ids defaults to 1, 2, 3, ...
+        """
+
+        cells = [np.asarray(c, dtype=dtype).ravel() for c in cells]
+        offsets = np.zeros(len(cells) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(c) for c in cells])
+        values = np.concatenate(cells) if len(cells) > 0 else np.array([], dtype=dtype if dtype != None else np.float64)
+
+        return cls(values, offsets, starts, ids if ids is not None else range(1, len(cells)+1))
+
+
+
+    @property
+    def lengths(self):
+        """
+        The number of frames of each fly.
+        """
+
+        return np.diff(self.offsets)
+
+
+
+    @property
+    def stops(self):
+        """
+        The absolute frame after the last frame of each fly.
+        """
+
+        return self.starts + self.lengths
+
+
+
+    def fly(self, fly_id):
+        """
+        Method returns the values of one fly as a view (no copy) without padding. Its first value is at absolute frame `.starts` of that fly.
+        """
+
+        idx = self._fly_idx[int(fly_id)]
+
+        return self.values[self.offsets[idx]:self.offsets[idx+1]]
+
+
+
+    def dense(self, start=None, stop=None, flies='all'):
+        """
+        Method returns a rectangular fly x frame window covering absolute frames start to stop (exclusive), NaN where a fly has no data.
+        start and stop default to the first and last tracked frame of any fly, flies defaults to all but can be a list of fly ids.
+        Only the window is allocated so a short window of a long recording is cheap.
+        """
+
+        rows = np.arange(len(self.ids)) if isinstance(flies, str) and flies == 'all' else np.array([self._fly_idx[int(i)] for i in flies], dtype=np.int64)
+        start = int(self.starts[rows].min()) if start == None else int(start)
+        stop = int(self.stops[rows].max()) if stop == None else int(stop)
+
+        dtype = self.values.dtype if np.issubdtype(self.values.dtype, np.floating) else np.float64
+        window = np.full((len(rows), max(stop - start, 0)), np.nan, dtype=dtype)
+
+        #overlap of each fly with the window, copied as one slice per fly
+        lo = np.maximum(self.starts[rows], start)
+        hi = np.minimum(self.stops[rows], stop)
+        for out, (idx, a, b) in enumerate(zip(rows, lo, hi)):
+            if b > a:
+                first = self.offsets[idx] + a - self.starts[idx]
+                window[out, a - start:b - start] = self.values[first:first + b - a]
+
+        return window
+
+
+
+    def to_frame(self, start=None, stop=None, flies='all'):
+        """
+        Method returns `.dense` as a frame x fly dataframe indexed by absolute frame number with the fly ids as columns.
+        """
+
+        rows = self.ids if isinstance(flies, str) and flies == 'all' else [int(i) for i in flies]
+        window = self.dense(start, stop, rows)
+        start = int(min(self.starts[[self._fly_idx[i] for i in rows]])) if start == None else int(start)
+
+        return pd.DataFrame(window.T, index=pd.RangeIndex(start, start + window.shape[1], name='frame'), columns=rows)
+
+
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used by the values buffer, offsets and starts.
+        """
+
+        return self.values.nbytes + self.offsets.nbytes + self.starts.nbytes
+
+
+
+
+
+
+
+#class for sharing the arrays of a fly experiment between processes
+class shared_experiment():
+
+    def __init__(self, experiment, backend='shm', directory='', include='all'):
+        """
+        This class takes in an instance of `fly_experiment` and publishes its perframe features and behavior scores as fly x frame arrays that other processes can attach to without copying.
+        With the default `backend` of 'shm' the arrays are placed in `multiprocessing.shared_memory` blocks.
+        Set `backend` to 'memmap' to write the arrays as .npy files in `directory` which are then memory-mapped by the workers, this also works across separate jobs on the same node.
+        `include` defaults to 'all' but can be set to a list of the groups to publish: 'perframes', 'jaaba_scores' and/or 'jaaba_processed'.
+        Extracted trx parameters are published as one array per parameter, e.g. 'trx_x_mm_y_mm' becomes 'trx_x_mm' and 'trx_y_mm'. Non-numeric features such as sex are skipped.
+        The `.spec` dictionary is all a worker needs, pass it to `attach_shared` or use the `.map` method.
+        Call `.close()` when finished to release the shared memory or remove the files.
+        """
+
+        if backend not in ['shm', 'memmap']:
+            raise ValueError('Incorrect backend input. Please use either "shm" or "memmap".')
+
+        if include == 'all':
+            include = ['perframes', 'jaaba_scores', 'jaaba_processed']
+
+        #shared_experiment objects
+        self.backend = backend
+        self.directory = directory
+        self.chambers = experiment.chambers
+        self.chamber_index = experiment.chamber_index
+        self.chamber_names = experiment.chamber_names
+        self.flies = list(experiment.flies)
+        self.spec = {'backend': backend, 'arrays': {}}
+        self._segments = []
+        self._paths = []
+
+        #publishing each group of dataframes
+        for group in include:
+            self.spec['arrays'][group] = {}
+
+            for key, (values, ids) in experiment._fly_arrays(group).items():
+                self.spec['arrays'][group][key] = self._publish(group, key, np.ascontiguousarray(values), ids)
+
+
+
+    def _publish(self, group, name, values, ids):
+        """
+        Private method that copies one fly x frame array into a shared memory block or a .npy file and returns its spec entry.
+        """
+
+        entry = {'shape': values.shape, 'dtype': values.dtype.str, 'ids': ids}
+
+        if self.backend == 'shm':
+            seg = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            np.ndarray(values.shape, dtype=values.dtype, buffer=seg.buf)[:] = values
+            self._segments.append(seg)
+            entry['name'] = seg.name
+
+        else:
+            path = os.path.join(self.directory, '{g}__{n}.npy'.format(g=group, n=name))
+            mm = np.lib.format.open_memmap(path, mode='w+', dtype=values.dtype, shape=values.shape)
+            mm[:] = values
+            mm.flush()
+            del mm
+            self._paths.append(path)
+            entry['path'] = path
+
+        return entry
+
+
+
+    def attach(self):
+        """
+        Method returns read-only views of the published arrays in the current process. See `attach_shared`.
+        """
+
+        return attach_shared(self.spec)
+
+
+
+    def map(self, func, by='fly', items='all', processes=None):
+        """
+        Method maps a function over flies or chambers using a process pool where every worker reads the shared arrays zero-copy.
+        The function must be importable by the workers (defined at module level) and take two arguments: the fly id or chamber name and a dictionary of its data.
+        The data dictionary has the same layout as `.spec['arrays']`, e.g. data['perframes']['velmag'].
+        With `by`='fly' (default) each value is a 1D array of that fly, with `by`='chamber' each value is a fly x frame array of the flies in that chamber.
+        `items` defaults to all flies or all chambers but can be set to a list. `processes` defaults to the number of cores, set it to 1 to run in the current process.
+        Returns a dictionary of results keyed by fly id or chamber name.
+        """
+
+        #getting the flies of each item
+        if by == 'fly':
+            if items == 'all':
+                items = self.flies
+            tasks = [(func, int(i), [int(i)]) for i in items]
+
+        elif by == 'chamber':
+            if len(self.chamber_names) == 0:
+                print("Method does not support this data. Make sure the trx `struct2df` instance was given a separate_chambers dictionary or call `detect_chambers`.")
+                return None
+            if items == 'all':
+                items = self.chamber_names
+            tasks = [(func, str(i), _chamber_flies(self.chamber_index, self.chamber_names, self.flies, i)) for i in items]
+
+        else:
+            print('Incorrect by input. Please use either "fly" or "chamber".')
+            return None
+
+        #running in this process or in a pool
+        if processes == 1:
+            _shared_worker_init(self.spec)
+            results = [_shared_worker_task(t) for t in tasks]
+        else:
+            with mp.Pool(processes, initializer=_shared_worker_init, initargs=(self.spec,)) as pool:
+                results = pool.map(_shared_worker_task, tasks)
+
+        return dict(zip([t[1] for t in tasks], results))
+
+
+
+    def close(self):
+        """
+        Method releases the published arrays. Shared memory blocks are unlinked and memory-mapped files are removed.
+        Views that were attached in other processes become invalid after this is called.
+        """
+
+        for seg in self._segments:
+            _attached_segments.pop(seg.name, None)
+            seg.close()
+            seg.unlink()
+
+        for path in self._paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+        self._segments = []
+        self._paths = []
+
+
+
+    def __enter__(self):
+        return self
 
-                # Create the X, Y meshgrid with reversed x-axis limits
-                x_, y_ = np.meshgrid(xedges[:-1], yedges[:-1])
 
-                # Plot the 3D surface  Note: must be transposed because np.histogram2d does not follow normal cartesian convention
-                ax.plot_surface(x_, y_, hist_norm.T, cmap='plasma')
+    def __exit__(self, *args):
+        self.close()
 
-                # Set the axis labels
-                ax.set_xlabel('X (mm)')
-                ax.set_ylabel('Y (mm)')
-                ax.set_zlabel('Frequency')
-                plt.title(plottitle)
 
-                #Show plot
-                plt.show()
-                
 
-            else:
-                print('Incorrect plottype input. Please use either "heatmap" or "3D".')
 
-        else:
-            print("Method does not support this data. Make sure data is from the trx file and x and y corrdinates have been extracted using the .extract_trx_param() method.")
-        
 
 
 
+#class for accumulating 2D occupancy histograms chunk by chunk
+class histogram_accumulator():
 
-    def plot_timeseries(self, fly='all', persecond=True, framerate=30, scorethreshold=None, burnin=0, plottitle='', saveplot=True, filename='', showplot=False):
+    def __init__(self, xedges, yedges):
         """
-        Plots a line graph of a perframe feature or behavior score. Can plot lines for all flies or select flies.
-        If the type of data is JAABA behavior data, the method outputs a scores and processed scores plots.
-        persecond argment defaults to true to plot data averaged per second. Set to False to plot per frame.
-        framerate defaults to 30 fps. Check the framerate of your experiement and change accordingly.
-        The fly argument defaults to all, but this can be changed to a fly id as an integer, a list of fly ids as integers, or the name of a fly chamber as a string.
-        plottitle and filename are optional arguments. filename adds to the beginning of the filename, there is a default name for the file.
-        Optional arguments to save the plot and show the plot.
-        scorethreshold defaults to None, but change to a float to set a lower limit to the processed behavior score
-        burnin is the starting frame at which the plotting should start. If the plotting is set to seconds the method converts the frame to seconds.
+        This class holds a 2D histogram with fixed bin edges that can be updated with new positions and merged with other instances that have the same edges.
+        Because the edges never change, histograms from separate chunks, experiments, or processes add up to the histogram of all the data.
+        The counts are in `.counts` with x along the first axis and y along the second, the same as np.histogram2d.
         """
 
+        self.xedges = np.asarray(xedges, dtype=np.float64)
+        self.yedges = np.asarray(yedges, dtype=np.float64)
+        self.counts = np.zeros((len(self.xedges) - 1, len(self.yedges) - 1))
 
-        #formatting fly parameter
-        flyls = []
-        if isinstance(fly, list):
-            flyls = fly
-        else:
-            if isinstance(fly, int):
-                flyls.append(fly)
-            elif fly != "all":
-                flyls = self.chambers[fly]
-            else:
-                flyls = None
-            
 
 
-        
-        #setting burnin
-        if persecond == True:
-            bi = int(burnin / framerate)
-        else:
-            bi = burnin
+    def update(self, x, y):
+        """
+        Method adds positions to the histogram. x and y can be arrays of any shape, NaN positions are ignored.
+        """
 
-        
-        #getting unit
-        if persecond == True:
-            unit = "Seconds"
-        else:
-            unit = "Frames"
+        x = np.asarray(x).ravel()
+        y = np.asarray(y).ravel()
+        keep = np.isfinite(x) & np.isfinite(y)
 
+        self.counts += np.histogram2d(x[keep], y[keep], bins=(self.xedges, self.yedges))[0]
 
-        if self.dtype == 'perframe':
-            plt.figure(figsize=(15,5))
+        return self
 
-            if fly == 'all':
-                #plotting x and y coordinates as a line plot
-                for idx, i in enumerate(self.mat_dict['data']):
-                    if persecond == True:
-                        modi = np.append(i, [0 for j in range((framerate - (len(i) % framerate)))])
-                        ls = np.average(modi.reshape(-1, framerate), axis=1)
-                    else:
-                        ls = i
-                    plt.plot(ls, label=idx+1)
 
-                #formating and showing the plot
-                handles, labels = plt.gca().get_legend_handles_labels()
-                by_label = dict(zip(labels, handles))
-                plt.legend(by_label.values(), by_label.keys(), loc='center left', bbox_to_anchor=(1, 0.5))
 
-            elif len(flyls) == 1:
-                for i in flyls:
-                    if persecond == True:
-                        modls = np.append(self.mat_dict['data'][int(i)-1], [0 for j in range((framerate - (len(self.mat_dict['data'][int(i)-1]) % framerate)))])
-                        ls = np.average(modls.reshape(-1, framerate), axis=1)
-                    else:
-                        ls = self.mat_dict['data'][int(i)-1]
-                    plt.plot(ls)
+    def merge(self, other):
+        """
+        Method adds the counts of another `histogram_accumulator` with the same bin edges.
+        """
 
-            else:
-                for i in flyls:
-                    if persecond == True:
-                        modls = np.append(self.mat_dict['data'][int(i)-1], [0 for j in range((framerate - (len(self.mat_dict['data'][int(i)-1]) % framerate)))])
-                        ls = np.average(modls.reshape(-1, framerate), axis=1)
-                    else:
-                        ls = self.mat_dict['data'][int(i)-1]
-                    plt.plot(ls, label=i)
+        if not (np.array_equal(self.xedges, other.xedges) and np.array_equal(self.yedges, other.yedges)):
+            raise ValueError("Histograms with different bin edges cannot be merged.")
 
-                #formating and showing the plot
-                handles, labels = plt.gca().get_legend_handles_labels()
-                by_label = dict(zip(labels, handles))
-                plt.legend(by_label.values(), by_label.keys(), loc='center left', bbox_to_anchor=(1, 0.5))
+        self.counts += other.counts
 
-            plt.xlim(left=bi, right=len(ls))
-            plt.xlabel(unit)
-            plt.ylabel(self.param_name)
-            plt.title(plottitle)
+        return self
 
-            if saveplot:
-                plt.savefig('{name}{default}_perframe_plot.png'.format(name=filename, default=self.param_name))
-            
-            if showplot:
-                plt.show()
 
-        
 
+    def normalized(self):
+        """
+        Method returns the histogram normalized to sum to 1, as plotted by `struct2df.plot_density`.
+        """
 
+        total = np.sum(self.counts)
 
-        elif self.dtype == 'scores':
-            for thing2plot in ['scores', 'postprocessed']:
-                plt.figure(figsize=(15,5))
+        if total == 0:
+            return self.counts.copy()
 
-                if fly == 'all':
-                    #plotting x and y coordinates as a line plot
-                    for idx, i in enumerate(self.mat_dict['allScores'][thing2plot]):
-                        if persecond == True:
-                            modi = np.append(i, [0 for j in range((framerate - (len(i) % framerate)))])
-                            ls = np.average(modi.reshape(-1, framerate), axis=1)
-                        else:
-                            ls = i
-                        plt.plot(ls, label=idx+1, alpha=0.5)
-                        if thing2plot == 'postprocessed':
-                            plt.fill_between([j for j in range(len(ls))], ls, alpha=0.5)
-                            if scorethreshold != None:
-                                plt.ylim(bottom=scorethreshold, top=1)
-                            else:
-                                plt.ylim(top=1)
+        return self.counts / total
 
-                    #formating and showing the plot
-                    handles, labels = plt.gca().get_legend_handles_labels()
-                    by_label = dict(zip(labels, handles))
-                    leg = plt.legend(by_label.values(), by_label.keys(), loc='center left', bbox_to_anchor=(1, 0.5))
-                    for obj in leg.get_lines():
-                        obj.set_linewidth(5)
 
-                elif len(flyls) == 1:
-                    for i in flyls:
-                        if persecond == True:
-                            modls = np.append(self.mat_dict['allScores'][thing2plot][int(i)-1], [0 for j in range((framerate - (len(self.mat_dict['allScores'][thing2plot][int(i)-1]) % framerate)))])
-                            ls = np.average(modls.reshape(-1, framerate), axis=1)
-                        else:
-                            ls = self.mat_dict['allScores'][thing2plot][int(i)-1]
-                        plt.plot(ls)
 
-                        if thing2plot == 'postprocessed':
-                            plt.fill_between([i for i in range(len(ls))], ls)
-                            if scorethreshold != None:
-                                plt.ylim(bottom=scorethreshold, top=1)
-                            else:
-                                plt.ylim(top=1)
-                                
-                        
+    def to_dict(self):
+        """
+        Method returns the edges and counts as a dictionary of lists that can be saved as json and loaded with `.from_dict`.
+        """
 
-                else:
-                    for i in flyls:
-                        if persecond == True:
-                            modls = np.append(self.mat_dict['allScores'][thing2plot][int(i)-1], [0 for j in range((framerate - (len(self.mat_dict['allScores'][thing2plot][int(i)-1]) % framerate)))])
-                            ls = np.average(modls.reshape(-1, framerate), axis=1)
-                        else:
-                            ls = self.mat_dict['allScores'][thing2plot][int(i)-1]
-                        plt.plot(ls, label=i, alpha=0.5)
-                        if thing2plot == 'postprocessed':
-                            plt.fill_between([i for i in range(len(ls))], ls, alpha=0.5)
-                            if scorethreshold != None:
-                                plt.ylim(bottom=scorethreshold, top=1)
-                            else:
-                                plt.ylim(top=1)
+        return {'type': 'histogram_accumulator', 'xedges': self.xedges.tolist(), 'yedges': self.yedges.tolist(), 'counts': self.counts.tolist()}
 
-                    #formating and showing the plot
-                    handles, labels = plt.gca().get_legend_handles_labels()
-                    by_label = dict(zip(labels, handles))
-                    leg = plt.legend(by_label.values(), by_label.keys(), loc='center left', bbox_to_anchor=(1, 0.5))
-                    for obj in leg.get_lines():
-                        obj.set_linewidth(5)
 
-                #scores or postprocessed
-                if thing2plot == 'scores':
-                    ylabelname = ' score'
-                else:
-                    ylabelname = ' processed score'
+    @classmethod
+    def from_dict(cls, d):
+        acc = cls(d['xedges'], d['yedges'])
+        acc.counts = np.asarray(d['counts'], dtype=np.float64)
+        return acc
 
-                plt.xlim(left=bi, right=len(ls))
-                plt.xlabel(unit)
-                plt.ylabel(self.behavior_name + ylabelname)
-                plt.title(plottitle)
 
-                if saveplot:
-                    plt.savefig('{name}{default}_{flies}_{thing}_plot.png'.format(name=filename, default=self.param_name, flies=str(fly), thing=thing2plot))
-                
-                if showplot:
-                    plt.show()
 
 
 
 
+#class for bit-packed behavior masks
+class behavior_masks():
 
-#class for organizing a fly experiment using struct2df instances
-class fly_experiment():
+    def __init__(self, bits, nframes, ids):
+        """
+        This class holds a binary fly x frame behavior mask with one bit per frame (np.packbits), 64 times less memory than a float64 dataframe.
+        `bits` is a 2D uint8 array with one row per fly, `nframes` is the number of frames and `ids` is the list of fly ids of the rows.
+        Masks of the same shape can be combined with & (and), | (or), ^ (xor) and ~ (not) without unpacking, and counted with `.count` and `.budget`.
+        Use `behavior_masks.from_frame` to make one from a frame x fly dataframe of processed scores, or `fly_experiment.behavior_mask`.
+        """
 
-    def __init__(self, structdfls):
+        self.bits = bits
+        self.nframes = nframes
+        self.ids = list(ids)
+
+
+
+    @classmethod
+    def from_frame(cls, df, threshold=0.5, ids=None):
         """
-        Note that this class cannot be imported without also importing struct2df.
-        This class takes in a list of instances of struct2df from the same fly experiment.
-        The instantiation of the class needs the trx.mat file and any other .mat file you want to include.
-        This class will load data into multiple lists and dictionaries which can be referenced and are referenced by methods.
-        The ethogram method needs processed behavior score mat files.
-        The network method needs the dcenter parameter and an optional behavior processed score file.
+        Method makes a `behavior_masks` from a frame x fly dataframe (e.g. `struct2df.processed_scores`), a frame is set if its score is >= threshold.
+        ids is an optional list of the fly ids of the columns (e.g. `struct2df.column_ids`), by default the integer column labels are used.
         """
 
-        #objects that can be referenced
-        self.trx_ls = []
-        self.trxs = {}
-        self.chambers = None
-        self.perframes = {} #also includes any extracted parameters from trx
-        self.jaaba_scores = {}
-        self.jaaba_processed = {}
-        self.sex = {}
+        with np.errstate(invalid='ignore'):
+            mask = df.to_numpy().T >= threshold
+
+        return cls.from_mask(mask, [int(i) for i in (df.columns if ids is None else ids)])
+
+
+    @classmethod
+    def from_mask(cls, mask, ids):
+        """
+        Method makes a `behavior_masks` from a boolean fly x frame array.
+        """
+
+        mask = np.asarray(mask, dtype=bool)
+
+        #rows are padded to a whole number of 64 bit words so they can be counted with 64 bit popcounts
+        nbytes = -(-mask.shape[1] // 64) * 8
+        bits = np.zeros((mask.shape[0], nbytes), dtype=np.uint8)
+        packed = np.packbits(mask, axis=1)
+        bits[:, :packed.shape[1]] = packed
+
+        return cls(bits, mask.shape[1], ids)
+
+
+
+    def _check(self, other):
+        if self.bits.shape != other.bits.shape or self.ids != other.ids:
+            raise ValueError("Behavior masks must have the same flies and number of frames to be combined.")
+
+
+    def __and__(self, other):
+        self._check(other)
+        return behavior_masks(self.bits & other.bits, self.nframes, self.ids)
+
+
+    def __or__(self, other):
+        self._check(other)
+        return behavior_masks(self.bits | other.bits, self.nframes, self.ids)
+
+
+    def __xor__(self, other):
+        self._check(other)
+        return behavior_masks(self.bits ^ other.bits, self.nframes, self.ids)
+
+
+    def __invert__(self):
+        #the padding bits past the last frame must stay unset
+        return behavior_masks(~self.bits & self._valid_bits()[None, :], self.nframes, self.ids)
+
+
+    def _valid_bits(self):
+        """
+        Private method that returns one row of bits that are set for every real frame and unset for the padding.
+        """
+
+        valid = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        packed = np.packbits(np.ones(self.nframes, dtype=bool))
+        valid[:len(packed)] = packed
+
+        return valid
+
+
+
+    def count(self):
+        """
+        Method returns an array of the number of set frames of each fly.
+        """
+
+        return _popcount_rows(self.bits)
+
+
+    def budget(self):
+        """
+        Method returns an array of the fraction of frames that are set for each fly (the time budget of the behavior).
+        """
+
+        return self.count() / self.nframes
+
+
+    def cooccurrence(self, other):
+        """
+        Method returns an array of the number of frames where both masks are set for each fly, e.g. frames of chasing while extending a wing.
+        """
+
+        self._check(other)
+
+        return _popcount_rows(self.bits & other.bits)
+
+
+
+    def unpack(self):
+        """
+        Method returns the mask as a boolean fly x frame array.
+        """
+
+        return np.unpackbits(self.bits, axis=1, count=self.nframes).astype(bool)
+
+
+    def fly(self, fly_id):
+        """
+        Method returns the boolean mask of one fly.
+        """
+
+        return np.unpackbits(self.bits[self.ids.index(fly_id)], count=self.nframes).astype(bool)
+
+
+    def to_frame(self):
+        """
+        Method returns the mask as a frame x fly dataframe of 0.0 and 1.0 with the fly ids as columns, the same layout as `struct2df.processed_scores`.
+        """
+
+        return pd.DataFrame(self.unpack().T.astype(np.float32), columns=self.ids)
+
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used by the packed bits.
+        """
+
+        return self.bits.nbytes
+
+
+
+
+
+
+#class for streaming mean and variance
+class running_moments():
+
+    def __init__(self):
+        """
+        This class keeps an exact running count, mean, variance, minimum and maximum of a feature without keeping the data.
+        It can be updated chunk by chunk with `.update` and instances from other chunks, experiments, or processes can be combined with `.merge`.
+        The mean and M2 are combined with the parallel form of Welford's algorithm so the result is the same as computing it on all the data at once.
+        Use `save_accumulator` and `load_accumulator` to cache it as a small json file.
+        """
+
+        self.n = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+
+
+    def update(self, values):
+        """
+        Method adds values to the accumulator. values can be an array or dataframe of any shape, NaN values are ignored.
+        """
+
+        values = np.asarray(values, dtype=np.float64).reshape(1, -1)
+        n, mean, m2 = _block_moments(values)
+        self.n, self.mean, self.m2 = [float(i[0]) for i in _merge_moments(np.array([self.n]), np.array([self.mean]), np.array([self.m2]), n, mean, m2)]
+
+        if n[0] > 0:
+            self.min = min(self.min, float(np.nanmin(values)))
+            self.max = max(self.max, float(np.nanmax(values)))
+
+        return self
+
+
+
+    def merge(self, other):
+        """
+        Method combines another `running_moments` instance into this one.
+        """
+
+        self.n, self.mean, self.m2 = [float(i[0]) for i in _merge_moments(np.array([self.n]), np.array([self.mean]), np.array([self.m2]),
+                                                                          np.array([other.n]), np.array([other.mean]), np.array([other.m2]))]
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+        return self
+
+
+
+    def var(self, ddof=1):
+        """
+        Method returns the variance, the sample variance by default. Set ddof=0 for the population variance.
+        """
+
+        if self.n - ddof <= 0:
+            return np.nan
+
+        return self.m2 / (self.n - ddof)
+
+
+    def sd(self, ddof=1):
+        """
+        Method returns the standard deviation, see `.var`.
+        """
+
+        return np.sqrt(self.var(ddof))
+
+
+
+    def to_dict(self):
+        """
+        Method returns the state as a dictionary that can be saved as json and loaded with `.from_dict`.
+        """
+
+        return {'type': 'running_moments', 'n': self.n, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max}
+
+
+    @classmethod
+    def from_dict(cls, d):
+        acc = cls()
+        acc.n, acc.mean, acc.m2, acc.min, acc.max = d['n'], d['mean'], d['m2'], d['min'], d['max']
+        return acc
 
-        #loading data into objects
-        for i in structdfls:
 
-            if i.dtype == 'trx':
-                self.trx_ls = i.trx_ls
-                self.chambers = i.chambers
 
-                for idx, j in enumerate(i.trx_ls):
-                    self.trxs.update({idx+1: j})
-                    self.sex.update({idx+1: j['sex'].to_list()[0]})
 
-                if i.param_df.empty:
-                    continue
-                else:
-                    self.perframes.update({'trx_' + i.param_name: i.param_df})
-                
 
-            elif i.dtype == 'perframe':
-                self.perframes.update({i.param_name: i.param_df})
 
+#class for streaming approximate quantiles
+class quantile_sketch():
 
-            else:
-                self.jaaba_scores.update({i.behavior_name: i.scores})
-                self.jaaba_processed.update({i.behavior_name: i.processed_scores})
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        """
+        This class keeps an approximate distribution of a feature that can be updated chunk by chunk and merged across experiments and processes.
+        Values are counted in logarithmic buckets (the DDSketch method) so every quantile is within `relative_accuracy` of the true value (1% by default),
+        whatever the number of values. Values with a magnitude below `min_value` are counted as zero.
+        Only the non-empty buckets are stored, typically a few hundred integers per feature, and two sketches with the same settings merge by adding counts.
+        Use `save_accumulator` and `load_accumulator` to cache it as a small json file.
+        """
 
-        #another object that can be referenced (list of fly ids)
-        self.flies = list(self.trxs.keys())
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.n = 0
 
-    
 
-    #methods
-    def stack_timeseries(self, params="all", behavior_scores="all", behavior_processed="all", persecond=False, framerate=30, savefile=False, name=''):
+
+    def _add(self, store, keys):
         """
-        The default behavior of this method is to put every perframe feature including behavior scores into one dataframe that is returned.
-        The params, behavior_scores, and behavior_processed arguments can be set to the name of one or a few (str or list) features instead of all features.
-        These can also be set to None if no parameters from that category are desired.
-        If the savefile argument is False by default. If it is set to True a csv file will be saved.
-        There is an optional name argument that will add to the begining of the filename and can be used to save file to different path.
+        Private method that adds the counts of an array of bucket keys to a store.
         """
 
-        #getting lists of features to extract
-        paramls = []
-        scoresls = []
-        processedls = []
+        keys, counts = np.unique(keys, return_counts=True)
+        for k, c in zip(keys.tolist(), counts.tolist()):
+            store[k] = store.get(k, 0) + c
 
-        if not isinstance(params, list) and params != 'all' and params != None:
-            paramls.append(params)
-        elif params == 'all':
-            paramls = list(self.perframes.keys())
-        elif params == None:
-            paramls.append("")
-        else:
-            paramls = params
 
-        
-        if not isinstance(behavior_scores, list) and behavior_scores != 'all' and behavior_scores != None:
-            scoresls.append(behavior_scores)
-        elif behavior_scores == 'all':
-            scoresls = list(self.jaaba_scores.keys())
-        elif behavior_scores == None:
-            scoresls.append("")
-        else:
-            scoresls = behavior_scores
 
+    def update(self, values):
+        """
+        Method adds values to the sketch. values can be an array or dataframe of any shape, NaN values are ignored.
+        """
 
-        if not isinstance(behavior_processed, list) and behavior_processed != 'all' and behavior_processed != None:
-            processedls.append(behavior_processed)
-        elif behavior_processed == 'all':
-            processedls = list(self.jaaba_processed.keys())
-        elif behavior_processed == None:
-            processedls.append("")
-        else:
-            processedls = behavior_processed
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
 
-        
-        #stacking data
-        stackdf = pd.DataFrame()
+        small = np.abs(values) < self.min_value
+        self.zero += int(small.sum())
 
-        if params != None:
-            for i in paramls:
-                df = self.perframes[i]
+        #bucket k holds values in (gamma^(k-1), gamma^k]
+        logg = np.log(self.gamma)
+        pos = values[(values > 0) & ~small]
+        neg = values[(values < 0) & ~small]
+        self._add(self.positive, np.ceil(np.log(pos) / logg).astype(np.int64))
+        self._add(self.negative, np.ceil(np.log(-neg) / logg).astype(np.int64))
 
-                if 'trx' not in i:
-                    df = df.add_prefix(i + '_')
+        self.n += len(values)
 
-                if stackdf.empty:
-                    stackdf = df
-                else:
-                    stackdf = pd.merge(stackdf, df, left_index=True, right_index=True)
+        return self
 
-        if behavior_scores != None:
-            for i in scoresls:
-                df = self.jaaba_scores[i]
-                df = df.add_prefix(i + '_score_')
 
-                if stackdf.empty:
-                    stackdf = df
-                else:
-                    stackdf = pd.merge(stackdf, df, left_index=True, right_index=True)
 
-        if behavior_processed != None:
-            for i in processedls:
-                df = self.jaaba_processed[i]
-                df = df.add_prefix(i + '_processed_')
+    def merge(self, other):
+        """
+        Method combines another `quantile_sketch` with the same relative_accuracy into this one.
+        """
 
-                if stackdf.empty:
-                    stackdf = df
-                else:
-                    stackdf = pd.merge(stackdf, df, left_index=True, right_index=True)
+        if self.gamma != other.gamma:
+            raise ValueError("Sketches with different relative accuracy cannot be merged.")
 
-        #per frame or per second
-        if persecond == True:
-            stackdf = stackdf.groupby(np.arange(len(stackdf))//framerate).mean()
+        for store, other_store in [(self.positive, other.positive), (self.negative, other.negative)]:
+            for k, c in other_store.items():
+                store[k] = store.get(k, 0) + c
+        self.zero += other.zero
+        self.n += other.n
 
-        #saving df
-        if savefile == True:
-            superlist = paramls + scoresls + processedls
-            stackdf.to_csv('{nme}_'.format(nme=name) + '_'.join(superlist) + '.csv', index=False)
-        
-        return stackdf
+        return self
 
-        
 
-    def ethogram(self, burnin=0, scorethreshold=None, fly="all", framerate=30, plottitle="", showplot=False, saveplot=True, filename=""):
+
+    def quantile(self, q):
         """
-        Method to plot a pseudo-ethogram of all loaded behaviors for all flies, subset of flies, or single fly.
-        The burnin can be set to the SECOND to start the plot at. Note that this is different from the struct2df method which takes the frame to start at.
-        The average behavior score threshold can also be set, but defaults to zero.
-        The flies defaults to a plot of all flies but can be set to a subset of flies which is input as a list of fly ids as integers or a single fly id as an integer.
-        'm' or 'f' can also be passed to select just male or female flies.
-        You may also pass in the name of a chamber as a string if you wish to plot all flies in one chmaber and if the trx `struct2df` instance contains a separate_chambers dictionary.
+        Method returns the approximate quantile(s) q, a float or a list of floats between 0 and 1. Returns NaN if the sketch is empty.
         """
 
-        #selecting flies
-        flyls = []
-
-        if fly == 'all':
-            for idx in range(len(self.trx_ls)):
-                flyls.append(idx+1)
-            opacity = 0.5
+        if self.n == 0:
+            return np.nan if np.isscalar(q) else [np.nan for i in q]
 
-        elif isinstance(fly, list):
-            flyls = fly
-            opacity = 0.5
+        #buckets in increasing order of value: negative buckets from the largest magnitude, zero, then positive buckets
+        negkeys = sorted(self.negative.keys(), reverse=True)
+        poskeys = sorted(self.positive.keys())
+        keys = np.array(negkeys + [0] + poskeys, dtype=np.float64)
+        counts = np.array([self.negative[k] for k in negkeys] + [self.zero] + [self.positive[k] for k in poskeys])
+        estimate = 2 * self.gamma ** keys / (self.gamma + 1)
+        estimate[:len(negkeys)] *= -1
+        estimate[len(negkeys)] = 0
 
-        elif fly == 'm':
-            for i in self.sex.keys():
-                if self.sex[i] == 'm':
-                    flyls.append(i)
-            flyls.sort()
-            opacity = 0.5
+        ranks = np.atleast_1d(np.asarray(q, dtype=np.float64)) * (self.n - 1)
+        idx = np.searchsorted(np.cumsum(counts), ranks, side='right')
+        out = estimate[np.minimum(idx, len(estimate) - 1)]
 
-        elif fly == 'f':
-            for i in self.sex.keys():
-                if self.sex[i] == 'f':
-                    flyls.append(i)
-            flyls.sort()
-            opacity = 0.5
+        return float(out[0]) if np.isscalar(q) else out.tolist()
 
-        elif self.chambers != None and fly in list(self.chambers.keys()):
-            flyls = list(self.chambers[fly])
-            opacity = 0.5
 
-        else:
-            flyls.append(fly)
-            opacity = 1
 
+    def to_dict(self):
+        """
+        Method returns the state as a dictionary that can be saved as json and loaded with `.from_dict`.
+        """
 
-        #getting behaviors
-        behaviors = list(self.jaaba_processed.keys())
+        return {'type': 'quantile_sketch', 'relative_accuracy': self.relative_accuracy, 'min_value': self.min_value, 'zero': self.zero, 'n': self.n,
+                'positive': [list(self.positive.keys()), list(self.positive.values())],
+                'negative': [list(self.negative.keys()), list(self.negative.values())]}
 
-        #ethogram can only plot with more than one behavior, thus this if, else condition
-        if len(behaviors) > 1:
 
+    @classmethod
+    def from_dict(cls, d):
+        acc = cls(d['relative_accuracy'], d['min_value'])
+        acc.positive = dict(zip(*d['positive']))
+        acc.negative = dict(zip(*d['negative']))
+        acc.zero, acc.n = d['zero'], d['n']
+        return acc
 
-            #plotting
-            fig, ax = plt.subplots(len(behaviors), 1, sharex='col', figsize=(20,7))
 
-            for i in range(len(behaviors)):
 
-                #averaging dataframe per second
-                framesdf = self.jaaba_processed[behaviors[i]]
-                persec = framesdf.groupby(np.arange(len(framesdf))//framerate).mean()
 
-                for id in flyls:
 
-                    ax[i].plot(persec[id].to_list(), label=id, alpha=opacity)
-                    ax[i].fill_between([i for i in range(len(persec[id].to_list()))], persec[id].to_list(), alpha=opacity)
-                    ax[i].set_ylabel(behaviors[i])
 
-                    if scorethreshold != None:
-                        ax[i].set_ylim(bottom=scorethreshold, top=1)
-                    else:
-                        ax[i].set_ylim(top=1)
+#class for processing long recordings in frame windows
+class chunked_experiment():
 
-            plt.xlim(left=burnin, right=len(persec[id].to_list()))
-            plt.xlabel("seconds")
-            plt.suptitle(plottitle)
+    def __init__(self, files, directory='', chunksize=108000, overlap=0, framerate=30):
+        """
+        This class streams an experiment through memory in windows of frames so that peak memory depends on `chunksize` and not on the length of the recording.
+        `files` is a list of perframe .mat files (e.g. 'perframe/x_mm.mat'), JAABA score .mat files, or fly x frame .npy files from a previous run or from a memmap `shared_experiment`.
+        The .mat files are converted once to .npy files in `directory` which are then memory-mapped. Note that mat 7.3 files are converted one fly at a time.
+        Score files give two features: '{behavior}_score' and '{behavior}_processed'.
+        `chunksize` is the number of frames per window, the default is one hour at 30 fps.
+        `overlap` is the number of frames from the previous window that are prepended to each window for windowed features (see `.chunks` and `.rolling`).
+        The per second, summary, bout, and occupancy methods all run one window at a time and combine the results.
+        """
 
-            #formating and showing the plot
-            if len(flyls) != 1:
-                handles, labels = plt.gca().get_legend_handles_labels()
-                by_label = dict(zip(labels, handles))
-                leg = plt.legend(by_label.values(), by_label.keys(), loc='lower center', bbox_to_anchor=(0.5, -0.32), ncol=len(flyls))
-                for obj in leg.get_lines():
-                    obj.set_linewidth(5)
+        #chunked_experiment objects
+        self.directory = directory
+        self.chunksize = chunksize
+        self.overlap = overlap
+        self.framerate = framerate
+        self.features = {}
+
+        #converting and registering the features
+        for file in files:
+            if file.endswith('.npy'):
+                self.features.update({(file.split('/')[-1]).replace('.npy', ''): file})
+            else:
+                self.features.update(_mat2npy(file, directory))
 
-            if showplot:
-                plt.show()
+        shapes = [self._open(i).shape for i in self.features]
+        self.nframes = max([i[1] for i in shapes])
+        self.flies = [i+1 for i in range(max([i[0] for i in shapes]))]
 
-            if saveplot:
-                plt.savefig('{name}_ethogram_{flies}.png'.format(name=filename, flies=str(fly)))
 
 
-        else:
-            print("\nWARNING: Only one behavior is present in this instance of `fly_experiment`. `.ethogram` cannot plot with only one behavior.\nPlease use the `.plot_timeseries` method on the `struct2df` instance instead.\n")
+    def _open(self, feature):
+        """
+        Private method that memory-maps the fly x frame array of a feature.
+        """
 
+        return np.load(self.features[feature], mmap_mode='r')
 
 
 
+    def chunks(self, features='all', chunksize=None, overlap=None):
+        """
+        Generator method that yields the experiment one window at a time.
+        `features` defaults to all features but can be set to the name of one or a few (str or list) features.
+        `chunksize` and `overlap` default to the values given when the class was instantiated.
+        Each window is a dictionary with 'start' and 'stop' (the frames of the window), 'lead' (the number of overlap frames before 'start'),
+        and 'data', a dictionary of fly x frame arrays covering frames start-lead to stop. Features shorter than the window are padded with NaN.
+        """
 
-    def network(self, dist_threshold=float('inf'), behavior=None, behavior_threshold=0.5, burnin=0, framerate=30, chamber="all", plottitle="", showplot=False, saveplot=True, filename=""):
-            """
-            can now pass the chamber name as a string to `chamber`
-            """
+        if chunksize == None:
+            chunksize = self.chunksize
+        if overlap == None:
+            overlap = self.overlap
 
-            #function for sorted() function key
-            def sort_key(lsitem):
+        if features == 'all':
+            features = list(self.features.keys())
+        elif isinstance(features, str):
+            features = [features]
 
-                number = re.findall(r'\d+', lsitem)[0]
+        arrays = {i: self._open(i) for i in features}
 
-                return int(number)
+        for start in range(0, self.nframes, chunksize):
+            stop = min(start + chunksize, self.nframes)
+            lead = min(overlap, start)
 
+            data = {}
+            for name, arr in arrays.items():
+                dtype = arr.dtype if np.issubdtype(arr.dtype, np.floating) else np.float64
+                block = np.full((arr.shape[0], stop - start + lead), np.nan, dtype=dtype)
+                part = arr[:, start - lead:stop]
+                block[:, :part.shape[1]] = part
+                data[name] = block
 
-            #warning message
-            if dist_threshold == float('inf') and behavior == None:
-                print("WARNING: it is not recommended to create a proximity network without a distance threshold set.")
+            yield {'start': start, 'stop': stop, 'lead': lead, 'data': data}
 
-            #getting pairs
-            colnames = list(self.perframes['dcenter'].columns)
 
-            #condition for removing unwanted chambers
-            if chamber == "all":
-                colnames = ['dcenter_' + str(i) for i in colnames]
-            else:
-                colnames = ['dcenter_' + str(i) for i in self.chambers[chamber]]
 
+    def persecond(self, feature, framerate=None, savefile=False, name=''):
+        """
+        Method returns a dataframe of a feature averaged per second for each fly, the same as the persecond output of `struct2df`.
+        The window size is rounded down to a whole number of seconds so that no second is split between windows.
+        If the savefile argument is True a csv file will be saved. There is an optional name argument that will add to the begining of the filename.
+        """
 
+        if framerate == None:
+            framerate = self.framerate
 
-            pairs = list(itertools.combinations(colnames, 2))
-            connections = {}
-            for i in pairs:
-                connections.update({i:0})
+        chunksize = max(framerate, (self.chunksize // framerate) * framerate)
 
-            
-            #stacking timeseries of dcenter and behavior
-            if behavior == None:
-                stack = self.perframes['dcenter']
-                stack = stack.add_prefix('dcenter_')
+        seconds = []
+        for chunk in self.chunks(feature, chunksize=chunksize, overlap=0):
+            block = chunk['data'][feature]
+            nsec = -(-block.shape[1] // framerate)
 
-            else:
-                stack = self.stack_timeseries(params='dcenter', behavior_scores=[], behavior_processed=behavior)
+            padded = np.full((block.shape[0], nsec * framerate), np.nan)
+            padded[:, :block.shape[1]] = block
 
-            #making stack per second
-            stack = stack.groupby(np.arange(len(stack))//framerate).mean()
-            stack = stack[burnin:]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                valid = np.isfinite(padded).reshape(block.shape[0], nsec, framerate)
+                total = np.where(valid, padded.reshape(block.shape[0], nsec, framerate), 0).sum(axis=2)
+                seconds.append(total / valid.sum(axis=2))
 
+        df = pd.DataFrame(np.concatenate(seconds, axis=1).T, columns=self.flies[:block.shape[0]])
 
-            #interactions list
-            interactions_raw = []
+        if savefile == True:
+            df.to_csv('{nme}_persecond_'.format(nme=name) + feature + ".csv", index=False)
 
+        return df
 
-            #single chamber or chamber selection
-            if chamber == "all":
-                #looping through flies
-                for i in self.flies:
 
-                    #empty df
-                    df = pd.DataFrame()
 
-                    #filtering for behavior unless no behavior parameter is given
-                    if behavior != None:
-                        column_name = "{b}_processed_{f}".format(b=behavior,f=str(i))
-                        df = pd.concat([df, stack.loc[stack[column_name] >= behavior_threshold]])
-                    else:
-                        df = pd.concat([df, stack])
+    def summary(self, features='all', savefile=False, name=''):
+        """
+        Method returns a tidy dataframe with one row per feature and fly with the number of valid frames, mean, standard deviation, minimum, maximum, and fraction of NaN frames.
+        The moments of each window are merged with Welford's algorithm so the result is exact without holding the recording in memory.
+        If the savefile argument is True a csv file will be saved. There is an optional name argument that will add to the begining of the filename.
+        """
 
-                    #new interaction column
-                    df['interactions'] = df.apply(lambda row: [col for col in df.columns if col.startswith('dcenter_') and row[col] == row['dcenter_{f}'.format(f=str(i))] and row[col] <= dist_threshold], axis=1)
+        if features == 'all':
+            features = list(self.features.keys())
+        elif isinstance(features, str):
+            features = [features]
 
-                    #adding interactions to list
-                    interactions_raw += df['interactions'].to_list()
+        rows = []
+        for feature in features:
+            nflies, frames = self._open(feature).shape
+            n, mean, m2 = np.zeros(nflies), np.zeros(nflies), np.zeros(nflies)
+            low, high = np.full(nflies, np.inf), np.full(nflies, -np.inf)
 
-            else:
-                #looping through flies
-                for i in self.chambers[chamber]:
+            for chunk in self.chunks(feature, overlap=0):
+                block = chunk['data'][feature]
+                n, mean, m2 = _merge_moments(n, mean, m2, *_block_moments(block))
+                low = np.fmin(low, np.nanmin(np.where(np.isfinite(block), block, np.inf), axis=1))
+                high = np.fmax(high, np.nanmax(np.where(np.isfinite(block), block, -np.inf), axis=1))
 
-                    #empty df
-                    df = pd.DataFrame()
+            with np.errstate(invalid='ignore', divide='ignore'):
+                sd = np.sqrt(np.where(n > 1, m2 / (n - 1), np.nan))
 
-                    #filtering for behavior unless no behavior parameter is given
-                    if behavior != None:
-                        column_name = "{b}_processed_{f}".format(b=behavior,f=str(i))
-                        df = pd.concat([df, stack.loc[stack[column_name] >= behavior_threshold]])
-                    else:
-                        df = pd.concat([df, stack])
+            rows.append(pd.DataFrame({'feature': feature, 'fly': self.flies[:nflies], 'n': n.astype(int),
+                                      'mean': np.where(n > 0, mean, np.nan), 'sd': sd,
+                                      'min': np.where(n > 0, low, np.nan), 'max': np.where(n > 0, high, np.nan),
+                                      'nan_fraction': 1 - n / frames}))
 
-                    #generating new interaction column
-                    df['interactions'] = df.apply(lambda row: [col for col in df.columns if col.startswith('dcenter_') and row[col] == row['dcenter_{f}'.format(f=str(i))] and row[col] <= dist_threshold], axis=1)
+        df = pd.concat(rows, ignore_index=True)
 
-                    #adding interactions to list
-                    interactions_raw += df['interactions'].to_list()
+        if savefile == True:
+            df.to_csv('{nme}_'.format(nme=name) + '_'.join(features) + "_summary.csv", index=False)
 
+        return df
 
 
 
+    def bouts(self, feature, threshold=0.5, minlength=1, savefile=False, name=''):
+        """
+        Method returns a dataframe of bouts, runs of frames where the feature is greater than or equal to `threshold`, for every fly.
+        This is typically used with processed behavior scores, e.g. 'chase_processed'. Bouts that cross a window boundary are joined.
+        `minlength` is the minimum bout length in frames. The dataframe has the columns fly, start, stop (the frame after the bout ends), and length.
+        If the savefile argument is True a csv file will be saved. There is an optional name argument that will add to the begining of the filename.
+        """
 
+        rows, starts, stops = [], [], []
+        for chunk in self.chunks(feature, overlap=0):
+            r, b, e = _mask_bouts(chunk['data'][feature] >= threshold)
+            rows.append(r)
+            starts.append(b + chunk['start'])
+            stops.append(e + chunk['start'])
 
-            #cleaning interactions list
-            interactions = [tuple(sorted(item, key=sort_key)) for item in interactions_raw if len(item) == 2]
+        rows, starts, stops = np.concatenate(rows), np.concatenate(starts), np.concatenate(stops)
 
-            #getting weights based on frequency of interactions (pairwise)
-            for i in interactions:
-                connections[i] += 1
+        #joining bouts that end exactly where the next bout of the same fly starts (only happens at window boundaries)
+        order = np.lexsort((starts, rows))
+        rows, starts, stops = rows[order], starts[order], stops[order]
+        joined = np.zeros(len(rows), dtype=bool)
+        joined[1:] = (rows[1:] == rows[:-1]) & (starts[1:] == stops[:-1])
+        group = np.cumsum(~joined) - 1
 
+        keep = ~joined
+        last = np.zeros(keep.sum(), dtype=starts.dtype)
+        np.maximum.at(last, group, stops)
 
+        df = pd.DataFrame({'fly': np.asarray(self.flies)[rows[keep]], 'start': starts[keep], 'stop': last})
+        df['length'] = df['stop'] - df['start']
+        df = df[df['length'] >= minlength].reset_index(drop=True)
 
-            #making network df
-            nw_df = pd.DataFrame.from_dict(connections, orient='index', columns=['weight'])
-            nw_df = nw_df.reset_index().rename(columns={'index': 'tuples'})
+        if savefile == True:
+            df.to_csv('{nme}_'.format(nme=name) + feature + "_bouts.csv", index=False)
 
-            
+        return df
 
-            #nw_df = nw_df.drop(nw_df[nw_df['weight'] == 0].index)
 
-            nw_df[['node1', 'node2']] = nw_df['tuples'].apply(lambda x: pd.Series([x[0], x[1]]))
-            nw_df = nw_df.drop('tuples', axis=1)
-            nw_df = nw_df.replace(to_replace='dcenter_', value='', regex=True)
-            nw_df = nw_df.loc[:,['node1','node2','weight']]
-            
 
+    def rolling(self, feature, window, how='mean', name=None):
+        """
+        Method computes a rolling mean, sum, min, or max (set with `how`) of a feature over `window` frames and saves it as a new memory-mapped feature.
+        Each window of the recording is given window-1 frames of overlap so the result is identical to computing it on the whole recording at once.
+        The new feature is named '{feature}_rolling{window}' unless `name` is given, and can be used by the other methods.
+        """
 
-            #formatting plot
-            plt.figure(figsize=(8,8))
-            ax = plt.gca()
-            ax.set_title(plottitle)
+        if name == None:
+            name = '{f}_rolling{w}'.format(f=feature, w=str(window))
 
+        src = self._open(feature)
+        path = os.path.join(self.directory, name + '.npy')
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=src.shape)
 
-            ###making network
-            # create an empty undirected graph
-            G = nx.Graph()
+        for chunk in self.chunks(feature, overlap=window-1):
+            block = pd.DataFrame(chunk['data'][feature].T)
+            result = getattr(block.rolling(window, min_periods=1), how)().to_numpy().T
+            stop = min(chunk['stop'], src.shape[1])
+            out[:, chunk['start']:stop] = result[:, chunk['lead']:chunk['lead'] + stop - chunk['start']]
 
-            #node colors
-            colors = {}
-            for k in self.sex.keys():
-                if self.sex[k] == 'm':
-                    colors.update({k:'blue'})
-                else:
-                    colors.update({k:'red'})
+        out.flush()
+        del out
 
-            # add nodes with their respective colors, ordering nodes by fly id
-            nodes = list(set(nw_df['node1']).union(set(nw_df['node2'])))
-            nodes = [int(i) for i in nodes]
-            nodes.sort()
-            nodes = [str(i) for i in nodes]
+        self.features.update({name: path})
 
-            for node in nodes:
-                col = colors.get(node, 'gray') # use the color from the dictionary, or default to gray
-                G.add_node(node, color=col)
-            
+        return name
 
-            # add edges with their respective weights
-            for index, row in nw_df.iterrows():
-                G.add_edge(row['node1'], row['node2'], weight=row['weight'])
 
-            # draw the graph
-            pos = nx.circular_layout(G)
-            weights = [G[u][v]['weight'] for u, v in G.edges()]
 
-            try:
-                nx.draw(G, pos, width=[(w/nw_df['weight'].max())*15 for w in weights], edge_color='gray', node_color=[colors[int(node)] for node in G.nodes()])
-                nx.draw_networkx_labels(G, pos, font_size=12, font_color='white')
+    def occupancy(self, resolution=5, burnin=0, x='x_mm', y='y_mm', bounds=None):
+        """
+        Method returns a `histogram_accumulator` of the positions of all flies with square bins of size `resolution` (mm by default).
+        `burnin` is the number of frames to skip at the beginning. `bounds` can be set to (xmin, xmax, ymin, ymax) to fix the arena extent,
+        otherwise an extra pass over the positions finds it. Fixing the bounds lets the histograms of many experiments be merged.
+        """
 
-                if saveplot:
-                    plt.savefig('{name}_{d}mm_behavior_{b}_network.png'.format(name=filename, d=str(dist_threshold), b=behavior))
+        if bounds == None:
+            low = np.array([np.inf, np.inf])
+            high = np.array([-np.inf, -np.inf])
+            for chunk in self.chunks([x, y], overlap=0):
+                low = np.fmin(low, [np.nanmin(chunk['data'][x]), np.nanmin(chunk['data'][y])])
+                high = np.fmax(high, [np.nanmax(chunk['data'][x]), np.nanmax(chunk['data'][y])])
+            bounds = (low[0], high[0], low[1], high[1])
 
-                if showplot:
-                    plt.show()
+        #same number of bins as `struct2df.plot_density`
+        x_bins = max(int((bounds[1] - bounds[0]) / resolution), 1)
+        y_bins = max(int((bounds[3] - bounds[2]) / resolution), 1)
+        acc = histogram_accumulator(np.linspace(bounds[0], bounds[1], x_bins + 1), np.linspace(bounds[2], bounds[3], y_bins + 1))
 
-            except ZeroDivisionError:
-                plt.close()
-                print("Thresholds set are too strict. No interactions found with these thresholds. Could not generate network.")
+        for chunk in self.chunks([x, y], overlap=0):
+            if chunk['stop'] <= burnin:
+                continue
+            skip = max(burnin - chunk['start'], 0)
+            acc.update(chunk['data'][x][:, skip:], chunk['data'][y][:, skip:])
 
+        return acc
 
 
 
+    def distribution(self, feature, burnin=0, relative_accuracy=0.01):
+        """
+        Method streams a feature of all flies through a `running_moments` and a `quantile_sketch` and returns both.
+        `burnin` is the number of frames to skip at the beginning. The accumulators can be saved with `save_accumulator` and merged with those of other experiments.
+        """
 
+        moments = running_moments()
+        sketch = quantile_sketch(relative_accuracy)
 
+        for chunk in self.chunks(feature, overlap=0):
+            if chunk['stop'] <= burnin:
+                continue
+            block = chunk['data'][feature][:, max(burnin - chunk['start'], 0):]
+            moments.update(block)
+            sketch.update(block)
 
+        return moments, sketch
@@ -0,0 +1,85 @@
+"""
+Tests for aligning flies tracked over different periods by their trx firstframe.
+"""
+
+import os
+import sys
+
+import numpy as np
+import scipy.io as spio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fly2py as f2p
+
+
+#fly 1 is tracked from frame 1 and fly 2 from frame 51, both for 100 frames
+FIRSTFRAMES = [1, 51]
+NFRAMES = 100
+
+
+def _fly(firstframe, x, y, sex):
+    n = len(x)
+    return {'id': 1.0, 'x': x*8.0, 'y': y*8.0, 'x_mm': x, 'y_mm': y, 'theta': np.zeros(n), 'a_mm': np.full(n, 0.5), 'b_mm': np.full(n, 0.2),
+            'sex': np.array([sex]*n, dtype=object), 'firstframe': float(firstframe), 'endframe': float(firstframe + n - 1), 'nframes': float(n),
+            'dt': np.full(n-1, 1/30.), 'timestamps': (np.arange(n) + firstframe - 1)/30.}
+
+
+@pytest.fixture
+def trx_file(tmp_path):
+    #each fly's x_mm is its absolute frame number so misaligned frames are easy to spot
+    flies = []
+    for idx, first in enumerate(FIRSTFRAMES):
+        frames = np.arange(first, first + NFRAMES, dtype=float)
+        flies.append(_fly(first, frames, np.full(NFRAMES, 10.0*idx), 'm'))
+    path = str(tmp_path / 'trx.mat')
+    spio.savemat(path, {'trx': np.array(flies, dtype=object)})
+    return path
+
+
+def test_trx_array_aligned(trx_file):
+    ex = f2p.fly_experiment([f2p.struct2df(trx_file)])
+    x = ex._trx_array('x_mm')
+
+    assert x.shape == (2, 150)
+    assert np.isnan(x[1, :50]).all()
+    #column 59 is absolute frame 60 for both flies
+    assert x[0, 59] == 60 and x[1, 59] == 60
+    assert list(ex.ragged('x_mm').starts) == FIRSTFRAMES
+
+
+def test_pairwise_features_staggered(trx_file, tmp_path):
+    ex = f2p.fly_experiment([f2p.struct2df(trx_file)])
+    store = ex.pairwise_features('nose2tail', directory=str(tmp_path), name='exp')
+    nose2tail = np.asarray(store['all']['nose2tail'])
+
+    assert store['all']['ids'] == [1, 2]
+    #at frame 60 both flies are at x = 60, 10 mm apart in y, nose of fly 1 is 1 mm ahead and tail of fly 2 is 1 mm behind
+    assert nose2tail[59, 0, 1] == pytest.approx(np.hypot(2.0, 10.0), rel=1e-5)
+    #before frame 51 fly 2 is not tracked
+    assert np.isnan(nose2tail[9, 0, 1])
+
+
+@pytest.fixture
+def perframe_file(tmp_path):
+    #perframe files start every fly at its own first frame, the value is the absolute frame number
+    cells = np.empty(len(FIRSTFRAMES), dtype=object)
+    for idx, first in enumerate(FIRSTFRAMES):
+        cells[idx] = np.arange(first, first + NFRAMES - 1, dtype=float)
+    path = str(tmp_path / 'velmag.mat')
+    spio.savemat(path, {'data': cells})
+    return path
+
+
+def test_perframe_aligned(trx_file, perframe_file):
+    ex = f2p.fly_experiment([f2p.struct2df(trx_file), f2p.struct2df(perframe_file)])
+    values, ids = ex._feature_array('velmag')
+
+    assert ids == [1, 2]
+    assert values[0, 59] == 60 and values[1, 59] == 60
+    assert np.isnan(values[1, :50]).all()
+
+    #the ragged view keeps each fly at its own start
+    ragged = ex.ragged('velmag')
+    assert list(ragged.starts) == FIRSTFRAMES
+    assert ragged.dense(60, 61)[:, 0].tolist() == [60, 60]
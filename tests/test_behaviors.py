@@ -0,0 +1,42 @@
+"""
+Tests for behavior co-occurrence and transition matrices.
+"""
+
+import os
+import sys
+
+import numpy as np
+import scipy.io as spio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fly2py as f2p
+
+
+def _cells(arrays):
+    cells = np.empty(len(arrays), dtype=object)
+    for i, a in enumerate(arrays):
+        cells[i] = a
+    return cells
+
+
+def _scores(path, processed):
+    n = len(processed)
+    spio.savemat(path, {'allScores': {'scores': _cells([p - 0.5 for p in processed]), 'postprocessed': _cells(processed), 'tStart': np.ones(n), 'tEnd': np.full(n, 20)}})
+    return f2p.struct2df(path)
+
+
+def test_different_flies(tmp_path):
+    #chase was scored for flies 1 and 2, wing extension for flies 1 to 3
+    on, off = np.ones(20), np.zeros(20)
+    chase = _scores(str(tmp_path / 'scores_chase.mat'), [on, off])
+    wing = _scores(str(tmp_path / 'scores_wing_extension.mat'), [off, on, on])
+
+    ex = f2p.fly_experiment([wing, chase])
+    cooc = ex.behavior_matrices()['cooccurrence']
+
+    #rows follow the flies of the first file, fly 2 chases in no frame
+    assert cooc.loc[(2, 'chase'), 'wing_extension'] == 0
+    assert cooc.loc[(2, 'wing_extension'), 'wing_extension'] == 20
+    assert cooc.loc[(1, 'chase'), 'chase'] == 20
+    assert cooc.loc[(3, 'chase'), 'chase'] == 0
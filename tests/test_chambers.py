@@ -0,0 +1,113 @@
+"""
+Tests for chamber selection on perframe and score files, which carry no trx data, and for chamber aware track checks.
+"""
+
+import os
+import sys
+
+import numpy as np
+import scipy.io as spio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fly2py as f2p
+
+
+CHAMBERS = {'1': [1, 2, 3], '2': [4, 5, 6]}
+
+
+def _cells(arrays):
+    cells = np.empty(len(arrays), dtype=object)
+    for i, a in enumerate(arrays):
+        cells[i] = a
+    return cells
+
+
+@pytest.fixture
+def perframe_file(tmp_path):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / 'dcenter.mat')
+    spio.savemat(path, {'data': _cells([rng.random(90) for _ in range(6)])})
+    return path
+
+
+@pytest.fixture
+def scores_file(tmp_path):
+    rng = np.random.default_rng(1)
+    scores = [rng.random(90) - 0.5 for _ in range(6)]
+    path = str(tmp_path / 'scores_chase.mat')
+    spio.savemat(path, {'allScores': {'scores': _cells(scores), 'postprocessed': _cells([(s > 0).astype(float) for s in scores]), 'tStart': np.ones(6), 'tEnd': np.full(6, 90)}})
+    return path
+
+
+@pytest.mark.parametrize('filename', ['perframe_file', 'scores_file'])
+def test_chamber_index(filename, request):
+    data = f2p.struct2df(request.getfixturevalue(filename), separate_chambers=CHAMBERS)
+
+    assert data.chamber_names == ['1', '2']
+    assert list(data.chamber_index) == [0, 0, 0, 1, 1, 1]
+
+
+@pytest.mark.parametrize('filename', ['perframe_file', 'scores_file'])
+@pytest.mark.parametrize('smallmultiples', [False, True])
+def test_plot_timeseries_chamber(filename, smallmultiples, request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = f2p.struct2df(request.getfixturevalue(filename), separate_chambers=CHAMBERS)
+
+    data.plot_timeseries(fly='1', framerate=30, smallmultiples=smallmultiples, saveplot=True, showplot=False, filename='chamber1')
+
+    assert any(f.startswith('chamber1') for f in os.listdir(tmp_path))
+
+
+@pytest.mark.parametrize('fly', [99, [7, 8], []])
+def test_smallmultiples_no_flies(fly, perframe_file, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    data = f2p.struct2df(perframe_file, separate_chambers=CHAMBERS)
+
+    data.plot_timeseries(fly=fly, smallmultiples=True, filename='empty')
+
+    assert 'Incorrect fly input' in capsys.readouterr().out
+    assert not any(f.endswith('.png') for f in os.listdir(tmp_path))
+
+
+@pytest.fixture
+def trx_file(tmp_path):
+    #two flies still at opposite walls of a 10 mm chamber around x = 0 and two of a 40 mm chamber around x = 100
+    flies = []
+    for i, x in enumerate([10.0, -10.0, 60.0, 140.0]):
+        flies.append({'id': float(i+1), 'x': np.full(90, 8.0*x), 'y': np.zeros(90), 'x_mm': np.full(90, x), 'y_mm': np.zeros(90), 'theta': np.zeros(90),
+                      'a_mm': np.full(90, 0.5), 'b_mm': np.full(90, 0.2), 'sex': np.array(['m']*90, dtype=object), 'firstframe': 1.0, 'endframe': 90.0,
+                      'nframes': 90.0, 'dt': np.full(89, 1/30.)})
+    path = str(tmp_path / 'trx.mat')
+    spio.savemat(path, {'trx': np.array(flies, dtype=object)})
+    return path
+
+
+def test_wall_per_chamber(trx_file):
+    ex = f2p.fly_experiment([f2p.struct2df(trx_file, separate_chambers={'1': [1, 2], '2': [3, 4]})])
+    report = ex.track_qc(wall_seconds=1)
+
+    #with one circle around both chambers fly 1 (x = 10) and fly 3 (x = 60) would be 20 mm from the wall
+    assert list(report['wall_stuck_bouts']) == [1, 1, 1, 1]
+
+
+def test_pairwise_per_chamber(trx_file, tmp_path):
+    ex = f2p.fly_experiment([f2p.struct2df(trx_file, separate_chambers={'1': [1, 2], '2': [3, 4]})])
+    ex.pairwise_features('nose2tail', directory=str(tmp_path), name='exp')
+    store = f2p.load_pairwise(str(tmp_path / 'exp_pairwise.json'))
+
+    assert [store[c]['ids'] for c in ['1', '2']] == [[1, 2], [3, 4]]
+    #frames first, one fly x fly block per chamber
+    assert store['2']['nose2tail'].shape == (90, 2, 2)
+    assert store['2']['nose2tail'][0, 0, 1] == pytest.approx(78.0)
+
+
+@pytest.mark.parametrize('groupby', [None, 'chamber', 'sex'])
+def test_summarize_no_frames(trx_file, groupby):
+    trx = f2p.struct2df(trx_file, separate_chambers={'1': [1, 2], '2': [3, 4]})
+    trx.extract_trx_param(['x_mm'], savefile=False)
+    summary = f2p.fly_experiment([trx]).summarize(groupby=groupby, burnin=100)
+
+    #burnin is longer than the recording
+    assert len(summary) > 0 and (summary['n'] == 0).all()
+    assert summary['nan_fraction'].isna().all()
@@ -0,0 +1,53 @@
+"""
+Tests for selecting the columns of flies and parameters through the fly id lookup tables.
+"""
+
+import os
+import sys
+
+import numpy as np
+import scipy.io as spio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fly2py as f2p
+
+
+NFLIES = 4
+NFRAMES = 50
+
+
+@pytest.fixture
+def trx_file(tmp_path):
+    #fly i sits still at x_mm = i and y_mm = 10*i
+    flies = []
+    for i in range(1, NFLIES+1):
+        flies.append({'id': float(i), 'x': np.full(NFRAMES, 8.0*i), 'y': np.full(NFRAMES, 80.0*i), 'x_mm': np.full(NFRAMES, float(i)),
+                      'y_mm': np.full(NFRAMES, 10.0*i), 'theta': np.zeros(NFRAMES), 'a_mm': np.full(NFRAMES, 0.5), 'b_mm': np.full(NFRAMES, 0.2),
+                      'sex': np.array(['m']*NFRAMES, dtype=object), 'firstframe': 1.0, 'endframe': float(NFRAMES), 'nframes': float(NFRAMES),
+                      'dt': np.full(NFRAMES-1, 1/30.)})
+    path = str(tmp_path / 'trx.mat')
+    spio.savemat(path, {'trx': np.array(flies, dtype=object)})
+    return path
+
+
+def test_lookup_tables(trx_file):
+    trx = f2p.struct2df(trx_file)
+    trx.extract_trx_param(['x_mm', 'y_mm'], savefile=False)
+
+    assert list(trx.column_ids) == [1, 2, 3, 4]*2
+    assert list(trx.column_params) == ['x_mm']*4 + ['y_mm']*4
+    #columns are ordered like the requested flies
+    assert list(trx._columns('y_mm', [3, 1])) == [6, 4]
+
+
+def test_selection_ignores_column_names(trx_file):
+    trx = f2p.struct2df(trx_file, separate_chambers={'A': [1, 2], 'B': [3, 4]})
+    trx.extract_trx_param(['x_mm', 'y_mm'], savefile=False)
+    trx.param_df.columns = ['c{}'.format(i) for i in range(trx.param_df.shape[1])]
+
+    ex = f2p.fly_experiment([trx])
+    table = ex.table(params='trx_x_mm_y_mm', behavior_scores=None, behavior_processed=None)
+
+    assert table.features == ['trx_x_mm', 'trx_y_mm']
+    assert np.asarray(table.feature('trx_y_mm'))[:, 0].tolist() == [10.0, 20.0, 30.0, 40.0]
@@ -0,0 +1,39 @@
+"""
+Tests for filling short NaN gaps of the trx tracks.
+"""
+
+import os
+import sys
+
+import numpy as np
+import scipy.io as spio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fly2py as f2p
+
+
+@pytest.fixture
+def trx_file(tmp_path):
+    #fly 2 loses frames 10 to 12
+    flies = []
+    for i in range(2):
+        x = np.arange(30, dtype=float)
+        if i == 1:
+            x[10:13] = np.nan
+        flies.append({'id': float(i+1), 'x': x*8.0, 'y': np.zeros(30), 'x_mm': x, 'y_mm': np.full(30, 5.0*i), 'theta': np.zeros(30), 'a_mm': np.full(30, 0.5),
+                      'b_mm': np.full(30, 0.2), 'sex': np.array(['f']*30, dtype=object), 'firstframe': 1.0, 'endframe': 30.0, 'nframes': 30.0, 'dt': np.full(29, 1/30.)})
+    path = str(tmp_path / 'trx.mat')
+    spio.savemat(path, {'trx': np.array(flies, dtype=object)})
+    return path
+
+
+def test_apply_updates_trx_ls(trx_file):
+    trx = f2p.struct2df(trx_file)
+    ex = f2p.fly_experiment([trx])
+    ex.clean_gaps(features='x_mm')
+
+    assert ex.trx_ls[1]['x_mm'].tolist() == list(range(30))
+    assert ex.trx_ls[1] is ex.trxs[2]
+    #the struct2df instance keeps the raw data
+    assert trx.trx_ls[1]['x_mm'].isna().sum() == 3
@@ -0,0 +1,35 @@
+"""
+Tests for the directed interaction network built from the closest fly identity.
+"""
+
+import os
+import sys
+
+import numpy as np
+import scipy.io as spio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fly2py as f2p
+
+
+def _cells(arrays):
+    cells = np.empty(len(arrays), dtype=object)
+    for i, a in enumerate(arrays):
+        cells[i] = a
+    return cells
+
+
+@pytest.mark.parametrize('unit', ['frames', 'bouts'])
+def test_no_partners(tmp_path, unit):
+    #one fly per chamber, so the closest fly is never defined
+    partner = str(tmp_path / 'closestfly_center.mat')
+    spio.savemat(partner, {'data': _cells([np.full(90, np.nan) for _ in range(3)])})
+    scores = str(tmp_path / 'scores_chase.mat')
+    spio.savemat(scores, {'allScores': {'scores': _cells([np.ones(90)]*3), 'postprocessed': _cells([np.ones(90)]*3), 'tStart': np.ones(3), 'tEnd': np.full(3, 90)}})
+
+    ex = f2p.fly_experiment([f2p.struct2df(partner), f2p.struct2df(scores)])
+    networks = ex.directed_network(unit=unit, plot=False)
+
+    assert list(networks['chase'].index) == [1, 2, 3]
+    assert networks['chase'].to_numpy().sum() == 0
@@ -0,0 +1,66 @@
+"""
+Tests for the occupancy tensor cache and the occupancy animation exports.
+"""
+
+import os
+import sys
+import json
+
+import numpy as np
+import scipy.io as spio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fly2py as f2p
+
+
+NFRAMES = 60
+
+
+@pytest.fixture
+def trx_file(tmp_path):
+    #flies 1 and 2 sit in a chamber around x = 10 mm and flies 3 and 4 in one around x = 100 mm
+    flies = []
+    for i, (x, y) in enumerate([(8.0, 10.0), (12.0, 10.0), (98.0, 10.0), (102.0, 10.0)]):
+        flies.append({'id': float(i+1), 'x': np.full(NFRAMES, 8.0*x), 'y': np.full(NFRAMES, 8.0*y), 'x_mm': np.full(NFRAMES, x), 'y_mm': np.full(NFRAMES, y),
+                      'theta': np.zeros(NFRAMES), 'a_mm': np.full(NFRAMES, 0.5), 'b_mm': np.full(NFRAMES, 0.2), 'sex': np.array(['m']*NFRAMES, dtype=object),
+                      'firstframe': 1.0, 'endframe': float(NFRAMES), 'nframes': float(NFRAMES), 'dt': np.full(NFRAMES-1, 1/30.)})
+    path = str(tmp_path / 'trx.mat')
+    spio.savemat(path, {'trx': np.array(flies, dtype=object)})
+    return path
+
+
+def test_cache_follows_chambers(trx_file):
+    ex = f2p.fly_experiment([f2p.struct2df(trx_file, separate_chambers={'1': [1, 2, 3, 4]})])
+    before = ex.occupancy_tensor(window=NFRAMES, resolution=1, bounds=(0, 110, 0, 20), fly='1', normalize=False)[0]
+    assert before.sum() == 4*NFRAMES
+
+    #chamber '1' now only holds flies 1 and 2
+    ex.detect_chambers(nchambers=2)
+    after = ex.occupancy_tensor(window=NFRAMES, resolution=1, bounds=(0, 110, 0, 20), fly='1', normalize=False)[0]
+    assert after.sum() == 2*NFRAMES
+
+
+def test_cached_arrays_read_only(trx_file):
+    ex = f2p.fly_experiment([f2p.struct2df(trx_file)])
+    tensor = ex.occupancy_tensor(window=20)[0]
+
+    with pytest.raises(ValueError):
+        tensor[0] = 0
+    assert ex.occupancy_tensor(window=20)[0].sum() == pytest.approx(3.0)
+
+
+def test_frames_recorded(trx_file, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manifest = str(tmp_path / 'manifest.json')
+    f2p.set_render_cache(manifest)
+    try:
+        ex = f2p.fly_experiment([f2p.struct2df(trx_file)])
+        files = ex.animate_occupancy(window=20, export='frames', filename='occ')
+    finally:
+        f2p.set_render_cache(None)
+
+    with open(manifest) as f:
+        entries = json.load(f)
+    assert [e['files'] for e in entries.values()] == [files]
+    assert len(files) == 3
@@ -0,0 +1,76 @@
+"""
+Tests for the render cache manifest when plots are rendered by many processes, and for headless figures.
+"""
+
+import os
+import sys
+import json
+
+import numpy as np
+import scipy.io as spio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fly2py as f2p
+
+
+@pytest.fixture
+def perframe_file(tmp_path):
+    rng = np.random.default_rng(0)
+    cells = np.empty(16, dtype=object)
+    for i in range(16):
+        cells[i] = rng.random(300)
+    path = str(tmp_path / 'velmag.mat')
+    spio.savemat(path, {'data': cells})
+    return path
+
+
+@pytest.fixture
+def manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / 'manifest.json')
+    f2p.set_render_cache(path)
+    yield path
+    f2p.set_render_cache(None)
+
+
+def test_render_batch_manifest(perframe_file, manifest):
+    jobs = [{'files': perframe_file, 'method': 'plot_timeseries', 'kwargs': {'fly': i, 'filename': 'fly{}'.format(i)}} for i in range(1, 17)]
+
+    results = f2p.render_batch(jobs, processes=8, group=False)
+
+    assert [r['error'] for r in results] == [None]*16
+    with open(manifest) as f:
+        entries = json.load(f)
+    assert len(entries) == 16
+    assert not os.path.exists(manifest + '.lock')
+
+    #a second run finds every figure in the manifest
+    results = f2p.render_batch(jobs, processes=8, group=False)
+    assert all(r['files'] == [] for r in results)
+
+
+def test_render_batch_spawn(perframe_file, manifest, monkeypatch):
+    #spawned workers do not inherit the render cache setting of this process
+    jobs = [{'files': perframe_file, 'method': 'plot_timeseries', 'kwargs': {'fly': i, 'filename': 'fly{}'.format(i)}} for i in range(1, 5)]
+    f2p.render_batch(jobs, processes=1)
+
+    monkeypatch.setattr(f2p.mp, 'Pool', f2p.mp.get_context('spawn').Pool)
+    results = f2p.render_batch(jobs, processes=2, group=False)
+
+    assert all(r['error'] == None and r['files'] == [] for r in results)
+
+
+def test_saved_figures_skip_pyplot(perframe_file, tmp_path, monkeypatch):
+    #figures that are only saved are drawn on their own Agg canvas, never through the pyplot state machine
+    monkeypatch.chdir(tmp_path)
+    def _pyplot(*args, **kwargs):
+        raise AssertionError('pyplot figure made')
+    monkeypatch.setattr(f2p.plt, 'figure', _pyplot)
+    monkeypatch.setattr(f2p.plt, 'subplots', _pyplot)
+
+    sdf = f2p.struct2df(perframe_file)
+    sdf.plot_timeseries(fly=[1, 2], filename='lines')
+    sdf.plot_timeseries(smallmultiples=True, filename='panels')
+
+    assert os.path.exists('linesvelmag_perframe_plot.png') and os.path.exists('panelsvelmag_perframe_smallmultiples.png')